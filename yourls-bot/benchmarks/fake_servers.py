@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains local fake servers for the Telegram Bot API and the YOURLS API."""
+import json
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from threading import Lock, Thread
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Type, Union
+from urllib.parse import parse_qsl, urlsplit
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+""":obj:`str`: Format of the dates in the responses of the YOURLS API."""
+
+Response = Tuple[int, Dict[str, Any]]
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The bot opens many connections at once, e.g. one per worker thread
+    request_queue_size = 128
+
+
+class FakeServer(ABC):
+    """
+    Base class for the fake servers. Serves JSON responses from a background thread on a free
+    port of ``127.0.0.1`` and counts the requests per API method.
+
+    Args:
+        latency: Optional. Number of seconds each response is delayed by. Defaults to ``0``.
+
+    Attributes:
+        latency: Number of seconds each response is delayed by.
+        calls: Number of requests per API method.
+
+    """
+
+    def __init__(self, latency: float = 0) -> None:
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._lock = Lock()
+        self._server = _HTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._thread = Thread(
+            target=self._server.serve_forever, name=type(self).__name__, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        """The base URL of the server."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def request_count(self) -> int:
+        """The total number of requests handled so far."""
+        with self._lock:
+            return sum(self.calls.values())
+
+    def start(self) -> None:
+        """Starts serving in a background thread."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops serving and closes the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, method: str) -> None:
+        with self._lock:
+            self.calls[method] += 1
+
+    @abstractmethod
+    def handle(self, path: str, params: Dict[str, Any]) -> Response:
+        """
+        Answers a request. To be implemented by subclasses.
+
+        Args:
+            path: The path of the requested URL.
+            params: The parameters of the request, taken from the query string and the body.
+
+        Returns:
+            The HTTP status code and the JSON payload of the response.
+
+        """
+
+    def _handler_class(self) -> Type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Passes the requests to :meth:`handle` of the fake server."""
+
+            # Keep-alive, like the real servers
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self) -> None:  # pylint: disable=C0103
+                """Answers a GET request."""
+                self._respond(b'')
+
+            def do_POST(self) -> None:  # pylint: disable=C0103
+                """Answers a POST request."""
+                self._respond(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+            def _respond(self, body: bytes) -> None:
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = urlsplit(self.path)
+                params: Dict[str, Any] = dict(parse_qsl(url.query))
+                params.update(_parse_body(self.headers.get('Content-Type', ''), body))
+                status, payload = fake.handle(url.path, params)
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def _parse_body(content_type: str, body: bytes) -> Dict[str, Any]:
+    if not body:
+        return {}
+    if 'json' in content_type:
+        return json.loads(body)
+    if 'multipart' in content_type:
+        # Only the plain fields are of interest, uploaded files are skipped
+        return {
+            match.group(1).decode(): match.group(2).decode()
+            for match in re.finditer(
+                rb'name="([^"]+)"\r\n(?:Content-Type: text/plain[^\r]*\r\n)?\r\n(.*?)\r\n--',
+                body,
+                re.DOTALL,
+            )
+        }
+    return dict(parse_qsl(body.decode()))
+
+
+class FakeTelegramServer(FakeServer):
+    """
+    Fake Telegram Bot API. Use ``f'{server.url}/bot'`` as ``base_url`` of the
+    :class:`telegram.Bot`. Sent and edited messages are answered with plausible
+    :class:`telegram.Message` objects, other methods simply return :obj:`True`.
+
+    Args:
+        token: The token of the bot.
+        latency: Optional. Number of seconds each response is delayed by. Defaults to ``0``.
+
+    Attributes:
+        token: The token of the bot.
+        bot_user: The bot as returned by ``getMe``.
+
+    """
+
+    def __init__(self, token: str, latency: float = 0) -> None:
+        super().__init__(latency)
+        self.token = token
+        self.bot_user = {
+            'id': int(token.partition(':')[0]),
+            'is_bot': True,
+            'first_name': 'YOURLS Benchmark Bot',
+            'username': 'yourls_benchmark_bot',
+        }
+        self._message_ids = count(1)
+        self._commands: List[Dict[str, Any]] = []
+        self._inline_results: Dict[str, List[Dict[str, Any]]] = {}
+
+    def inline_results(self, inline_query_id: str) -> List[Dict[str, Any]]:
+        """
+        Gives the results the bot answered an inline query with. The results are forgotten
+        afterwards.
+
+        Args:
+            inline_query_id: The ID of the inline query.
+
+        Returns:
+            The results as passed to ``answerInlineQuery``. Empty, if the query was not answered.
+
+        """
+        with self._lock:
+            return self._inline_results.pop(inline_query_id, [])
+
+    def handle(self, path: str, params: Dict[str, Any]) -> Response:
+        token, _, method = path[len('/bot'):].partition('/')
+        if not path.startswith('/bot') or token != self.token:
+            return 401, {'ok': False, 'error_code': 401, 'description': 'Unauthorized'}
+        self._count(method)
+        return 200, {'ok': True, 'result': self._result(method, params)}
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == 'getMe':
+            return self.bot_user
+        if method == 'getChat':
+            return _chat(params['chat_id'])
+        if method == 'setMyCommands':
+            commands = params.get('commands', [])
+            with self._lock:
+                self._commands = json.loads(commands) if isinstance(commands, str) else commands
+            return True
+        if method == 'getMyCommands':
+            with self._lock:
+                return self._commands
+        if method == 'answerInlineQuery':
+            results = params.get('results', [])
+            with self._lock:
+                self._inline_results[str(params['inline_query_id'])] = (
+                    json.loads(results) if isinstance(results, str) else results
+                )
+            return True
+        if method.startswith(('send', 'edit', 'copy', 'forward')):
+            # Inline messages are not accessible for bots
+            if 'inline_message_id' in params:
+                return True
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': _chat(params['chat_id']),
+                'from': self.bot_user,
+                'text': params.get('text', ''),
+            }
+        return True
+
+
+def _chat(chat_id: Union[int, str]) -> Dict[str, Any]:
+    chat_id = int(chat_id)
+    if chat_id > 0:
+        return {'id': chat_id, 'type': 'private', 'first_name': 'User', 'last_name': str(chat_id)}
+    return {'id': chat_id, 'type': 'group', 'title': f'Group {chat_id}'}
+
+
+class FakeYOURLSServer(FakeServer):
+    """
+    Fake YOURLS instance. Serves the API at ``f'{server.url}/yourls-api.php'`` including the
+    actions of the API plugins for deleting and editing links, which the bot relies on.
+    Signatures are not checked. The instance starts out with ``catalog_size`` links with the
+    keywords ``c0``, ``c1``, …, the newest one being the last.
+
+    Args:
+        latency: Optional. Number of seconds each response is delayed by. Defaults to ``0``.
+        catalog_size: Optional. Number of links stored initially. Defaults to ``1000``.
+
+    """
+
+    def __init__(self, latency: float = 0, catalog_size: int = 1000) -> None:
+        super().__init__(latency)
+        self._links: Dict[str, Dict[str, Any]] = {}
+        self._unused: Deque[str] = deque()
+        self._keyword_ids = count(catalog_size)
+        first = datetime.now() - timedelta(seconds=catalog_size)
+        for i in range(catalog_size):
+            keyword = f'c{i}'
+            self._links[keyword] = self._link(
+                keyword, f'https://example.com/catalog/{i}', first + timedelta(seconds=i), i % 100
+            )
+            self._unused.append(keyword)
+        self._actions: Dict[str, Callable[[Dict[str, Any]], Response]] = {
+            'shorturl': self._shorturl,
+            'expand': self._expand,
+            'url-stats': self._url_stats,
+            'stats': self._stats,
+            'db-stats': self._db_stats,
+            'delete': self._delete,
+            'update': self._update,
+            'change_keyword': self._change_keyword,
+        }
+
+    def take_keyword(self) -> str:
+        """
+        Hands out a keyword of the initial links that was not handed out before. Meant for
+        workloads that change or delete links, such that they don't interfere with each other.
+
+        Returns:
+            The keyword.
+
+        Raises:
+            RuntimeError: If all keywords were handed out. Increase ``catalog_size`` then.
+
+        """
+        with self._lock:
+            if not self._unused:
+                raise RuntimeError('All links of the catalog are used up.')
+            return self._unused.popleft()
+
+    def _link(
+        self, keyword: str, url: str, date: datetime, clicks: int = 0, title: str = None
+    ) -> Dict[str, Any]:
+        return {
+            'keyword': keyword,
+            'shorturl': f'{self.url}/{keyword}',
+            'url': url,
+            'title': title or f'Title of {url}',
+            'timestamp': date.strftime(DATE_FORMAT),
+            'ip': '127.0.0.1',
+            'clicks': str(clicks),
+        }
+
+    def handle(self, path: str, params: Dict[str, Any]) -> Response:
+        action = self._actions.get(params.get('action', '')) if path.endswith('api.php') else None
+        self._count(params.get('action', 'unknown'))
+        if action is None:
+            return 400, {'errorCode': 400, 'message': 'Unknown or missing "action" parameter'}
+        with self._lock:
+            return action(params)
+
+    @staticmethod
+    def _keyword(short_url: Optional[str]) -> str:
+        return (short_url or '').rstrip('/').rpartition('/')[-1]
+
+    @staticmethod
+    def _not_found(keyword: str) -> Response:
+        return 404, {
+            'statusCode': 404,
+            'keyword': keyword,
+            'simple': 'Error: short URL not found',
+            'message': 'error: not found',
+        }
+
+    def _shorturl(self, params: Dict[str, Any]) -> Response:
+        url = params.get('url', '')
+        if not re.match(r'^https?://\S+$', url):
+            return 400, {
+                'status': 'fail',
+                'code': 'error:nourl',
+                'message': 'Missing or malformed URL',
+                'errorCode': 400,
+            }
+        if url.startswith(self.url):
+            return 400, {
+                'status': 'fail',
+                'code': 'error:noloop',
+                'message': 'URL is a short URL',
+                'errorCode': 400,
+            }
+        keyword = params.get('keyword')
+        if keyword and keyword in self._links:
+            return 200, {
+                'status': 'fail',
+                'code': 'error:keyword',
+                'message': f'Short URL {keyword} already exists in database or is reserved',
+                'errorCode': 400,
+                'statusCode': 200,
+            }
+        while not keyword or keyword in self._links:
+            keyword = f'a{next(self._keyword_ids)}'
+
+        link = self._links[keyword] = self._link(keyword, url, datetime.now())
+        return 200, {
+            'url': {
+                'keyword': keyword,
+                'url': url,
+                'title': link['title'],
+                'date': link['timestamp'],
+                'ip': link['ip'],
+            },
+            'status': 'success',
+            'message': f'{url} added to database',
+            'title': link['title'],
+            'shorturl': link['shorturl'],
+            'statusCode': 200,
+        }
+
+    def _expand(self, params: Dict[str, Any]) -> Response:
+        keyword = self._keyword(params.get('shorturl'))
+        link = self._links.get(keyword)
+        if link is None:
+            return self._not_found(keyword)
+        return 200, {
+            'keyword': keyword,
+            'shorturl': link['shorturl'],
+            'longurl': link['url'],
+            'title': link['title'],
+            'message': 'success',
+            'statusCode': 200,
+        }
+
+    def _url_stats(self, params: Dict[str, Any]) -> Response:
+        keyword = self._keyword(params.get('shorturl'))
+        link = self._links.get(keyword)
+        if link is None:
+            return self._not_found(keyword)
+        return 200, {'statusCode': 200, 'message': 'success', 'link': link}
+
+    def _totals(self) -> Dict[str, str]:
+        return {
+            'total_links': str(len(self._links)),
+            'total_clicks': str(sum(int(link['clicks']) for link in self._links.values())),
+        }
+
+    def _stats(self, params: Dict[str, Any]) -> Response:
+        start = int(params.get('start') or 0)
+        limit = int(params.get('limit') or 10)
+        links = list(self._links.values())
+        if params.get('filter') in ('top', 'bottom'):
+            links.sort(key=lambda link: int(link['clicks']), reverse=params['filter'] == 'top')
+        elif params.get('filter') == 'rand':
+            random.shuffle(links)
+        else:
+            links.reverse()
+
+        payload: Dict[str, Any] = {
+            'stats': self._totals(),
+            'statusCode': 200,
+            'message': 'success',
+        }
+        page = links[start:start + limit]
+        if page:
+            payload['links'] = {f'link_{i}': link for i, link in enumerate(page, start=1)}
+        return 200, payload
+
+    def _db_stats(self, _: Dict[str, Any]) -> Response:
+        return 200, {'db-stats': self._totals(), 'statusCode': 200, 'message': 'success'}
+
+    def _delete(self, params: Dict[str, Any]) -> Response:
+        keyword = self._keyword(params.get('shorturl') or params.get('keyword'))
+        if self._links.pop(keyword, None) is None:
+            return self._not_found(keyword)
+        return 200, {
+            'statusCode': 200,
+            'simple': f'Short URL {keyword} deleted',
+            'message': 'success: deleted',
+        }
+
+    def _update(self, params: Dict[str, Any]) -> Response:
+        keyword = self._keyword(params.get('shorturl'))
+        link = self._links.get(keyword)
+        if link is None:
+            return self._not_found(keyword)
+        link['url'] = params.get('url', link['url'])
+        if params.get('title') and params['title'] != 'keep':
+            link['title'] = f'Title of {link["url"]}'
+        return 200, {'statusCode': 200, 'message': 'success: updated'}
+
+    def _change_keyword(self, params: Dict[str, Any]) -> Response:
+        keyword = self._keyword(params.get('oldshorturl'))
+        new_keyword = self._keyword(params.get('newshorturl'))
+        if keyword not in self._links:
+            return self._not_found(keyword)
+        if new_keyword in self._links:
+            return 200, {
+                'status': 'fail',
+                'code': 'error:keyword',
+                'message': f'Short URL {new_keyword} already exists in database or is reserved',
+                'statusCode': 200,
+            }
+        self._links[keyword].update(keyword=new_keyword, shorturl=f'{self.url}/{new_keyword}')
+        # Keep the order by creation date, which the stats rely on
+        self._links = {link['keyword']: link for link in self._links.values()}
+        return 200, {'statusCode': 200, 'message': 'success: updated'}
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module runs the bot as set up by ``main.py`` against the fake servers."""
+import logging
+import tempfile
+import time
+from contextlib import ExitStack
+from itertools import count
+from queue import Queue
+from threading import Event, Lock, Thread
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union, cast
+
+from ptbcontrib.roles import BOT_DATA_KEY, Roles
+from telegram import ParseMode, TelegramError, Update
+from telegram.ext import CallbackContext, Defaults, Dispatcher, JobQueue
+from telegram.utils.request import Request
+
+from benchmarks.fake_servers import FakeTelegramServer, FakeYOURLSServer
+from benchmarks.workloads import ADMIN_WORKLOADS, WORKLOADS, Session, UpdateData
+from bot.constants import USER_ROLE
+from bot.dispatcher import OrderedDispatcher
+from bot.message_queue import MessageQueue, QueuedBot, TokenBucket
+from bot.persistence import SQLitePersistence
+from bot.services import Services
+from bot.settings import Settings
+from bot.setup import setup_dispatcher
+
+logger = logging.getLogger(__name__)
+
+TOKEN = '123456:benchmark'
+""":obj:`str`: The token of the benchmarked bot."""
+ADMIN_ID = 1
+""":obj:`int`: The ID of the admin of the benchmarked bot."""
+FIRST_USER_ID = 1000
+""":obj:`int`: The ID of the first simulated user. The others follow consecutively."""
+TIMEOUT = 60
+""":obj:`int`: Number of seconds to wait for an update to be processed."""
+
+
+class _CompletionMixin(Dispatcher):
+    # Sits between the OrderedDispatcher and the Dispatcher in the MRO, so that it's notified
+    # once the OrderedDispatcher processed an update, including the persistence
+    def on_processed(self, update: Update) -> None:
+        """
+        Called once an update was processed. Overridden by :class:`BenchmarkDispatcher`.
+
+        Args:
+            update: The processed update.
+
+        """
+
+    def process_update(self, update: Union[str, Update, TelegramError]) -> None:
+        try:
+            super().process_update(update)
+        finally:
+            if isinstance(update, Update):
+                self.on_processed(update)
+
+
+class BenchmarkDispatcher(OrderedDispatcher, _CompletionMixin):
+    """
+    :class:`bot.dispatcher.OrderedDispatcher` that reports when an update was processed.
+
+    Args:
+        *args: Passed to :class:`bot.dispatcher.OrderedDispatcher`.
+        **kwargs: Passed to :class:`bot.dispatcher.OrderedDispatcher`.
+
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._waiting: Dict[int, Tuple[Event, List[float]]] = {}
+        self._waiting_lock = Lock()
+
+    def expect(self, update_id: int) -> Tuple[Event, List[float]]:
+        """
+        Registers an update that is about to be put into the update queue.
+
+        Args:
+            update_id: The ID of the update.
+
+        Returns:
+            An event that is set once the update was processed and a list, to which the value
+            of :meth:`time.perf_counter` at that time is appended.
+
+        """
+        waiting: Tuple[Event, List[float]] = (Event(), [])
+        with self._waiting_lock:
+            self._waiting[update_id] = waiting
+        return waiting
+
+    def on_processed(self, update: Update) -> None:
+        """
+        Called by the worker thread once an update was processed.
+
+        Args:
+            update: The update.
+
+        """
+        finished = time.perf_counter()
+        with self._waiting_lock:
+            waiting = self._waiting.pop(update.update_id, None)
+        if waiting is not None:
+            waiting[1].append(finished)
+            waiting[0].set()
+
+
+class UnthrottledMessageQueue(MessageQueue):
+    """
+    :class:`bot.message_queue.MessageQueue` without flood limits. The messages still pass the
+    queue and its worker threads, but the benchmarks are not dominated by the limits of
+    Telegram.
+
+    Args:
+        workers: Optional. Number of threads sending messages. Defaults to ``4``.
+
+    """
+
+    def __init__(self, workers: int = 4) -> None:
+        super().__init__(workers)
+        self._global_bucket = TokenBucket(1e9, 1e9)
+
+    def _bucket(self, chat_id: Any) -> TokenBucket:
+        return self._global_bucket
+
+
+class BenchmarkEnvironment:
+    """
+    The bot with all its components as set up by ``main.py``, talking to a
+    :class:`benchmarks.fake_servers.FakeTelegramServer` and a
+    :class:`benchmarks.fake_servers.FakeYOURLSServer`. Updates are put into the update queue
+    like the updater does. Use as context manager.
+
+    Args:
+        workers: Optional. Number of worker threads of the dispatcher. Defaults to ``4``.
+        users: Optional. Number of simulated users. They are members of the user role. Defaults
+            to ``10``.
+        yourls_latency: Optional. Latency of the fake YOURLS instance in seconds. Defaults to
+            ``0.02``.
+        telegram_latency: Optional. Latency of the fake Telegram server in seconds. Defaults to
+            ``0.02``.
+        catalog_size: Optional. Number of links on the fake YOURLS instance. Defaults to
+            ``10000``.
+        cache_timeout: Optional. Timeout of the statistics cache in seconds. Defaults to
+            ``300``.
+        deferred_inline: Optional. Whether to use the deferred inline mode. Defaults to
+            :obj:`False`.
+        flood_limits: Optional. Whether outgoing messages obey the flood limits of Telegram.
+            Defaults to :obj:`False`.
+        persistence: Optional. Whether to use the :class:`bot.persistence.SQLitePersistence`.
+            Defaults to :obj:`True`.
+        **kwargs: Passed to :class:`bot.settings.Settings`.
+
+    Attributes:
+        telegram: The fake Telegram server.
+        yourls: The fake YOURLS instance.
+        dispatcher: The dispatcher.
+        user_ids: The IDs of the simulated users.
+        errors: Number of errors that reached the error handlers.
+
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        users: int = 10,
+        yourls_latency: float = 0.02,
+        telegram_latency: float = 0.02,
+        catalog_size: int = 10000,
+        cache_timeout: int = 300,
+        deferred_inline: bool = False,
+        flood_limits: bool = False,
+        persistence: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        self.telegram = FakeTelegramServer(TOKEN, latency=telegram_latency)
+        self.yourls = FakeYOURLSServer(latency=yourls_latency, catalog_size=catalog_size)
+        self.user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + users))
+        self.errors = 0
+        self._errors_lock = Lock()
+        self._workers = workers
+        self._cache_timeout = cache_timeout
+        self._deferred_inline = deferred_inline
+        self._flood_limits = flood_limits
+        self._persistence = persistence
+        self._kwargs = kwargs
+        self._update_ids = count(1)
+        self._sessions: Dict[int, Session] = {}
+        # Holds the temporary directory while the environment is running
+        self._exit_stack = ExitStack()
+        self._tempdir = ''
+        self._thread = Thread(target=self._start_dispatcher, name='dispatcher')
+        self.dispatcher: Optional[BenchmarkDispatcher] = None
+        self._services: Optional[Services] = None
+
+    def __enter__(self) -> 'BenchmarkEnvironment':
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Starts the fake servers and the bot."""
+        self._tempdir = self._exit_stack.enter_context(
+            tempfile.TemporaryDirectory(prefix='yourls-bot-benchmark-')
+        )
+        self.telegram.start()
+        self.yourls.start()
+
+        defaults = Defaults(
+            parse_mode=ParseMode.HTML, disable_notification=True, disable_web_page_preview=True
+        )
+        message_queue = MessageQueue() if self._flood_limits else UnthrottledMessageQueue()
+        bot = QueuedBot(
+            TOKEN,
+            base_url=f'{self.telegram.url}/bot',
+            defaults=defaults,
+            request=Request(con_pool_size=message_queue.workers + 2 * self._workers + 4),
+            message_queue=message_queue,
+        )
+        persistence = (
+            SQLitePersistence(f'{self._tempdir}/db.sqlite') if self._persistence else None
+        )
+        job_queue = JobQueue()
+        self.dispatcher = BenchmarkDispatcher(
+            bot,
+            Queue(),
+            workers=self._workers,
+            job_queue=job_queue,
+            persistence=persistence,
+        )
+        job_queue.set_dispatcher(self.dispatcher)
+
+        settings = Settings(
+            token=TOKEN,
+            client=self.yourls.url,
+            signature='benchmark-signature',
+            cache_timeout=self._cache_timeout,
+            admin=ADMIN_ID,
+            stats_store_path=f'{self._tempdir}/stats.sqlite',
+            deferred_inline=self._deferred_inline,
+            workers=self._workers,
+            **self._kwargs,
+        )
+        self._services = setup_dispatcher(self.dispatcher, settings)
+        self.dispatcher.add_error_handler(self._count_error)
+        self.authorize(self.user_ids)
+
+        self._thread.start()
+        job_queue.start()
+        while not self.dispatcher.running:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        """Stops the bot and the fake servers."""
+        if self.dispatcher is not None:
+            self.dispatcher.job_queue.stop()
+            self.dispatcher.stop()
+            self._thread.join()
+            cast(QueuedBot, self.dispatcher.bot).message_queue.stop()
+            cast(Services, self._services).async_yourls.close()
+            if self.dispatcher.persistence:
+                self.dispatcher.persistence.flush()
+        self.telegram.stop()
+        self.yourls.stop()
+        self._exit_stack.close()
+
+    def authorize(self, user_ids: Iterable[int]) -> None:
+        """
+        Adds users to the user role.
+
+        Args:
+            user_ids: The IDs of the users.
+
+        """
+        dispatcher = cast(BenchmarkDispatcher, self.dispatcher)
+        user_role = cast(Roles, dispatcher.bot_data[BOT_DATA_KEY])[USER_ROLE]
+        for user_id in user_ids:
+            user_role.add_member(user_id)
+
+    def _start_dispatcher(self) -> None:
+        cast(BenchmarkDispatcher, self.dispatcher).start()
+
+    def _count_error(self, _: object, context: CallbackContext) -> None:
+        with self._errors_lock:
+            self.errors += 1
+        logger.debug('Error while processing an update.', exc_info=context.error)
+
+    def session(self, user_id: int) -> Session:
+        """
+        Args:
+            user_id: The ID of the user.
+
+        Returns:
+            The simulated user. The same session is returned on each call, such that the links
+            and keywords built by the workloads stay unique across runs.
+
+        """
+        if user_id not in self._sessions:
+            self._sessions[user_id] = Session(user_id, self.yourls, self.telegram)
+        return self._sessions[user_id]
+
+    def submit(self, data: UpdateData) -> 'PendingUpdate':
+        """
+        Puts an update into the update queue without waiting for it to be processed.
+
+        Args:
+            data: The update as sent by Telegram. The ``update_id`` is replaced by a unique one.
+
+        Returns:
+            The submitted update.
+
+        """
+        dispatcher = cast(BenchmarkDispatcher, self.dispatcher)
+        update = Update.de_json({**data, 'update_id': next(self._update_ids)}, dispatcher.bot)
+        event, finished = dispatcher.expect(update.update_id)
+        pending = PendingUpdate(update.update_id, event, finished)
+        dispatcher.update_queue.put(update)
+        return pending
+
+    def process(self, data: UpdateData) -> float:
+        """
+        Puts an update into the update queue and waits until it was processed.
+
+        Args:
+            data: The update as sent by Telegram, without ``update_id``.
+
+        Returns:
+            The number of seconds from putting the update into the queue until it was processed.
+
+        Raises:
+            TimeoutError: If the update was not processed within :attr:`TIMEOUT` seconds.
+
+        """
+        return self.submit(data).wait()
+
+
+class PendingUpdate:  # pylint: disable=R0903
+    """
+    An update that was put into the update queue by :meth:`BenchmarkEnvironment.submit`.
+
+    Args:
+        update_id: The ID of the update.
+        event: The event set once the update was processed.
+        finished: The list the time the update was processed at is appended to.
+
+    Attributes:
+        update_id: The ID of the update.
+        start: Value of :meth:`time.perf_counter` when the update was submitted.
+
+    """
+
+    def __init__(self, update_id: int, event: Event, finished: List[float]) -> None:
+        self.update_id = update_id
+        self.start = time.perf_counter()
+        self._event = event
+        self._finished = finished
+
+    def wait(self) -> float:
+        """
+        Waits until the update was processed.
+
+        Returns:
+            The number of seconds from submitting the update until it was processed.
+
+        Raises:
+            TimeoutError: If the update was not processed within :attr:`TIMEOUT` seconds after
+                being submitted.
+
+        """
+        if not self._event.wait(max(0.0, self.start + TIMEOUT - time.perf_counter())):
+            raise TimeoutError(f'Update {self.update_id} was not processed in time.')
+        return self._finished[0] - self.start
+
+
+class WorkloadResult:
+    """
+    Measurements of one run of a workload.
+
+    Args:
+        name: The name of the workload.
+        latencies: The latencies of the updates in seconds.
+        duration: Wall clock time of the run in seconds.
+        yourls_requests: Number of requests the YOURLS instance received during the run.
+        telegram_requests: Number of requests Telegram received during the run.
+        errors: Number of errors during the run.
+
+    Attributes:
+        name: The name of the workload.
+        latencies: The sorted latencies of the updates in seconds.
+        duration: Wall clock time of the run in seconds.
+        yourls_requests: Number of requests the YOURLS instance received during the run.
+        telegram_requests: Number of requests Telegram received during the run.
+        errors: Number of errors during the run.
+
+    """
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        name: str,
+        latencies: Iterable[float],
+        duration: float,
+        yourls_requests: int,
+        telegram_requests: int,
+        errors: int,
+    ) -> None:
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.duration = duration
+        self.yourls_requests = yourls_requests
+        self.telegram_requests = telegram_requests
+        self.errors = errors
+
+    @property
+    def updates(self) -> int:
+        """Number of processed updates."""
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        """Processed updates per second."""
+        return self.updates / self.duration if self.duration else 0
+
+    def percentile(self, percent: float) -> float:
+        """
+        Args:
+            percent: The percentage, e.g. ``99``.
+
+        Returns:
+            The latency in seconds, that the given percentage of the updates didn't exceed.
+
+        """
+        if not self.latencies:
+            return 0
+        index = max(0, -(-len(self.latencies) * percent // 100) - 1)
+        return self.latencies[int(index)]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The key figures of the run as JSON serializable dictionary."""
+        updates = self.updates or 1
+        return {
+            'workload': self.name,
+            'updates': self.updates,
+            'throughput': self.throughput,
+            'p50_ms': self.percentile(50) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'yourls_per_update': self.yourls_requests / updates,
+            'telegram_per_update': self.telegram_requests / updates,
+            'errors': self.errors,
+        }
+
+
+def run_workload(
+    environment: BenchmarkEnvironment, name: str, rounds: int = 1
+) -> WorkloadResult:
+    """
+    Runs a workload. Each simulated user runs the workload ``rounds`` times in its own thread.
+    Workloads for admins are run by the admin only.
+
+    Args:
+        environment: The running environment.
+        name: The name of the workload, i.e. a key of
+            :attr:`benchmarks.workloads.WORKLOADS`.
+        rounds: Optional. How often each user runs the workload. Defaults to ``1``.
+
+    Returns:
+        The measurements.
+
+    """
+    script = WORKLOADS[name]
+    user_ids = [ADMIN_ID] if name in ADMIN_WORKLOADS else environment.user_ids
+    latencies: List[float] = []
+    failures: List[BaseException] = []
+
+    def simulate(user_id: int) -> None:
+        session = environment.session(user_id)
+        try:
+            for _ in range(rounds):
+                for data in script(session):
+                    latencies.append(environment.process(data))
+        except Exception as exc:  # pylint: disable=W0703
+            failures.append(exc)
+
+    threads = [Thread(target=simulate, args=(user_id,)) for user_id in user_ids]
+    yourls_requests = environment.yourls.request_count
+    telegram_requests = environment.telegram.request_count
+    errors = environment.errors
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    if failures:
+        raise failures[0]
+
+    return WorkloadResult(
+        name,
+        latencies,
+        duration,
+        yourls_requests=environment.yourls.request_count - yourls_requests,
+        telegram_requests=environment.telegram.request_count - telegram_requests,
+        errors=environment.errors - errors,
+    )
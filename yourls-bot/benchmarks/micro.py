@@ -0,0 +1,669 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The script that runs the micro-benchmarks of the functions every message and inline query goes
+through. Run it from the directory containing ``main.py`` via ``python -m benchmarks.micro``.
+See ``python -m benchmarks.micro --help`` for the options.
+
+The functions are run on generated corpora of messages and catalogs of short URLs, which are
+seeded, such that results of different runs are comparable. Results can be saved as baseline
+via ``--save`` and compared against a baseline via ``--compare``. With ``--check``, no benchmarks
+are run. Instead, the :class:`bot.message_router.MessageRouter` is checked to route generated
+updates just like the two message handlers it replaced.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import string
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, cast
+
+from ptbcontrib.extract_urls import extract_urls
+from telegram import MessageEntity, Update
+from telegram.ext import Filters, MessageHandler
+from yourls import ShortenedURL
+
+from bot.message_router import KEYWORD_ROUTE, SHORTEN_ROUTE, MessageRouter
+from bot.services import Services, set_services
+from bot.stats_cache import StatsCache
+from bot.utils import TwoWordFilter, check_keyword_existence, extract_keyword, sanitize_protocol
+
+SEED = 1
+""":obj:`int`: Seed of the generated corpora and catalogs."""
+CORPUS_SIZE = 200
+""":obj:`int`: Number of messages in each corpus."""
+CATALOG_SIZES = (10000, 100000, 1000000)
+""":obj:`tuple`: Default numbers of short URLs in the catalogs for the keyword lookups."""
+LOOKUPS = 1000
+""":obj:`int`: Number of keywords looked up per round. Half of them exist in the catalog."""
+SHORT_DOMAIN = 'https://sho.rt'
+""":obj:`str`: Domain of the short URLs in the catalogs."""
+ROUTING_UPDATES = 3000
+""":obj:`int`: Number of random updates for ``--check``, in addition to 50 messages of each
+corpus."""
+BOT_ID = 42
+""":obj:`int`: ID of the bot for ``--check``."""
+
+_UNICODE_WORDS = ('Grüße', 'naïve', 'Ωμέγα', 'привет', '東京', 'شكرا', '🙂', '👍🏽', '🇩🇪', '𝐛𝐨𝐥𝐝')
+_TLDS = ('com', 'org', 'de', 'io', 'co.uk', 'рф')
+_ROUTING_TEXTS = (
+    'a b',
+    ' a  b ',
+    'a',
+    'a b c',
+    'a\nb',
+    '',
+    '/start',
+    '/start x',
+    'x /start',
+    'https://x.y kw',
+    'kw https://x.y',
+)
+_ROUTING_ENTITIES = (
+    MessageEntity.URL,
+    MessageEntity.TEXT_LINK,
+    MessageEntity.BOT_COMMAND,
+    MessageEntity.BOLD,
+    MessageEntity.MENTION,
+)
+_ROUTING_KINDS = (
+    'message',
+    'edited_message',
+    'channel_post',
+    'edited_channel_post',
+    'callback_query',
+)
+
+
+class BenchmarkResult:
+    """
+    Timings of one micro-benchmark. All times are per call in seconds.
+
+    Args:
+        name: The name of the benchmark.
+        timings: The per call time of each round.
+
+    Attributes:
+        name: The name of the benchmark.
+        rounds: Number of rounds.
+        min: Fastest round.
+        max: Slowest round.
+        mean: Mean of the rounds.
+        median: Median of the rounds.
+        stddev: Standard deviation of the rounds.
+
+    """
+
+    def __init__(self, name: str, timings: Sequence[float]) -> None:
+        self.name = name
+        self.rounds = len(timings)
+        self.min = min(timings)
+        self.max = max(timings)
+        self.mean = statistics.mean(timings)
+        self.median = statistics.median(timings)
+        self.stddev = statistics.stdev(timings) if len(timings) > 1 else 0.0
+
+    @property
+    def ops(self) -> float:
+        """Calls per second, based on the median."""
+        return 1 / self.median if self.median else 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The timings as JSON serializable dictionary."""
+        return {
+            'name': self.name,
+            'rounds': self.rounds,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'median': self.median,
+            'stddev': self.stddev,
+        }
+
+
+def benchmark(
+    name: str, function: Callable[[Any], Any], inputs: Sequence[Any], min_time: float = 0.2
+) -> BenchmarkResult:
+    """
+    Calls a function on each of the inputs. Such rounds are repeated until ``min_time`` seconds
+    passed, but at least 5 times. A round, which is not measured, precedes the measurements.
+
+    Args:
+        name: The name of the benchmark.
+        function: The function to benchmark.
+        inputs: The inputs to call the function on.
+        min_time: Optional. Minimum number of seconds to spend on measuring. Defaults to ``0.2``.
+
+    Returns:
+        The timings.
+
+    """
+    for argument in inputs:
+        function(argument)
+
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < 5 or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for argument in inputs:
+            function(argument)
+        timings.append((time.perf_counter() - start) / len(inputs))
+    return BenchmarkResult(name, timings)
+
+
+def _utf16_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+class _MessageBuilder:
+    # Builds message texts together with entities, whose offsets are counted in UTF-16 code
+    # units just like Telegram does
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self.entities: List[Dict[str, Any]] = []
+        self._offset = 0
+
+    def add(self, text: str, entity_type: str = None, **kwargs: Any) -> None:
+        if self.parts:
+            self.parts.append(' ')
+            self._offset += 1
+        if entity_type:
+            self.entities.append(
+                {
+                    'type': entity_type,
+                    'offset': self._offset,
+                    'length': _utf16_length(text),
+                    **kwargs,
+                }
+            )
+        self.parts.append(text)
+        self._offset += _utf16_length(text)
+
+    def build(self, message_id: int) -> Update:
+        return Update.de_json(
+            {
+                'update_id': message_id,
+                'message': {
+                    'message_id': message_id,
+                    'date': 0,
+                    'chat': {'id': 1, 'type': 'private'},
+                    'from': {'id': 1, 'is_bot': False, 'first_name': 'Benchmark'},
+                    'text': ''.join(self.parts),
+                    'entities': self.entities,
+                },
+            },
+            None,
+        )
+
+
+def random_word(rng: random.Random, unicode: bool = False) -> str:
+    """
+    Args:
+        rng: The random number generator.
+        unicode: Optional. Whether to pick words with non-ASCII characters and emoji, too.
+            Defaults to :obj:`False`.
+
+    Returns:
+        A random word.
+
+    """
+    if unicode and rng.random() < 0.5:
+        return rng.choice(_UNICODE_WORDS)
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+
+
+def random_url(rng: random.Random, unicode: bool = False) -> str:
+    """
+    Args:
+        rng: The random number generator.
+        unicode: Optional. Whether the URL may contain non-ASCII characters. Defaults to
+            :obj:`False`.
+
+    Returns:
+        A random URL. About a third of the URLs come without scheme.
+
+    """
+    scheme = rng.choice(('https://', 'http://', ''))
+    host = f'{random_word(rng)}.{rng.choice(_TLDS) if unicode else "com"}'
+    path = '/'.join(random_word(rng, unicode) for _ in range(rng.randint(0, 4)))
+    query = f'?id={rng.randint(0, 10 ** 6)}' if rng.random() < 0.3 else ''
+    return f'{scheme}{host}/{path}{query}'
+
+
+def generate_corpora(seed: int = SEED, size: int = CORPUS_SIZE) -> Dict[str, List[Update]]:
+    """
+    Generates the corpora of messages:
+
+    * ``two_words``: A link and a keyword, as handled by ``shorten_with_keyword``.
+    * ``single_link``: A single link, the most common message.
+    * ``long_text``: Texts of about 4000 characters with a few links.
+    * ``many_entities``: 100 links and text links each.
+    * ``unicode``: Texts and links with non-ASCII characters and emoji, which take two UTF-16
+      code units.
+
+    Args:
+        seed: Optional. The seed. Defaults to :attr:`SEED`.
+        size: Optional. Number of messages per corpus. Defaults to :attr:`CORPUS_SIZE`.
+
+    Returns:
+        The messages by corpus name.
+
+    """
+    rng = random.Random(seed)
+    corpora: Dict[str, List[Update]] = {}
+
+    def build(fill: Callable[[_MessageBuilder], None]) -> List[Update]:
+        messages = []
+        for message_id in range(size):
+            builder = _MessageBuilder()
+            fill(builder)
+            messages.append(builder.build(message_id))
+        return messages
+
+    def two_words(builder: _MessageBuilder) -> None:
+        builder.add(random_url(rng), MessageEntity.URL)
+        builder.add(random_word(rng))
+
+    def single_link(builder: _MessageBuilder) -> None:
+        builder.add(random_url(rng), MessageEntity.URL)
+
+    def long_text(builder: _MessageBuilder) -> None:
+        while sum(map(len, builder.parts)) < 4000:
+            if rng.random() < 0.01:
+                builder.add(random_url(rng), MessageEntity.URL)
+            else:
+                builder.add(random_word(rng))
+
+    def many_entities(builder: _MessageBuilder) -> None:
+        for _ in range(100):
+            builder.add(random_url(rng), MessageEntity.URL)
+            builder.add(random_word(rng), MessageEntity.TEXT_LINK, url=random_url(rng))
+
+    def unicode(builder: _MessageBuilder) -> None:
+        for _ in range(rng.randint(5, 30)):
+            if rng.random() < 0.2:
+                builder.add(random_url(rng, unicode=True), MessageEntity.URL)
+            else:
+                builder.add(random_word(rng, unicode=True))
+
+    for name, fill in (
+        ('two_words', two_words),
+        ('single_link', single_link),
+        ('long_text', long_text),
+        ('many_entities', many_entities),
+        ('unicode', unicode),
+    ):
+        corpora[name] = build(fill)
+    return corpora
+
+
+def generate_catalog(size: int, seed: int = SEED) -> Tuple[SimpleNamespace, List[str]]:
+    """
+    Generates a catalog of short URLs as it's cached by the bot.
+
+    Args:
+        size: Number of short URLs.
+        seed: Optional. The seed. Defaults to :attr:`SEED`.
+
+    Returns:
+        A stand-in for the :class:`telegram.ext.CallbackContext` with the filled
+        :class:`bot.stats_cache.StatsCache` and :attr:`LOOKUPS` keywords to look up, half of
+        which exist.
+
+    """
+    rng = random.Random(seed)
+    stats_cache = StatsCache(cache_timeout=float('inf'), full_sync_interval=float('inf'))
+    date = datetime(2020, 1, 1)
+    for index in range(size):
+        keyword = f'k{index}'
+        stats_cache.add(
+            ShortenedURL(
+                shorturl=f'{SHORT_DOMAIN}/{keyword}',
+                url=f'https://example.com/{index}',
+                title=keyword,
+                date=date,
+                ip='127.0.0.1',
+                clicks=0,
+                keyword=keyword,
+            )
+        )
+    stats_cache.last_sync = time.time()
+    keywords = [
+        f'k{rng.randrange(size)}' if index % 2 else random_word(rng) for index in range(LOOKUPS)
+    ]
+    context = SimpleNamespace(dispatcher=SimpleNamespace())
+    set_services(
+        context.dispatcher, cast(Services, SimpleNamespace(stats_cache=stats_cache, yourls=None))
+    )
+    return context, keywords
+
+
+def generate_routing_updates(seed: int = SEED, size: int = ROUTING_UPDATES) -> List[Update]:
+    """
+    Generates updates for :meth:`check_message_router`: 50 messages of each corpus of
+    :meth:`generate_corpora` and ``size`` random updates covering the corner cases of the
+    routing. These are short texts or captions with random entities at random offsets, e.g.
+    commands not at the start of the text or overlapping links, in messages, channel posts, their
+    edits and callback queries, some of them sent via the bot itself or another bot.
+
+    Args:
+        seed: Optional. The seed. Defaults to :attr:`SEED`.
+        size: Optional. Number of random updates. Defaults to :attr:`ROUTING_UPDATES`.
+
+    Returns:
+        The updates.
+
+    """
+    updates = [update for corpus in generate_corpora(seed, size=50).values() for update in corpus]
+    rng = random.Random(seed)
+    for update_id in range(size):
+        entities = []
+        for _ in range(rng.randint(0, 3)):
+            entity: Dict[str, Any] = {
+                'type': rng.choice(_ROUTING_ENTITIES),
+                'offset': rng.randint(0, 3),
+                'length': rng.randint(1, 3),
+            }
+            if entity['type'] == MessageEntity.TEXT_LINK:
+                entity['url'] = random_url(rng)
+            entities.append(entity)
+
+        message: Dict[str, Any] = {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': 1, 'type': 'private'},
+            'entities': entities,
+            'text' if rng.random() < 0.8 else 'caption': rng.choice(_ROUTING_TEXTS),
+        }
+        if rng.random() < 0.2:
+            message['via_bot'] = {
+                'id': rng.choice((BOT_ID, BOT_ID + 1)),
+                'is_bot': True,
+                'first_name': 'Bot',
+            }
+
+        kind = rng.choice(_ROUTING_KINDS)
+        if kind == 'callback_query':
+            data: Dict[str, Any] = {
+                'id': str(update_id),
+                'from': {'id': 1, 'is_bot': False, 'first_name': 'Benchmark'},
+                'chat_instance': '1',
+                'message': message,
+                'data': 'data',
+            }
+        else:
+            data = message
+        updates.append(Update.de_json({'update_id': update_id, kind: data}, None))
+    return updates
+
+
+def check_message_router(updates: Sequence[Update]) -> List[Tuple[Update, Any, Any]]:
+    """
+    Checks that the :class:`bot.message_router.MessageRouter` routes updates just like the
+    handlers it replaced, i.e.
+    ``MessageHandler(TwoWordFilter() & ~Filters.via_bot(bot_id), shorten_with_keyword)``
+    followed by
+    ``MessageHandler(Filters.text & ~Filters.command & ~Filters.via_bot(bot_id), shorten)``.
+
+    Args:
+        updates: The updates, e.g. as given by :meth:`generate_routing_updates`.
+
+    Returns:
+        The updates that are routed differently together with the route of the old handlers and
+        the one of the router. Empty, if all updates are routed alike.
+
+    """
+    keyword_handler = MessageHandler(TwoWordFilter() & ~Filters.via_bot(BOT_ID), print)
+    shorten_handler = MessageHandler(
+        Filters.text & ~Filters.command & ~Filters.via_bot(BOT_ID), print
+    )
+    message_router = MessageRouter(print, print, bot_id=BOT_ID)
+
+    mismatches = []
+    for update in updates:
+        if keyword_handler.check_update(update):
+            expected: Optional[str] = KEYWORD_ROUTE
+        elif shorten_handler.check_update(update):
+            expected = SHORTEN_ROUTE
+        else:
+            expected = None
+        route = message_router.check_update(update)
+        if route != expected:
+            mismatches.append((update, expected, route))
+    return mismatches
+
+
+def run_benchmarks(
+    catalog_sizes: Sequence[int] = CATALOG_SIZES, select: str = None, min_time: float = 0.2
+) -> List[BenchmarkResult]:
+    """
+    Runs the micro-benchmarks.
+
+    Args:
+        catalog_sizes: Optional. Sizes of the catalogs for
+            :meth:`bot.utils.check_keyword_existence`. Defaults to :attr:`CATALOG_SIZES`.
+        select: Optional. If passed, only benchmarks containing this string in their name are run.
+        min_time: Optional. Minimum number of seconds to spend on measuring each benchmark.
+            Defaults to ``0.2``.
+
+    Returns:
+        The results.
+
+    """
+    results = []
+
+    def run(name: str, function: Callable[[Any], Any], inputs: Sequence[Any]) -> None:
+        if select is None or select in name:
+            results.append(benchmark(name, function, inputs, min_time))
+            print(f'{name}: {results[-1].median * 1e6:.2f} µs', file=sys.stderr)
+
+    corpora = generate_corpora()
+    two_word_filter = TwoWordFilter()
+    message_router = MessageRouter(print, print, bot_id=0)
+    for name, messages in corpora.items():
+        run(f'two_word_filter[{name}]', two_word_filter, messages)
+        run(f'message_router[{name}]', message_router.check_update, messages)
+        run(f'extract_urls[{name}]', lambda update: extract_urls(update.message), messages)
+        urls = [url for update in messages for url in extract_urls(update.message)]
+        if urls:
+            run(f'sanitize_protocol[{name}]', sanitize_protocol, urls)
+
+    rng = random.Random(SEED)
+    short_urls = [
+        f'{SHORT_DOMAIN}/{random_word(rng)}{"/" * rng.randint(0, 2)}' for _ in range(LOOKUPS)
+    ]
+    run('extract_keyword[short_url]', extract_keyword, short_urls)
+    run('extract_keyword[keyword]', extract_keyword, [extract_keyword(url) for url in short_urls])
+
+    for size in catalog_sizes:
+        name = f'check_keyword_existence[{size}]'
+        if select is not None and select not in name:
+            continue
+        context, keywords = generate_catalog(size)
+        run(
+            name,
+            lambda keyword, context=context: check_keyword_existence(context, keyword),
+            keywords,
+        )
+
+    return results
+
+
+def format_results(
+    results: List[BenchmarkResult], baseline: Dict[str, Dict[str, Any]] = None
+) -> str:
+    """
+    Args:
+        results: The results.
+        baseline: Optional. Results of an earlier run as saved by :meth:`save_results`, by name.
+
+    Returns:
+        The results as table. If a baseline is passed, the change of the medians is included.
+
+    """
+    width = max([len(result.name) for result in results] + [9])
+    header = f'{"benchmark":<{width}}{"min µs":>10}{"median µs":>11}{"stddev µs":>11}{"ops/s":>12}'
+    if baseline is not None:
+        header += f'{"change":>9}'
+    lines = [header]
+    for result in results:
+        line = (
+            f'{result.name:<{width}}{result.min * 1e6:>10.2f}{result.median * 1e6:>11.2f}'
+            f'{result.stddev * 1e6:>11.2f}{result.ops:>12.0f}'
+        )
+        if baseline is not None:
+            change = compare(result, baseline)
+            line += f'{change:>+8.1f}%' if change is not None else f'{"new":>9}'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def compare(result: BenchmarkResult, baseline: Dict[str, Dict[str, Any]]) -> Optional[float]:
+    """
+    Args:
+        result: The result.
+        baseline: Results of an earlier run as saved by :meth:`save_results`, by name.
+
+    Returns:
+        The change of the median in percent or :obj:`None`, if the baseline doesn't contain the
+        benchmark.
+
+    """
+    if result.name not in baseline:
+        return None
+    median = baseline[result.name]['median']
+    return (result.median - median) / median * 100
+
+
+def save_results(path: str, results: List[BenchmarkResult]) -> None:
+    """
+    Args:
+        path: Path of the file.
+        results: The results to save.
+
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(
+            {
+                'machine_info': {
+                    'python': platform.python_version(),
+                    'implementation': platform.python_implementation(),
+                    'machine': platform.machine(),
+                    'processor': platform.processor(),
+                },
+                'datetime': datetime.now().isoformat(),
+                'benchmarks': [result.as_dict() for result in results],
+            },
+            file,
+            indent=2,
+        )
+
+
+def load_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Args:
+        path: Path of a file written by :meth:`save_results`.
+
+    Returns:
+        The saved results by name.
+
+    """
+    with open(path, encoding='utf-8') as file:
+        return {result['name']: result for result in json.load(file)['benchmarks']}
+
+
+def parse_args(argv: Sequence[str] = None) -> argparse.Namespace:
+    """
+    Args:
+        argv: Optional. The command line arguments. Defaults to :attr:`sys.argv`.
+
+    Returns:
+        The parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Runs micro-benchmarks of the functions every message and inline query goes '
+        'through on generated corpora of messages and catalogs of short URLs.'
+    )
+    parser.add_argument(
+        '-k',
+        '--select',
+        metavar='SUBSTRING',
+        help='Only run benchmarks containing SUBSTRING in their name.',
+    )
+    parser.add_argument(
+        '--catalog-size',
+        type=int,
+        action='append',
+        help='Number of short URLs in the catalog for the keyword lookups. May be passed multiple '
+        f'times. Defaults to {", ".join(map(str, CATALOG_SIZES))}.',
+    )
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.2,
+        help='Minimum number of seconds to spend on measuring each benchmark.',
+    )
+    parser.add_argument('--save', metavar='FILE', help='Save the results as baseline to FILE.')
+    parser.add_argument(
+        '--compare', metavar='FILE', help='Compare the results to the baseline saved in FILE.'
+    )
+    parser.add_argument(
+        '--fail-above',
+        type=float,
+        metavar='PERCENT',
+        help='Together with --compare, exit with status 1 if the median of any benchmark got '
+        'slower by more than PERCENT percent.',
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Instead of running the benchmarks, check that the message router routes generated '
+        'updates just like the message handlers it replaced and exit with status 1 otherwise.',
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] = None) -> None:
+    """
+    Runs the micro-benchmarks.
+
+    Args:
+        argv: Optional. The command line arguments. Defaults to :attr:`sys.argv`.
+
+    """
+    args = parse_args(argv)
+    if args.check:
+        updates = generate_routing_updates()
+        mismatches = check_message_router(updates)
+        for update, expected, route in mismatches[:10]:
+            print(f'Expected {expected}, got {route}: {update.to_json()}', file=sys.stderr)
+        print(f'{len(updates) - len(mismatches)} of {len(updates)} updates routed alike.')
+        if mismatches:
+            sys.exit(1)
+        return
+
+    baseline = load_results(args.compare) if args.compare else None
+    results = run_benchmarks(args.catalog_size or CATALOG_SIZES, args.select, args.min_time)
+
+    print(format_results(results, baseline))
+    if args.save:
+        save_results(args.save, results)
+    if baseline is not None and args.fail_above is not None:
+        regressions = [
+            result.name
+            for result in results
+            if (compare(result, baseline) or 0) > args.fail_above
+        ]
+        if regressions:
+            print(f'Slower than the baseline: {", ".join(regressions)}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
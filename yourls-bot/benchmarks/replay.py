@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The script that replays a log written by :class:`bot.update_recorder.UpdateRecorder` against
+local fake Telegram and YOURLS servers. Run it from the directory containing ``main.py`` via
+``python -m benchmarks.replay LOG``. See ``python -m benchmarks.replay --help`` for the options.
+"""
+import argparse
+import logging
+import time
+from typing import Iterable, Sequence, Set, Tuple
+
+from benchmarks.harness import BenchmarkEnvironment, WorkloadResult
+from benchmarks.run import add_environment_arguments, build_environment, format_results, write_json
+from benchmarks.workloads import UpdateData
+from bot.update_recorder import read_log
+
+
+def parse_speed(value: str) -> float:
+    """
+    Args:
+        value: Either a factor like ``2`` or ``max``.
+
+    Returns:
+        The factor. ``0`` stands for ``max``.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is neither ``max`` nor a non-negative number.
+
+    """
+    if value == 'max':
+        return 0
+    try:
+        speed = float(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f'invalid speed: {value!r}') from exc
+    if speed < 0:
+        raise argparse.ArgumentTypeError(f'invalid speed: {value!r}')
+    return speed
+
+
+def parse_args(argv: Sequence[str] = None) -> argparse.Namespace:
+    """
+    Args:
+        argv: Optional. The command line arguments. Defaults to :attr:`sys.argv`.
+
+    Returns:
+        The parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Replays recorded updates against local fake Telegram and YOURLS servers and '
+        'reports throughput, latencies and backend calls per update.'
+    )
+    parser.add_argument('log', help='The log written by the bot with record_updates set.')
+    parser.add_argument(
+        '--speed',
+        type=parse_speed,
+        default=1,
+        help='Factor by which the recorded traffic is sped up, e.g. 10 for ten times the '
+        'recorded rate. With 0 or max, the updates are put into the update queue as fast as '
+        'possible. Defaults to 1, i.e. real time.',
+    )
+    add_environment_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def sending_users(path: str) -> Set[int]:
+    """
+    Args:
+        path: Path of the log.
+
+    Returns:
+        The IDs of the users that sent updates in the log.
+
+    """
+    user_ids = set()
+    for _, data in read_log(path):
+        for value in data.values():
+            if isinstance(value, dict) and isinstance(value.get('from'), dict):
+                user_ids.add(value['from']['id'])
+    return user_ids
+
+
+def replay(
+    environment: BenchmarkEnvironment, records: Iterable[Tuple[float, UpdateData]], speed: float
+) -> WorkloadResult:
+    """
+    Puts recorded updates into the update queue with the recorded spacing divided by ``speed``.
+    The updates are put into the queue on schedule, regardless of how long processing the
+    previous ones takes, such that bursts hit the bot just like in production.
+
+    Args:
+        environment: The running environment.
+        records: The time each update arrived at and the update.
+        speed: Factor by which the recorded traffic is sped up. ``0`` means as fast as possible.
+
+    Returns:
+        The measurements.
+
+    """
+    yourls_requests = environment.yourls.request_count
+    telegram_requests = environment.telegram.request_count
+    errors = environment.errors
+    pending = []
+    first = None
+    start = time.perf_counter()
+    for timestamp, data in records:
+        if first is None:
+            first = timestamp
+        if speed:
+            delay = start + (timestamp - first) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        pending.append(environment.submit(data))
+    latencies = [update.wait() for update in pending]
+    duration = time.perf_counter() - start
+
+    return WorkloadResult(
+        'replay',
+        latencies,
+        duration,
+        yourls_requests=environment.yourls.request_count - yourls_requests,
+        telegram_requests=environment.telegram.request_count - telegram_requests,
+        errors=environment.errors - errors,
+    )
+
+
+def main(argv: Sequence[str] = None) -> None:
+    """
+    Replays the log.
+
+    Args:
+        argv: Optional. The command line arguments. Defaults to :attr:`sys.argv`.
+
+    """
+    args = parse_args(argv)
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING
+    )
+
+    with build_environment(args) as environment:
+        # The users in the log are pseudonyms and hence unknown to the bot
+        environment.authorize(sending_users(args.log))
+        result = replay(environment, read_log(args.log), args.speed)
+
+    print(format_results([result]))
+    if args.json:
+        write_json(args.json, [result])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The script that runs the end-to-end benchmarks. Run it from the directory containing ``main.py``
+via ``python -m benchmarks.run``. See ``python -m benchmarks.run --help`` for the options.
+"""
+import argparse
+import json
+import logging
+from typing import List, Sequence
+
+from benchmarks.harness import BenchmarkEnvironment, WorkloadResult, run_workload
+from benchmarks.workloads import WORKLOADS
+
+
+def add_environment_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options for setting up the :class:`benchmarks.harness.BenchmarkEnvironment`.
+
+    Args:
+        parser: The parser.
+
+    """
+    parser.add_argument(
+        '--workers', type=int, default=4, help='Number of worker threads of the dispatcher.'
+    )
+    parser.add_argument(
+        '--yourls-latency',
+        type=float,
+        default=0.02,
+        help='Latency of the fake YOURLS instance in seconds.',
+    )
+    parser.add_argument(
+        '--telegram-latency',
+        type=float,
+        default=0.02,
+        help='Latency of the fake Telegram server in seconds.',
+    )
+    parser.add_argument(
+        '--catalog-size',
+        type=int,
+        default=10000,
+        help='Number of links stored on the fake YOURLS instance initially.',
+    )
+    parser.add_argument(
+        '--cache-timeout',
+        type=int,
+        default=300,
+        help='Number of seconds the cached statistics of the YOURLS instance are used.',
+    )
+    parser.add_argument(
+        '--shorten-concurrency',
+        type=int,
+        default=4,
+        help='Maximum number of links of one message that are shortened concurrently.',
+    )
+    parser.add_argument(
+        '--deferred-inline', action='store_true', help='Use the deferred inline mode.'
+    )
+    parser.add_argument(
+        '--flood-limits',
+        action='store_true',
+        help='Let outgoing messages obey the flood limits of Telegram.',
+    )
+    parser.add_argument(
+        '--no-persistence', action='store_true', help='Run the bot without persistence.'
+    )
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to FILE.')
+
+
+def build_environment(args: argparse.Namespace, users: int = 0) -> BenchmarkEnvironment:
+    """
+    Args:
+        args: The arguments parsed by a parser set up with :meth:`add_environment_arguments`.
+        users: Optional. Number of simulated users. Defaults to ``0``.
+
+    Returns:
+        The environment, not yet started.
+
+    """
+    return BenchmarkEnvironment(
+        workers=args.workers,
+        users=users,
+        yourls_latency=args.yourls_latency,
+        telegram_latency=args.telegram_latency,
+        catalog_size=args.catalog_size,
+        cache_timeout=args.cache_timeout,
+        deferred_inline=args.deferred_inline,
+        flood_limits=args.flood_limits,
+        persistence=not args.no_persistence,
+        shorten_concurrency=args.shorten_concurrency,
+    )
+
+
+def write_json(path: str, results: List[WorkloadResult]) -> None:
+    """
+    Args:
+        path: Path of the file.
+        results: The results to write to the file.
+
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump([result.as_dict() for result in results], file, indent=2)
+
+
+def parse_args(argv: Sequence[str] = None) -> argparse.Namespace:
+    """
+    Args:
+        argv: Optional. The command line arguments. Defaults to :attr:`sys.argv`.
+
+    Returns:
+        The parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Runs the bot against local fake Telegram and YOURLS servers and reports '
+        'throughput, latencies and backend calls per update for each workload.'
+    )
+    parser.add_argument(
+        '--workload',
+        action='append',
+        choices=sorted(WORKLOADS),
+        help='Workload to run. May be passed multiple times. Defaults to all workloads.',
+    )
+    parser.add_argument('--users', type=int, default=10, help='Number of simulated users.')
+    parser.add_argument(
+        '--rounds', type=int, default=20, help='How often each user runs a workload.'
+    )
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=1,
+        help='Rounds each user runs a workload before the measurements start.',
+    )
+    add_environment_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def format_results(results: List[WorkloadResult]) -> str:
+    """
+    Args:
+        results: The results of the workloads.
+
+    Returns:
+        The results as table.
+
+    """
+    lines = [
+        f'{"workload":<16}{"updates":>8}{"updates/s":>11}{"p50 ms":>9}{"p99 ms":>9}'
+        f'{"YOURLS/upd":>12}{"Telegram/upd":>14}{"errors":>8}'
+    ]
+    for result in results:
+        row = result.as_dict()
+        lines.append(
+            f'{row["workload"]:<16}{row["updates"]:>8}{row["throughput"]:>11.1f}'
+            f'{row["p50_ms"]:>9.1f}{row["p99_ms"]:>9.1f}{row["yourls_per_update"]:>12.2f}'
+            f'{row["telegram_per_update"]:>14.2f}{row["errors"]:>8}'
+        )
+    return '\n'.join(lines)
+
+
+def main(argv: Sequence[str] = None) -> None:
+    """
+    Runs the benchmarks.
+
+    Args:
+        argv: Optional. The command line arguments. Defaults to :attr:`sys.argv`.
+
+    """
+    args = parse_args(argv)
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING
+    )
+
+    results = []
+    with build_environment(args, args.users) as environment:
+        for name in args.workload or WORKLOADS:
+            if args.warmup:
+                run_workload(environment, name, args.warmup)
+            results.append(run_workload(environment, name, args.rounds))
+
+    print(format_results(results))
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module contains the workloads of the end-to-end benchmarks. A workload is a script that
+yields the updates one user sends, one after another. The next update is only requested once the
+previous one was processed, so scripts can react to the answers of the bot.
+"""
+import re
+import time
+from itertools import count
+from typing import Any, Callable, Dict, Iterator, List
+
+from benchmarks.fake_servers import FakeTelegramServer, FakeYOURLSServer
+
+UpdateData = Dict[str, Any]
+Script = Callable[['Session'], Iterator[UpdateData]]
+
+INLINE_STEP = 6
+""":obj:`int`: Number of characters typed between two inline queries of :meth:`inline`."""
+
+
+class Session:
+    """
+    A simulated user, which builds the updates for the workloads.
+
+    Args:
+        user_id: The ID of the user. The user chats with the bot in a private chat.
+        yourls: The fake YOURLS instance.
+        telegram: The fake Telegram server.
+
+    Attributes:
+        user_id: The ID of the user.
+        user: The user as sent by Telegram.
+        yourls: The fake YOURLS instance.
+        telegram: The fake Telegram server.
+
+    """
+
+    def __init__(
+        self, user_id: int, yourls: FakeYOURLSServer, telegram: FakeTelegramServer
+    ) -> None:
+        self.user_id = user_id
+        self.user = {
+            'id': user_id,
+            'is_bot': False,
+            'first_name': 'User',
+            'last_name': str(user_id),
+        }
+        self.yourls = yourls
+        self.telegram = telegram
+        self._ids = count()
+
+    def next_id(self) -> int:
+        """Gives a number that is unique for this session, e.g. to build distinct URLs."""
+        return next(self._ids)
+
+    def message(self, text: str) -> UpdateData:
+        """
+        Args:
+            text: The text of the message. Commands at the start and URLs are marked by entities
+                like Telegram does.
+
+        Returns:
+            An update with a message in the private chat of the user.
+
+        """
+        entities: List[Dict[str, Any]] = []
+        command = re.match(r'/\w+', text)
+        if command:
+            entities.append({'type': 'bot_command', 'offset': 0, 'length': command.end()})
+        for url in re.finditer(r'https?://\S+', text):
+            entities.append({'type': 'url', 'offset': url.start(), 'length': len(url.group())})
+        return {
+            'message': {
+                'message_id': self.next_id(),
+                'date': int(time.time()),
+                'chat': {'id': self.user_id, 'type': 'private', 'first_name': 'User'},
+                'from': self.user,
+                'text': text,
+                'entities': entities,
+            }
+        }
+
+    def inline_query(self, query: str) -> UpdateData:
+        """
+        Args:
+            query: The text of the query.
+
+        Returns:
+            An update with an inline query of the user.
+
+        """
+        return {
+            'inline_query': {
+                'id': f'{self.user_id}-{self.next_id()}',
+                'from': self.user,
+                'query': query,
+                'offset': '',
+            }
+        }
+
+    def chosen_inline_result(self, result_id: str, query: str) -> UpdateData:
+        """
+        Args:
+            result_id: The ID of the chosen result.
+            query: The text of the query.
+
+        Returns:
+            An update with the result the user chose in inline mode.
+
+        """
+        return {
+            'chosen_inline_result': {
+                'result_id': result_id,
+                'from': self.user,
+                'query': query,
+                'inline_message_id': f'inline-{self.user_id}-{self.next_id()}',
+            }
+        }
+
+
+def shorten(session: Session) -> Iterator[UpdateData]:
+    """A message with a single new link."""
+    yield session.message(
+        f'Have a look at https://example.com/articles/{session.user_id}/{session.next_id()}'
+    )
+
+
+def multi_shorten(session: Session) -> Iterator[UpdateData]:
+    """A message with four new links, a duplicate and a link that was shortened before."""
+    links = [
+        f'https://example.com/multi/{session.user_id}/{session.next_id()}' for _ in range(4)
+    ]
+    links += [links[0], f'https://example.com/catalog/{session.next_id()}']
+    yield session.message('Links:\n' + '\n'.join(links))
+
+
+def keyword_shorten(session: Session) -> Iterator[UpdateData]:
+    """A message with a link and the keyword for it."""
+    number = session.next_id()
+    yield session.message(
+        f'https://example.com/keyword/{session.user_id}/{number} kw{session.user_id}x{number}'
+    )
+
+
+def inline(session: Session) -> Iterator[UpdateData]:
+    """
+    Types a link and a keyword in inline mode, which gives one inline query every
+    :attr:`INLINE_STEP` characters, and chooses the result of the last query.
+    """
+    number = session.next_id()
+    text = f'https://example.com/inline/{session.user_id}/{number} in{session.user_id}x{number}'
+    query_id = ''
+    for end in [*range(INLINE_STEP, len(text), INLINE_STEP), len(text)]:
+        update = session.inline_query(text[:end])
+        query_id = update['inline_query']['id']
+        yield update
+
+    results = session.telegram.inline_results(query_id)
+    if results:
+        yield session.chosen_inline_result(results[0]['id'], text)
+
+
+def delete_url(session: Session) -> Iterator[UpdateData]:
+    """The conversation for deleting a short URL."""
+    yield session.message('/delete_url')
+    yield session.message(session.yourls.take_keyword())
+
+
+def change_url(session: Session) -> Iterator[UpdateData]:
+    """The conversation for changing the long URL of a short URL."""
+    yield session.message('/change_url')
+    yield session.message(f'{session.yourls.url}/{session.yourls.take_keyword()}')
+    yield session.message(f'https://example.com/changed/{session.user_id}/{session.next_id()}')
+
+
+def change_keyword(session: Session) -> Iterator[UpdateData]:
+    """The conversation for changing the keyword of a short URL."""
+    yield session.message('/change_keyword')
+    yield session.message(session.yourls.take_keyword())
+    yield session.message(f'ck{session.user_id}x{session.next_id()}')
+
+
+def add_kick_user(session: Session) -> Iterator[UpdateData]:
+    """The conversations for adding a user and kicking the user again."""
+    user_id = str(10 ** 9 + session.user_id * 10 ** 4 + session.next_id())
+    yield session.message('/add_user')
+    yield session.message(user_id)
+    yield session.message('/kick_user')
+    yield session.inline_query('')
+    yield session.inline_query(user_id)
+    yield session.chosen_inline_result(user_id, user_id)
+
+
+WORKLOADS: Dict[str, Script] = {
+    'shorten': shorten,
+    'multi_shorten': multi_shorten,
+    'keyword_shorten': keyword_shorten,
+    'inline': inline,
+    'delete_url': delete_url,
+    'change_url': change_url,
+    'change_keyword': change_keyword,
+    'add_kick_user': add_kick_user,
+}
+""":obj:`dict`: The workloads by name."""
+ADMIN_WORKLOADS = {'add_kick_user'}
+""":obj:`set`: Names of the workloads that only admins can run. They are run by the admin only,
+while the other workloads are run by all simulated users concurrently."""
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains an asyncio based client for the YOURLS API."""
+import asyncio
+import time
+from threading import Lock, Thread
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+from yourls import YOURLSAPIMixin, ShortenedURL
+from yourls.data import _validate_yourls_response
+from yourls.extensions import YOURLSDeleteMixin, YOURLSEditUrlMixin
+
+from bot.circuit_breaker import CircuitBreaker
+from bot.tracing import span
+from bot.utils import EndpointLatency, LatencyMixin, build_params
+
+RT = TypeVar('RT')
+
+
+class _RequestNeeded(Exception):
+    def __init__(self, params: Dict[str, Any]) -> None:
+        super().__init__()
+        self.params = params
+
+
+class _Replay(YOURLSAPIMixin, YOURLSDeleteMixin, YOURLSEditUrlMixin):
+    """
+    Runs the methods of the synchronous mixins without doing any I/O. If no response is given,
+    the request the method wants to make is raised as :class:`_RequestNeeded`. Otherwise, the
+    response is handed to the method, which then builds its result just like for
+    :class:`bot.utils.YOURLSClient`.
+    """
+
+    def __init__(self, response: Dict[str, Any] = None) -> None:
+        self._response = response
+
+    def _api_request(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self._response is None:
+            raise _RequestNeeded(params)
+        return self._response
+
+
+class AsyncYOURLSClient(LatencyMixin):
+    """
+    Asyncio based client for the YOURLS API with the same operations, results and exceptions as
+    :class:`bot.utils.YOURLSClient`. All requests share one pooled :class:`aiohttp.ClientSession`.
+    Errors of the connection are raised as the corresponding
+    :class:`requests.RequestException`, such that the exceptions don't depend on the client.
+
+    The coroutines of this client must be run on its event loop, which runs in a separate
+    thread. Use :meth:`run` to do so from synchronous code:
+
+    .. code:: python
+
+        results = client.run(client.gather(*(client.shorten(url) for url in urls), limit=4))
+
+    Args:
+        apiurl: URL of the YOURLS API.
+        signature: Optional. The signature for the YOURLS API.
+        nonce_life: Optional. Whether to use a time limited signature. Defaults to :obj:`False`.
+        pool_size: Optional. Maximum number of concurrent connections. Defaults to ``16``.
+        connect_timeout: Optional. Timeout in seconds for establishing a connection. Defaults to
+            ``5``.
+        read_timeout: Optional. Timeout in seconds for receiving a response. Defaults to ``30``.
+        circuit_breaker: Optional. Circuit breaker guarding the requests.
+
+    Attributes:
+        apiurl: URL of the YOURLS API.
+
+    """
+
+    def __init__(
+        self,
+        apiurl: str,
+        signature: str = None,
+        nonce_life: bool = False,
+        pool_size: int = 16,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        circuit_breaker: CircuitBreaker = None,
+    ) -> None:
+        self.apiurl = apiurl
+        self._signature = signature
+        self._nonce_life = nonce_life
+        self._pool_size = pool_size
+        self.circuit_breaker = circuit_breaker
+        self._timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = Lock()
+        self._latency_lock = Lock()
+        self._latencies: Dict[str, EndpointLatency] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop of this client. Started on first access."""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                Thread(target=loop.run_forever, name='async_yourls', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coroutine: Awaitable[RT]) -> RT:
+        """
+        Runs a coroutine on the event loop of this client and waits for the result. Must not be
+        called from within the event loop.
+
+        Args:
+            coroutine: The coroutine.
+
+        Returns:
+            The result of the coroutine.
+
+        """
+        with span('yourls.async'):
+            future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)  # type: ignore
+            return future.result()
+
+    def close(self) -> None:
+        """Closes the connections and stops the event loop, if it was started."""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+
+    @staticmethod
+    async def gather(
+        *coroutines: Awaitable[RT], limit: int = None
+    ) -> List[Union[RT, BaseException]]:
+        """
+        Runs coroutines concurrently. Other than :func:`asyncio.gather`, exceptions are returned
+        in place of the result, such that one failing request doesn't affect the others.
+
+        Args:
+            *coroutines: The coroutines, e.g. ``client.shorten(url)``.
+            limit: Optional. Maximum number of coroutines running at the same time. By default,
+                all are started at once and only the connection pool limits the concurrency.
+
+        Returns:
+            The results and exceptions in the order of the coroutines.
+
+        """
+        if limit is None:
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+
+        semaphore = asyncio.Semaphore(limit)
+
+        async def limited(coroutine: Awaitable[RT]) -> RT:
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*map(limited, coroutines), return_exceptions=True)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily, as the session must be created within the event loop
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size),
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def _api_request(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        params = build_params(params, self._signature, self._nonce_life)
+        action = params.get('action', 'unknown')
+        # aiohttp neither drops None values nor converts numbers like requests does
+        query = {key: str(value) for key, value in params.items() if value is not None}
+        with self._guard():
+            start = time.perf_counter()
+            failed = True
+            try:
+                try:
+                    async with self._get_session().get(self.apiurl, params=query) as aio_response:
+                        response = requests.Response()
+                        response.status_code = aio_response.status
+                        response.reason = aio_response.reason or ''
+                        response.url = str(aio_response.url)
+                        response.headers = CaseInsensitiveDict(aio_response.headers)
+                        # pylint: disable=W0212
+                        response._content = await aio_response.read()
+                        response.encoding = aio_response.get_encoding()
+                except asyncio.TimeoutError as exc:
+                    raise requests.Timeout(str(exc)) from exc
+                except aiohttp.ClientConnectionError as exc:
+                    raise requests.ConnectionError(str(exc)) from exc
+                except aiohttp.ClientError as exc:
+                    raise requests.RequestException(str(exc)) from exc
+                json_data = _validate_yourls_response(response, params)
+                failed = False
+                return json_data
+            finally:
+                self._record_latency(action, time.perf_counter() - start, failed)
+
+    async def _call(self, method: Callable[..., RT], *args: Any, **kwargs: Any) -> RT:
+        # The synchronous mixins build the request and parse the response, so that results and
+        # exceptions are exactly the same as for the synchronous client
+        try:
+            return method(_Replay(), *args, **kwargs)
+        except _RequestNeeded as exc:
+            params = exc.params
+        # Outside of the except block, such that errors aren't chained to _RequestNeeded
+        response = await self._api_request(params)
+        return method(_Replay(response), *args, **kwargs)
+
+    async def shorten(self, url: str, keyword: str = None, title: str = None) -> ShortenedURL:
+        """Asynchronous version of :meth:`yourls.core.YOURLSAPIMixin.shorten`."""
+        return await self._call(YOURLSAPIMixin.shorten, url, keyword=keyword, title=title)
+
+    async def expand(self, short: str) -> str:
+        """Asynchronous version of :meth:`yourls.core.YOURLSAPIMixin.expand`."""
+        return await self._call(YOURLSAPIMixin.expand, short)
+
+    async def stats(
+        self, filter: str, limit: int, start: int = None  # pylint: disable=W0622
+    ) -> Tuple[List[ShortenedURL], Any]:
+        """Asynchronous version of :meth:`yourls.core.YOURLSAPIMixin.stats`."""
+        return await self._call(YOURLSAPIMixin.stats, filter, limit, start=start)
+
+    async def update(self, *args: Any, **kwargs: Any) -> Any:
+        """Asynchronous version of :meth:`yourls.extensions.YOURLSEditUrlMixin.update`."""
+        return await self._call(YOURLSEditUrlMixin.update, *args, **kwargs)
+
+    async def change_keyword(self, *args: Any, **kwargs: Any) -> Any:
+        """
+        Asynchronous version of :meth:`yourls.extensions.YOURLSEditUrlMixin.change_keyword`.
+        """
+        return await self._call(YOURLSEditUrlMixin.change_keyword, *args, **kwargs)
+
+    async def delete(self, *args: Any, **kwargs: Any) -> Any:
+        """Asynchronous version of :meth:`yourls.extensions.YOURLSDeleteMixin.delete`."""
+        return await self._call(YOURLSDeleteMixin.delete, *args, **kwargs)
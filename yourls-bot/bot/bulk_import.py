@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains the bulk import of links from CSV and text files."""
+import asyncio
+import csv
+import html
+import io
+import logging
+import tempfile
+import time
+from itertools import islice
+from typing import IO, Awaitable, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union, cast
+
+import requests
+from telegram import Update
+from telegram.ext import CallbackContext
+from yourls import (
+    ShortenedURL,
+    YOURLSKeywordExistsError,
+    YOURLSNoLoopError,
+    YOURLSNoURLError,
+    YOURLSURLExistsError,
+)
+
+from bot.circuit_breaker import BackendUnavailableError
+from bot.message_queue import TokenBucket
+from bot.services import get_services
+from bot.utils import get_stats_cache, sanitize_protocol
+
+logger = logging.getLogger(__name__)
+
+RT = TypeVar('RT')
+
+MAX_FILE_SIZE = 20 * 1024 * 1024
+""":obj:`int`: Maximum size in bytes of files bots can download from Telegram."""
+BATCH_SIZE = 50
+""":obj:`int`: Number of rows read from the file and shortened at a time."""
+PROGRESS_INTERVAL = 5
+""":obj:`int`: Minimum number of seconds between two edits of the progress message."""
+DOWNLOAD_TIMEOUT = 30
+""":obj:`int`: Timeout in seconds for connecting to Telegram and receiving data of the file."""
+RESULT_HEADER = ('line', 'url', 'keyword', 'short_url', 'error')
+""":obj:`tuple`: The columns of the results file."""
+UNAVAILABLE_ERROR = 'The YOURLS instance is unavailable.'
+""":obj:`str`: Error in the results file for rows that failed because the circuit was open."""
+
+Row = Tuple[int, str, Optional[str]]
+"""Line number, URL and optional keyword of a row of the imported file."""
+ParsedRow = Union[Row, Tuple[int, str]]
+"""A :obj:`Row` or the line number and a description of the error of a malformed row."""
+
+_EXPECTED_ERRORS = (YOURLSKeywordExistsError, YOURLSNoURLError, YOURLSNoLoopError)
+
+
+def parse_rows(stream: IO[str], csv_format: bool) -> Iterator[ParsedRow]:
+    """
+    Lazily parses the rows of an imported file. Empty lines are skipped. In CSV files, the first
+    column holds the URL and the optional second column the keyword. A first row starting with
+    ``url`` is treated as header. In text files, each line holds a URL, optionally followed by a
+    keyword, separated by whitespace.
+
+    Args:
+        stream: The contents of the file.
+        csv_format: Whether the file is a CSV file.
+
+    Yields:
+        The line number, the URL and the keyword or :obj:`None` for each row. For malformed rows,
+        the line number and a description of the error.
+
+    """
+    if csv_format:
+        reader = csv.reader(stream)
+        for cells in reader:
+            cells = [cell.strip() for cell in cells]
+            if not any(cells):
+                continue
+            if reader.line_num == 1 and cells[0].lower() == 'url':
+                continue
+            if not cells[0]:
+                yield reader.line_num, 'The URL is missing.'
+            else:
+                yield reader.line_num, cells[0], (cells[1] if len(cells) > 1 else '') or None
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        words = line.split()
+        if not words:
+            continue
+        if len(words) > 2:
+            yield line_number, 'Expected a URL and optionally a keyword.'
+        else:
+            yield line_number, words[0], words[1] if len(words) > 1 else None
+
+
+async def _rate_limited(bucket: TokenBucket, coroutine: Awaitable[RT]) -> RT:
+    # Runs on the event loop of the AsyncYOURLSClient only, so there are no races on the bucket
+    delay = bucket.delay(time.monotonic())
+    while delay:
+        await asyncio.sleep(delay)
+        delay = bucket.delay(time.monotonic())
+    bucket.consume()
+    return await coroutine
+
+
+def _describe_error(exc: BaseException) -> str:
+    if isinstance(exc, BackendUnavailableError):
+        return UNAVAILABLE_ERROR
+    if isinstance(exc, YOURLSKeywordExistsError):
+        return 'The keyword is already in use.'
+    if isinstance(exc, _EXPECTED_ERRORS):
+        return 'The URL can not be shortened.'
+    return 'Shortening failed.'
+
+
+def shorten_rows(context: CallbackContext, rows: List[ParsedRow]) -> List[Tuple[str, ...]]:
+    """
+    Shortens the rows of an imported file concurrently, at most
+    :attr:`bot.services.Services.shorten_concurrency` at a time and within the rate budget of
+    :attr:`bot.services.Services.bulk_import_bucket`, which is shared by all running imports.
+    Like :meth:`bot.simple_commands.shorten`, existing short URLs are reused for rows without
+    keyword.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+        rows: Rows as given by :meth:`parse_rows`.
+
+    Returns:
+        The results as rows of the results file, in the order of ``rows``.
+
+    """
+    services = get_services(context)
+    async_yourls = services.async_yourls
+    bucket = services.bulk_import_bucket
+    stats_cache = get_stats_cache(context)
+
+    results: List[Union[ShortenedURL, BaseException, None]] = []
+    missing = []
+    for row in rows:
+        if len(row) == 2:
+            results.append(None)
+            continue
+        url, keyword = sanitize_protocol(row[1]), row[2]
+        existing = None if keyword else stats_cache.find_url(url)
+        results.append(existing)
+        if existing is None:
+            missing.append((len(results) - 1, url, keyword))
+
+    created = async_yourls.run(
+        async_yourls.gather(
+            *(
+                _rate_limited(bucket, async_yourls.shorten(url, keyword=keyword))
+                for _, url, keyword in missing
+            ),
+            limit=services.shorten_concurrency,
+        )
+    )
+    for (index, url, _), result in zip(missing, created):
+        if isinstance(result, YOURLSURLExistsError):
+            result = result.url
+        if isinstance(result, ShortenedURL):
+            stats_cache.add(result)
+        elif not isinstance(result, (BackendUnavailableError,) + _EXPECTED_ERRORS):
+            logger.error('Shortening %s failed.', url, exc_info=result)
+        results[index] = result
+
+    lines = []
+    for row, result in zip(rows, results):
+        if len(row) == 2:
+            lines.append((str(row[0]), '', '', '', row[1]))
+            continue
+        line_number, url, keyword = cast(Row, row)
+        if isinstance(result, ShortenedURL):
+            lines.append((str(line_number), url, keyword or '', result.shorturl, ''))
+        else:
+            error = _describe_error(cast(BaseException, result))
+            lines.append((str(line_number), url, keyword or '', '', error))
+    return lines
+
+
+def _batches(rows: Iterable[RT], size: int) -> Iterator[List[RT]]:
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_import(update: Update, context: CallbackContext) -> None:
+    """
+    Shortens all links of an uploaded CSV or text file, see :meth:`parse_rows` for the format.
+    The file is downloaded as a stream and processed in batches of :attr:`BATCH_SIZE` rows,
+    which are shortened by :meth:`shorten_rows`, such that large files are never held in memory.
+    A progress message is edited at most every :attr:`PROGRESS_INTERVAL` seconds. Finally, the
+    results are sent as CSV file, which lists the short URL or the error for each row. If the
+    YOURLS instance becomes unavailable, the import is aborted and the results so far are sent.
+
+    Args:
+        update: The incoming update containing the file.
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+    """
+    message = update.effective_message
+    document = message.document
+    file_name = html.escape(document.file_name or 'file')
+    if document.file_size and document.file_size > MAX_FILE_SIZE:
+        message.reply_text(f'<code>{file_name}</code> is too large. Files may have at most 20 MB.')
+        return
+
+    progress = message.reply_text(f'Importing <code>{file_name}</code> …')
+    csv_format = (document.file_name or '').lower().endswith('.csv') or (
+        document.mime_type == 'text/csv'
+    )
+    processed = failed = 0
+    aborted = False
+    last_progress = time.monotonic()
+    file_path = context.bot.get_file(document.file_id).file_path
+
+    with tempfile.TemporaryFile() as results_file:
+        results_text = io.TextIOWrapper(results_file, encoding='utf-8', newline='')
+        writer = csv.writer(results_text)
+        writer.writerow(RESULT_HEADER)
+
+        with requests.get(file_path, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            # Otherwise, the wrapper considers the stream closed once the body was read
+            response.raw.auto_close = False
+            stream = io.TextIOWrapper(
+                cast(IO[bytes], response.raw), encoding='utf-8-sig', errors='replace', newline=''
+            )
+            for batch in _batches(parse_rows(stream, csv_format), BATCH_SIZE):
+                results = shorten_rows(context, batch)
+                writer.writerows(results)
+                processed += len(results)
+                failed += sum(1 for result in results if result[-1])
+                if any(result[-1] == UNAVAILABLE_ERROR for result in results):
+                    aborted = True
+                    break
+
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    progress.edit_text(
+                        f'Importing <code>{file_name}</code> …\n\n'
+                        f'{processed} rows processed, {failed} failed.'
+                    )
+
+        if aborted:
+            summary = (
+                f'Import of <code>{file_name}</code> aborted after {processed} rows, as the '
+                f'YOURLS instance is unavailable. Please try the remaining rows again later.'
+            )
+        else:
+            summary = (
+                f'Import of <code>{file_name}</code> finished. {processed - failed} short URLs '
+                f'created, {failed} rows failed.'
+            )
+        progress.edit_text(summary)
+
+        results_text.flush()
+        results_file.seek(0)
+        message.reply_document(
+            document=results_file,
+            filename=f'{(document.file_name or "file").rsplit(".", 1)[0]}_results.csv',
+        )
+        results_text.detach()
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 """This module provides a conversation allowing to change a short URLs keyword and the
 corresponding handler callbacks."""
+
 from ptbcontrib.roles import RolesHandler, Role
 from telegram import Update
 from telegram.ext import (
@@ -14,8 +15,16 @@ from telegram.ext import (
 )
 from yourls.exceptions import YOURLSAPIError
 
-from bot.utils import extract_keyword, cancel_button, abort, delete_keyboard, cancel_keyboard
-from .constants import DELETE_KEYBOARD_KEY, YOURLS_KEY, CHANGE_KEYWORD_KEY
+from bot.services import get_services
+from bot.utils import (
+    extract_keyword,
+    cancel_button,
+    abort,
+    delete_keyboard,
+    cancel_keyboard,
+    keyword_exists,
+)
+from .constants import DELETE_KEYBOARD_KEY, CHANGE_KEYWORD_KEY
 
 GET_KEYWORD_STATE = 'get keyword'
 CHANGE_KEYWORD_STATE = 'change keyword'
@@ -55,13 +64,10 @@ def get_keyword(update: Update, context: CallbackContext) -> str:
         The next state.
 
     """
-    yourls = context.bot_data[YOURLS_KEY]
     keyword = extract_keyword(update.effective_message.text)
     delete_keyboard(context)
 
-    try:
-        yourls.expand(keyword)
-    except YOURLSAPIError:
+    if not keyword_exists(context, keyword):
         message = update.effective_message.reply_text(
             f'The keyword »<code>{keyword}</code>« does not exist. Maybe a typo?',
             reply_markup=CANCEL_KEYBOARD,
@@ -91,13 +97,16 @@ def change_keyword(update: Update, context: CallbackContext) -> int:
 
     """
     delete_keyboard(context)
-    yourls = context.bot_data[YOURLS_KEY]
+    yourls = get_services(context).yourls
     yourls_url = yourls.url
     keyword = context.user_data[CHANGE_KEYWORD_KEY]
     new_keyword = extract_keyword(update.effective_message.text)
 
     try:
         yourls.change_keyword(newshorturl=new_keyword, oldshorturl=keyword, title='auto')
+        get_services(context).stats_cache.rename(
+            keyword, new_keyword, f'{yourls_url}/{new_keyword}'
+        )
         update.effective_message.reply_text(
             f'All done. The new short URL is: {yourls_url}/{new_keyword}.'
         )
@@ -14,7 +14,8 @@ from telegram.ext import (
 )
 from yourls.exceptions import YOURLSAPIError
 
-from bot.constants import YOURLS_KEY, DELETE_KEYBOARD_KEY, CHANGE_URL_KEY
+from bot.constants import DELETE_KEYBOARD_KEY, CHANGE_URL_KEY
+from bot.services import get_services
 from bot.utils import (
     extract_keyword,
     cancel_button,
@@ -22,6 +23,7 @@ from bot.utils import (
     delete_keyboard,
     sanitize_protocol,
     cancel_keyboard,
+    keyword_exists,
 )
 
 GET_KEYWORD_STATE = 'get keyword'
@@ -63,13 +65,10 @@ def get_keyword(update: Update, context: CallbackContext) -> str:
         The next state.
 
     """
-    yourls = context.bot_data[YOURLS_KEY]
     keyword = extract_keyword(update.effective_message.text)
     delete_keyboard(context)
 
-    try:
-        yourls.expand(keyword)
-    except YOURLSAPIError:
+    if not keyword_exists(context, keyword):
         message = update.effective_message.reply_text(
             f'The keyword »<code>{keyword}</code>« does not exist. Maybe a typo?',
             reply_markup=CANCEL_KEYBOARD,
@@ -99,12 +98,13 @@ def change_url(update: Update, context: CallbackContext) -> int:
 
     """
     delete_keyboard(context)
-    yourls = context.bot_data[YOURLS_KEY]
+    yourls = get_services(context).yourls
     keyword = context.user_data[CHANGE_URL_KEY]
     url = sanitize_protocol(update.effective_message.text)
 
     try:
         yourls.update(keyword, url, 'auto')
+        get_services(context).stats_cache.update_url(keyword, url)
         update.effective_message.reply_text('All done.')
     except YOURLSAPIError:
         update.effective_message.reply_text(
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a circuit breaker for the requests to the YOURLS instance."""
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Deque, Iterator, Optional, Tuple, cast
+
+import requests
+from ptbcontrib.roles import BOT_DATA_KEY, Roles
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from bot.message_queue import low_priority
+from bot.services import get_services
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+""":obj:`str`: State of the circuit breaker, in which requests are made as usual."""
+OPEN = 'open'
+""":obj:`str`: State of the circuit breaker, in which requests fail right away."""
+HALF_OPEN = 'half-open'
+""":obj:`str`: State of the circuit breaker, in which a single request probes the backend."""
+MIN_REQUESTS = 5
+""":obj:`int`: Minimum number of requests within the window before the circuit can open."""
+
+
+class BackendUnavailableError(Exception):
+    """
+    Raised instead of making a request to the YOURLS instance while the circuit is open.
+
+    Args:
+        retry_in: Number of seconds until the next request is allowed.
+
+    Attributes:
+        retry_in: Number of seconds until the next request is allowed.
+
+    """
+
+    def __init__(self, retry_in: float) -> None:
+        super().__init__(f'The YOURLS instance is unavailable. Retry in {retry_in:.0f} seconds.')
+        self.retry_in = retry_in
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """
+    Checks whether an exception indicates that the YOURLS instance is unavailable, i.e. whether
+    it's an error of the connection or a server error. Errors reported by the YOURLS API, e.g.
+    an occupied keyword, are not.
+
+    Args:
+        exc: The exception.
+
+    Returns:
+        Whether the exception is a failure of the backend.
+
+    """
+    if isinstance(exc, BackendUnavailableError):
+        return True
+    if isinstance(exc, requests.HTTPError):
+        response = exc.response
+        return response is None or response.status_code >= 500
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the requests to the YOURLS instance. Requests that fail according to
+    :meth:`is_backend_failure` or that take longer than :attr:`slow_call_duration` seconds are
+    counted as failures. If at least :attr:`failure_rate` of the requests within the last
+    :attr:`window` seconds failed, the circuit opens and requests raise
+    :class:`BackendUnavailableError` right away. After :attr:`open_duration` seconds, a single
+    request is let through as probe. If it succeeds, the circuit closes again. Otherwise it stays
+    open for another :attr:`open_duration` seconds.
+
+    Args:
+        failure_rate: Optional. Fraction of failed requests at which the circuit opens. Defaults
+            to ``0.5``.
+        window: Optional. Number of seconds the failure rate is computed for. Defaults to ``60``.
+        slow_call_duration: Optional. Duration in seconds from which on successful requests are
+            counted as failures. Defaults to ``10``.
+        open_duration: Optional. Number of seconds the circuit stays open. Defaults to ``30``.
+        listener: Optional. Called with the new state whenever the state changes.
+
+    Attributes:
+        failure_rate: Fraction of failed requests at which the circuit opens.
+        window: Number of seconds the failure rate is computed for.
+        slow_call_duration: Duration in seconds from which on requests are counted as failures.
+        open_duration: Number of seconds the circuit stays open.
+        listener: Called with the new state whenever the state changes.
+
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        window: float = 60,
+        slow_call_duration: float = 10,
+        open_duration: float = 30,
+        listener: Callable[[str], Any] = None,
+    ) -> None:
+        self.failure_rate = failure_rate
+        self.window = window
+        self.slow_call_duration = slow_call_duration
+        self.open_duration = open_duration
+        self.listener = listener
+        self._init_state()
+
+    def _init_state(self) -> None:
+        self._lock = Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._calls: Deque[Tuple[float, bool]] = deque()
+
+    @property
+    def state(self) -> str:
+        """The current state. One of :attr:`CLOSED`, :attr:`OPEN` and :attr:`HALF_OPEN`."""
+        with self._lock:
+            return self._state
+
+    def stats(self, now: float = None) -> Tuple[int, int]:
+        """
+        Args:
+            now: Optional. The current value of :meth:`time.monotonic`.
+
+        Returns:
+            The number of requests and failed requests within the window.
+
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            return len(self._calls), sum(failed for _, failed in self._calls)
+
+    def retry_in(self, now: float = None) -> float:
+        """
+        Args:
+            now: Optional. The current value of :meth:`time.monotonic`.
+
+        Returns:
+            The number of seconds until the next probe, if the circuit is open. ``0`` otherwise.
+
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(0.0, self._opened_at + self.open_duration - now)
+
+    def _expire(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def _set_state(self, state: str) -> Optional[str]:
+        if state == self._state:
+            return None
+        logger.warning(
+            'Circuit for the YOURLS instance changed from %s to %s.', self._state, state
+        )
+        self._state = state
+        return state
+
+    def _notify(self, state: Optional[str]) -> None:
+        if state is not None and self.listener is not None:
+            self.listener(state)
+
+    def before_request(self, now: float = None) -> None:
+        """
+        Checks whether a request may be made.
+
+        Args:
+            now: Optional. The current value of :meth:`time.monotonic`.
+
+        Raises:
+            BackendUnavailableError: If the circuit is open or another request is probing.
+
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            retry_in = self._opened_at + self.open_duration - now
+            if self._state == OPEN and retry_in <= 0:
+                changed = self._set_state(HALF_OPEN)
+                self._probing = True
+            elif self._state == HALF_OPEN and not self._probing:
+                changed = None
+                self._probing = True
+            else:
+                raise BackendUnavailableError(max(retry_in, 0))
+        self._notify(changed)
+
+    def record(self, duration: float, exc: Optional[BaseException], now: float = None) -> None:
+        """
+        Records the outcome of a request.
+
+        Args:
+            duration: Duration of the request in seconds.
+            exc: The exception raised by the request, if any.
+            now: Optional. The current value of :meth:`time.monotonic`.
+
+        """
+        now = time.monotonic() if now is None else now
+        failed = duration >= self.slow_call_duration or (
+            exc is not None and is_backend_failure(exc)
+        )
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                self._calls.clear()
+                if failed:
+                    self._opened_at = now
+                changed = self._set_state(OPEN if failed else CLOSED)
+            else:
+                self._calls.append((now, failed))
+                self._expire(now)
+                total = len(self._calls)
+                failures = sum(failed for _, failed in self._calls)
+                changed = None
+                if (
+                    self._state == CLOSED
+                    and total >= MIN_REQUESTS
+                    and failures >= self.failure_rate * total
+                ):
+                    self._opened_at = now
+                    changed = self._set_state(OPEN)
+        self._notify(changed)
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        Context manager around a request. Calls :meth:`before_request` on entering and
+        :meth:`record` on leaving.
+
+        Raises:
+            BackendUnavailableError: If the circuit is open.
+
+        """
+        self.before_request()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as exc:
+            self.record(time.perf_counter() - start, exc)
+            raise
+        self.record(time.perf_counter() - start, None)
+
+
+def report_state(context: CallbackContext) -> None:
+    """
+    Informs the admins about a change of the state of the :class:`CircuitBreaker`. The new state
+    is expected as ``context.job.context``. Meant to be used as job.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.JobQueue`.
+
+    """
+    state = context.job.context
+    if state == OPEN:
+        text = '🔴 The YOURLS instance is unavailable. Requests fail until it responds again.'
+    elif state == HALF_OPEN:
+        text = '🟡 Probing whether the YOURLS instance is available again.'
+    else:
+        text = '🟢 The YOURLS instance is available again.'
+
+    with low_priority():
+        for admin in cast(Roles, context.bot_data[BOT_DATA_KEY]).admins.chat_ids:
+            try:
+                context.bot.send_message(chat_id=admin, text=text)
+            except Exception:  # pylint: disable=W0703
+                logger.warning('Could not inform admin %d about the circuit.', admin)
+
+
+def backend_status(update: Update, context: CallbackContext) -> None:
+    """
+    Shows the state of the :class:`CircuitBreaker` and the latencies of the YOURLS instance.
+
+    Args:
+        update: The incoming Telegram update containing a message.
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+    """
+    services = get_services(context)
+    circuit_breaker = services.circuit_breaker
+    total, failures = circuit_breaker.stats()
+    lines = [
+        f'<b>Circuit:</b> {circuit_breaker.state}',
+        f'<b>Requests in the last {circuit_breaker.window:.0f} seconds:</b> {total}, '
+        f'{failures} failed',
+    ]
+    retry_in = circuit_breaker.retry_in()
+    if retry_in:
+        lines.append(f'<b>Next probe in:</b> {retry_in:.0f} seconds')
+
+    latencies = services.yourls.latencies()
+    if latencies:
+        lines.append('\n<b>Latencies:</b>')
+    for action, latency in sorted(latencies.items()):
+        lines.append(
+            f'<code>{action}</code>: {latency.count} requests, {latency.errors} failed, '
+            f'mean {latency.mean * 1000:.0f} ms, max {latency.maximum * 1000:.0f} ms'
+        )
+
+    update.effective_message.reply_text('\n'.join(lines))
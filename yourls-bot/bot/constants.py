@@ -18,12 +18,15 @@ EMPTY_SWITCH_PM_PARAMETER = 'empty_switch_pm'
 :obj:`str`: Use for the `switch_pm_parameter` of :meth:`telegram.bot.answer_inline_query` when you
     have to supply it but don't want to. Filter out in your callback.
 """
+UNAVAILABLE_SWITCH_PM_PARAMETER = 'unavailable_switch_pm'
+"""
+:obj:`str`: Use for the `switch_pm_parameter` of :meth:`telegram.bot.answer_inline_query` when the
+    YOURLS instance is unavailable.
+"""
 
 # Keys bot bot/chat/user_data
 DELETE_KEYBOARD_KEY = 'delete_keyboard_key'
 """:obj:`str`: Key for ``bot_data`` to store messages in for :meth:`bot.utils.delete_keyboard`."""
-YOURLS_KEY = 'yourls_key'
-""":obj:`str`: The key of ``bot_data`` where the :class:`bot.utils.YOURLSClient` is stored."""
 CHANGE_KEYWORD_KEY = 'change_keyword_old'
 """:obj:`str`: Key for ``bot_data`` to store temporary data for the conversation in
 :attr:`bot.change_keyword`."""
@@ -33,9 +36,11 @@ CHANGE_URL_KEY = 'change_url_old'
 TEMPORARY_KEYWORDS_KEY = 'temp_keywords'
 """:obj:`str`: Key for ``bot_data`` to store temporary keywords created by inline mode on the
 fly."""
-STATS_KEY = 'stats_key'
-""":obj:`str`: Key for ``bot_data`` to store statistics about the YOURLS instance in. Used for
-:meth:`bot.utils.get_cached_stats`."""
-CACHE_TIMEOUT_KEY = 'cache_timeout_key'
-""":obj:`str`: Key for ``bot_data`` to store cache timeout for statistics in. Used for
-:meth:`bot.utils.get_cached_stats`."""
+PENDING_INLINE_KEY = 'pending_inline'
+""":obj:`str`: Key for ``user_data`` to store the queries of the deferred inline mode in. Used for
+:meth:`bot.inline.inline_shorten`."""
+DELETION_QUEUE_KEY = 'deletion_queue_key'
+""":obj:`str`: Key for ``bot_data`` to store the :class:`bot.deletion_queue.DeletionQueue` in."""
+LAST_ACTIVITY_KEY = 'last_activity'
+""":obj:`str`: Key for ``user_data`` to store the time of the users latest update in. Used for
+:meth:`bot.janitor.clean_up`."""
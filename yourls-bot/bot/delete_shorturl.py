@@ -16,7 +16,8 @@ from telegram.ext import (
 )
 from yourls.extensions import YOURLSURLNotExistsError
 
-from bot.constants import DELETE_KEYBOARD_KEY, YOURLS_KEY
+from bot.constants import DELETE_KEYBOARD_KEY
+from bot.services import get_services
 from bot.utils import extract_keyword, cancel_button, abort, delete_keyboard, cancel_keyboard
 
 DELETE_STATE = 'delete'
@@ -56,11 +57,12 @@ def delete_url(update: Update, context: CallbackContext) -> Union[str, int]:
 
     """
     delete_keyboard(context)
-    yourls = context.bot_data[YOURLS_KEY]
+    yourls = get_services(context).yourls
     keyword = extract_keyword(update.effective_message.text)
 
     try:
         yourls.delete(keyword)
+        get_services(context).stats_cache.remove(keyword)
         update.effective_message.reply_text('Deletion successful.')
         return ConversationHandler.END
     except YOURLSURLNotExistsError:
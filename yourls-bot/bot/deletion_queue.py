@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a queue for deleting short URLs in the background."""
+import logging
+import time
+from threading import Lock
+from typing import Any, Dict, Iterable, List, cast
+
+from telegram.ext import CallbackContext
+from yourls.extensions import YOURLSURLNotExistsError
+
+from bot.constants import DELETION_QUEUE_KEY
+from bot.services import get_services
+from bot.utils import YOURLSClient
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 20
+""":obj:`int`: Maximum number of deletions per run of :meth:`process_deletion_queue`."""
+BASE_DELAY = 10
+""":obj:`int`: Delay in seconds before the first retry of a failed deletion. Doubles with every
+further attempt."""
+MAX_DELAY = 3600
+""":obj:`int`: Maximum delay in seconds between two attempts."""
+MAX_ATTEMPTS = 10
+""":obj:`int`: Number of attempts after which a deletion is given up."""
+
+
+class _Entry:  # pylint: disable=R0903
+    __slots__ = ('attempts', 'next_attempt')
+
+    def __init__(self, attempts: int = 0, next_attempt: float = 0) -> None:
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'attempts': self.attempts, 'next_attempt': self.next_attempt}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.attempts = state['attempts']
+        self.next_attempt = state['next_attempt']
+
+
+class DeletionQueue:
+    """
+    Queue of keywords whose short URLs are to be deleted. The queue is stored in ``bot_data`` and
+    hence survives restarts. It is processed in batches by :meth:`process_deletion_queue`. Failed
+    deletions are retried with exponential backoff and given up after :attr:`MAX_ATTEMPTS`
+    attempts. Those are counted in :attr:`dead_letters`.
+
+    Attributes:
+        dead_letters: Number of deletions that were given up.
+
+    """
+
+    def __init__(self) -> None:
+        self.dead_letters = 0
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'dead_letters': self.dead_letters, '_entries': self._entries.copy()}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, keywords: Iterable[str]) -> None:
+        """
+        Adds keywords to the queue.
+
+        Args:
+            keywords: The keywords.
+
+        """
+        with self._lock:
+            for keyword in keywords:
+                self._entries.setdefault(keyword, _Entry())
+
+    def process(self, yourls: YOURLSClient, now: float = None) -> List[str]:
+        """
+        Tries to delete the short URLs that are due, at most :attr:`BATCH_SIZE` at a time.
+
+        Args:
+            yourls: The client to delete the short URLs with.
+            now: Optional. The current timestamp. Defaults to :meth:`time.time`.
+
+        Returns:
+            The keywords of the successfully deleted short URLs.
+
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            due: List[str] = [
+                keyword for keyword, entry in self._entries.items() if entry.next_attempt <= now
+            ][:BATCH_SIZE]
+
+        deleted = []
+        for keyword in due:
+            try:
+                yourls.delete(keyword)
+            except YOURLSURLNotExistsError:
+                pass
+            except Exception as exc:  # pylint: disable=W0703
+                self._retry_later(keyword, now, exc)
+                continue
+
+            with self._lock:
+                self._entries.pop(keyword, None)
+            deleted.append(keyword)
+
+        return deleted
+
+    def _retry_later(self, keyword: str, now: float, exc: Exception) -> None:
+        with self._lock:
+            entry = self._entries[keyword]
+            entry.attempts += 1
+            if entry.attempts >= MAX_ATTEMPTS:
+                del self._entries[keyword]
+                self.dead_letters += 1
+                logger.warning(
+                    'Giving up deleting %s after %d attempts: %s', keyword, entry.attempts, exc
+                )
+                return
+            entry.next_attempt = now + min(BASE_DELAY * 2 ** (entry.attempts - 1), MAX_DELAY)
+
+
+def process_deletion_queue(context: CallbackContext) -> None:
+    """
+    Processes the :class:`DeletionQueue` stored at ``context.bot_data[DELETION_QUEUE_KEY]`` and
+    removes the deleted short URLs from the :attr:`bot.services.Services.stats_cache`, in case a
+    sync picked them up in the meantime. Meant to be used as repeating job.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.JobQueue`.
+
+    """
+    queue = cast(DeletionQueue, context.bot_data[DELETION_QUEUE_KEY])
+    if not queue:
+        return
+    services = get_services(context)
+    deleted = queue.process(services.yourls)
+    stats_cache = services.stats_cache
+    for keyword in deleted:
+        stats_cache.remove(keyword)
+    logger.debug('Deleted %d short URLs, %d are still queued.', len(deleted), len(queue))
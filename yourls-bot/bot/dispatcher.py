@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a dispatcher that processes updates of different users in parallel."""
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Any, Deque, Dict, Hashable, Optional, Union
+
+from telegram import Update, TelegramError
+from telegram.ext import Dispatcher
+
+from bot.tracing import describe_update, tracer
+from bot.update_recorder import UpdateRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class OrderedDispatcher(Dispatcher):
+    """
+    :class:`telegram.ext.Dispatcher` that processes updates on a pool of :attr:`workers` threads
+    instead of on the dispatcher thread. Updates are sorted into lanes by user (or chat, if the
+    update has no user). Updates of the same lane are processed one after another in the order
+    they arrived, such that conversations and the ``user_data`` of a user behave just like with
+    a plain :class:`telegram.ext.Dispatcher`. Updates of different lanes are processed in
+    parallel, such that one slow request to the YOURLS instance doesn't stall other users.
+
+    If :attr:`max_pending_updates` is set, the dispatcher thread stops taking updates from the
+    :attr:`update_queue` while that many updates are waiting in the lanes or being processed.
+    Together with a bounded :attr:`update_queue`, this pauses receiving further updates.
+
+    Updates are traced by the :attr:`bot.tracing.tracer`.
+
+    Args:
+        *args: Passed to :class:`telegram.ext.Dispatcher`.
+        update_recorder: Optional. If passed, incoming updates are recorded on arrival, i.e.
+            before waiting in their lane.
+        max_pending_updates: Optional. Maximum number of updates waiting in the lanes or being
+            processed. Defaults to ``0``, i.e. unlimited.
+        **kwargs: Passed to :class:`telegram.ext.Dispatcher`.
+
+    Attributes:
+        update_recorder: Optional. The recorder for incoming updates.
+        max_pending_updates: Maximum number of updates waiting in the lanes or being processed.
+            ``0`` means unlimited.
+
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        update_recorder: UpdateRecorder = None,
+        max_pending_updates: int = 0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.update_recorder: Optional[UpdateRecorder] = update_recorder
+        self.max_pending_updates = max_pending_updates
+        self._pending_slots = (
+            BoundedSemaphore(max_pending_updates) if max_pending_updates > 0 else None
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='ordered_dispatcher'
+        )
+        self._lanes: Dict[Hashable, Deque[Update]] = {}
+        self._lanes_lock = Lock()
+
+    @staticmethod
+    def _lane_key(update: Update) -> Hashable:
+        if update.effective_user:
+            return 'user', update.effective_user.id
+        if update.effective_chat:
+            return 'chat', update.effective_chat.id
+        return None
+
+    def process_update(self, update: Union[str, Update, TelegramError]) -> None:
+        """
+        Schedules an update for processing in its lane. Errors raised while polling are
+        processed right away. Blocks while :attr:`max_pending_updates` updates are pending.
+
+        Args:
+            update: The update to process.
+
+        """
+        if not isinstance(update, Update):
+            super().process_update(update)
+            return
+
+        if self.update_recorder is not None:
+            self.update_recorder.record(update)
+        if self._pending_slots is not None:
+            # Released by _process_lane once the update was processed
+            self._pending_slots.acquire()
+        key = self._lane_key(update)
+        with self._lanes_lock:
+            lane = self._lanes.get(key)
+            if lane is not None:
+                # A worker is already processing this lane and will pick up the update
+                lane.append(update)
+                return
+            self._lanes[key] = deque([update])
+        try:
+            self._executor.submit(self._process_lane, key)
+        except RuntimeError:
+            # The executor was shut down by stop(), so the update is processed right here
+            self._process_lane(key)
+
+    def _process_lane(self, key: Hashable) -> None:
+        while True:
+            with self._lanes_lock:
+                lane = self._lanes[key]
+                if not lane:
+                    del self._lanes[key]
+                    return
+                update = lane.popleft()
+            try:
+                with tracer.trace(describe_update(update)):
+                    super().process_update(update)
+            except Exception:  # pylint: disable=W0703
+                logger.exception('An uncaught error was raised while processing an update.')
+            finally:
+                if self._pending_slots is not None:
+                    self._pending_slots.release()
+
+    @property
+    def pending_updates(self) -> int:
+        """Number of updates waiting in the lanes."""
+        with self._lanes_lock:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def stop(self) -> None:
+        """
+        Stops the dispatcher and waits for the scheduled updates to be processed. The lanes are
+        drained before the threads for ``run_async`` callbacks are stopped, as the updates waiting
+        in the lanes may still need them.
+        """
+        if self.running:
+            # Wait for the dispatcher thread to sort the remaining updates into the lanes
+            self.update_queue.join()
+        self._executor.shutdown(wait=True)
+        super().stop()
@@ -11,18 +11,33 @@ from ptbcontrib.roles import BOT_DATA_KEY, Roles
 from telegram import Update
 from telegram.ext import CallbackContext
 
+from bot.circuit_breaker import is_backend_failure
+from bot.constants import UNAVAILABLE_SWITCH_PM_PARAMETER
+from bot.message_queue import low_priority
+
 logger = logging.getLogger(__name__)
 
 
 def error_handler(update: Any, context: CallbackContext) -> None:
     """
-    Log the error and send a telegram message to notify the admin.
+    Log the error and send a telegram message to notify the admin. The message is sent with
+    :meth:`bot.message_queue.low_priority`.
+
+    Errors indicating that the YOURLS instance is unavailable are not reported to the admins, as
+    they are informed by the :class:`bot.circuit_breaker.CircuitBreaker`. Instead, the user is
+    told to try again later.
 
     Args:
         update: The incoming update. Not necessarily a Telegram update.
         context: The context as provided by the :class:`telegram.ext.Dispatcher`.
 
     """
+    if is_backend_failure(context.error):
+        logger.warning('The YOURLS instance is unavailable: %s', context.error)
+        if isinstance(update, Update):
+            _report_unavailable(update)
+        return
+
     # Log the error before we do anything else, so we can see it even if something breaks.
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
 
@@ -47,9 +62,28 @@ def error_handler(update: Any, context: CallbackContext) -> None:
         f'<pre>{html.escape(tb_string)}</pre>'
     )
 
-    # Finally, send the message to all admins
-    for admin in cast(Roles, context.bot_data[BOT_DATA_KEY]).admins.chat_ids:
-        try:
-            context.bot.send_message(chat_id=admin, text=message)
-        except Exception:  # pylint: disable=W0703
-            pass
+    # Finally, send the message to all admins. Replies to users go first.
+    with low_priority():
+        for admin in cast(Roles, context.bot_data[BOT_DATA_KEY]).admins.chat_ids:
+            try:
+                context.bot.send_message(chat_id=admin, text=message)
+            except Exception:  # pylint: disable=W0703
+                pass
+
+
+def _report_unavailable(update: Update) -> None:
+    text = '⚠️ The YOURLS instance is currently unavailable. Please try again later.'
+    try:
+        if update.callback_query:
+            update.callback_query.answer(text, show_alert=True)
+        elif update.inline_query:
+            update.inline_query.answer(
+                [],
+                cache_time=0,
+                switch_pm_text='⚠️ YOURLS unavailable',
+                switch_pm_parameter=UNAVAILABLE_SWITCH_PM_PARAMETER,
+            )
+        elif update.effective_message:
+            update.effective_message.reply_text(text)
+    except Exception:  # pylint: disable=W0703
+        logger.warning('Could not inform the user about the unavailable YOURLS instance.')
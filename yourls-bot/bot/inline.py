@@ -1,17 +1,36 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """The module contains functions for the inline mode."""
-from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+import html
+import time
+from typing import cast, Dict, Optional, Tuple
+from uuid import uuid4
+
+from telegram import (
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    Update,
+    InlineKeyboardMarkup,
+    InlineKeyboardButton,
+)
 from telegram.ext import CallbackContext
-from yourls import YOURLSKeywordExistsError, YOURLSNoURLError
+from yourls import YOURLSKeywordExistsError, YOURLSNoURLError, YOURLSNoLoopError
 
 from bot.constants import (
-    YOURLS_KEY,
     TEMPORARY_KEYWORDS_KEY,
     DONT_DELETE_CIR,
     EMPTY_SWITCH_PM_PARAMETER,
+    UNAVAILABLE_SWITCH_PM_PARAMETER,
+    PENDING_INLINE_KEY,
+    DELETION_QUEUE_KEY,
 )
-from bot.utils import check_keyword_existence, sanitize_protocol
+from bot.deletion_queue import DeletionQueue
+from bot.services import get_services
+from bot.utils import check_keyword_existence, sanitize_protocol, get_stats_cache
+
+MAX_PENDING_INLINE = 20
+""":obj:`int`: Maximum number of queries per user that are remembered in the deferred inline mode.
+"""
 
 
 def inline_redirect_info(update: Update, context: CallbackContext) -> None:
@@ -23,12 +42,16 @@ def inline_redirect_info(update: Update, context: CallbackContext) -> None:
         context: The context as provided by the :class:`telegram.ext.Dispatcher`.
 
     """
-    if context.args[0] != EMPTY_SWITCH_PM_PARAMETER:
+    if context.args[0] == EMPTY_SWITCH_PM_PARAMETER:
+        update.message.reply_text('You tried to shorten an invalid URL. Please try another!')
+    elif context.args[0] == UNAVAILABLE_SWITCH_PM_PARAMETER:
         update.message.reply_text(
-            f'The keyword <i>{context.args[0]}</i> is already occupied. Please try another!'
+            'The YOURLS instance is currently unavailable. Please try again later.'
         )
     else:
-        update.message.reply_text('You tried to shorten an invalid URL. Please try another!')
+        update.message.reply_text(
+            f'The keyword <i>{context.args[0]}</i> is already occupied. Please try another!'
+        )
 
 
 def inline_shorten(update: Update, context: CallbackContext) -> None:
@@ -39,14 +62,20 @@ def inline_shorten(update: Update, context: CallbackContext) -> None:
     * a URL followed by a keyword (separated by whitespace).
 
     If an already existing keyword is requested, the user will be presented a button that leads
-    to :meth:`inline_redirect_info`.
+    to :meth:`inline_redirect_info`. If no keyword is requested and the URL was already shortened
+    before, the existing short URL is offered instead of creating a new one.
+
+    If :attr:`bot.services.Services.deferred_inline` is :obj:`True`, no short URL is created
+    while the user is typing. Instead, a preview is shown and the short URL is created by
+    :meth:`create_deferred_link` once the user chooses the result. Otherwise a temporary short URL
+    is created for every query and the ones not chosen are deleted by :meth:`delete_temp_links`.
 
     Args:
         update: The incoming Telegram update containing an :class:`telegram.InlineQuery`
         context: The context as provided by the :class:`telegram.ext.Dispatcher`.
 
     """
-    yourls = context.bot_data[YOURLS_KEY]
+    services = get_services(context)
     if TEMPORARY_KEYWORDS_KEY not in context.user_data:
         context.user_data[TEMPORARY_KEYWORDS_KEY] = []
 
@@ -72,8 +101,22 @@ def inline_shorten(update: Update, context: CallbackContext) -> None:
         return
 
     url = sanitize_protocol(url)
+    if not keyword:
+        short_url = get_stats_cache(context).find_url(url)
+        if short_url:
+            title = short_url.shorturl
+            article = InlineQueryResultArticle(
+                DONT_DELETE_CIR, title, InputTextMessageContent(title), description=url
+            )
+            update.inline_query.answer([article], is_personal=True, cache_time=0)
+            return
+
+    if services.deferred_inline:
+        _answer_preview(update, context, url, keyword)
+        return
+
     try:
-        short_url_instance = yourls.shorten(url, keyword=keyword)
+        short_url_instance = services.yourls.shorten(url, keyword=keyword)
         short_url = short_url_instance.shorturl
 
         title = f'{keyword} | {short_url_instance.title}' if keyword else short_url_instance.title
@@ -83,15 +126,11 @@ def inline_shorten(update: Update, context: CallbackContext) -> None:
         update.inline_query.answer([article], is_personal=True, cache_time=0)
         # we do this here so that the keyword is only appended if nothing went wrong
         context.user_data[TEMPORARY_KEYWORDS_KEY].append(short_url_instance.keyword)
+        # A sync may pick up the link before the user chose a result
+        services.stats_cache.mark_temporary(short_url_instance.keyword)
 
     except YOURLSKeywordExistsError:
-        update.inline_query.answer(
-            [],
-            is_personal=True,
-            cache_time=0,
-            switch_pm_text='❌ Keyword occupied',
-            switch_pm_parameter=keyword,
-        )
+        _answer_occupied_keyword(update, cast(str, keyword))
 
     except YOURLSNoURLError:
         update.inline_query.answer(
@@ -103,27 +142,99 @@ def inline_shorten(update: Update, context: CallbackContext) -> None:
         )
 
 
+def _answer_occupied_keyword(update: Update, keyword: str) -> None:
+    update.inline_query.answer(
+        [],
+        is_personal=True,
+        cache_time=0,
+        switch_pm_text='❌ Keyword occupied',
+        switch_pm_parameter=keyword,
+    )
+
+
+def _answer_preview(
+    update: Update, context: CallbackContext, url: str, keyword: Optional[str]
+) -> None:
+    if keyword and check_keyword_existence(context, keyword):
+        _answer_occupied_keyword(update, keyword)
+        return
+
+    pending = cast(
+        Dict[str, Tuple[str, Optional[str], float]],
+        context.user_data.setdefault(PENDING_INLINE_KEY, {}),
+    )
+    # Only the most recent queries can still be chosen, so don't let this grow while typing
+    while len(pending) >= MAX_PENDING_INLINE:
+        pending.pop(next(iter(pending)))
+    result_id = uuid4().hex
+    pending[result_id] = (url, keyword, time.time())
+
+    # Telegram only reports the inline_message_id of the sent message, if it has a keyboard
+    reply_markup = InlineKeyboardMarkup.from_button(
+        InlineKeyboardButton('⏳ Creating short URL …', url=get_services(context).yourls.url)
+    )
+    title = f'{keyword} | {url}' if keyword else url
+    article = InlineQueryResultArticle(
+        result_id,
+        title,
+        InputTextMessageContent(html.escape(url)),
+        description='Tap to create the short URL.',
+        reply_markup=reply_markup,
+    )
+    update.inline_query.answer([article], is_personal=True, cache_time=0)
+
+
+def create_deferred_link(update: Update, context: CallbackContext) -> None:
+    """
+    Creates the short URL for a result chosen in the deferred inline mode and replaces the sent
+    message by the short URL. See :meth:`inline_shorten`.
+
+    Args:
+        update: Incoming Telegram update containing a :class:`telegram.ChosenInlineResult`.
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+    """
+    chosen_inline_result = update.chosen_inline_result
+    pending = context.user_data.pop(PENDING_INLINE_KEY, {})
+    if chosen_inline_result.result_id not in pending:
+        return
+
+    url, keyword, _ = pending[chosen_inline_result.result_id]
+    try:
+        short_url = get_services(context).yourls.shorten(url, keyword=keyword)
+        get_stats_cache(context).add(short_url)
+        text = short_url.shorturl
+    except YOURLSKeywordExistsError:
+        text = f'❌ The keyword <i>{html.escape(cast(str, keyword))}</i> is already occupied.'
+    except (YOURLSNoURLError, YOURLSNoLoopError):
+        text = '❌ The URL can not be shortened.'
+
+    context.bot.edit_message_text(
+        text, inline_message_id=chosen_inline_result.inline_message_id, reply_markup=None
+    )
+
+
 def delete_temp_links(update: Update, context: CallbackContext) -> None:
     """
-    Deletes temporary short URL created by the inline mode.
+    Schedules the temporary short URLs created by the inline mode that were not chosen for
+    deletion by the :class:`bot.deletion_queue.DeletionQueue`. The chosen short URL is marked as
+    permanent in the :class:`bot.stats_cache.StatsCache`.
 
     Args:
         update: Incoming Telegram update containing a :class:`telegram.ChosenInlineResult`.
         context: The context as provided by the :class:`telegram.ext.Dispatcher`.
 
     """
-    yourls = context.bot_data[YOURLS_KEY]
+    stats_cache = get_services(context).stats_cache
     chosen_keyword = update.chosen_inline_result.result_id
-
-    if chosen_keyword == DONT_DELETE_CIR:
-        return
+    if chosen_keyword != DONT_DELETE_CIR:
+        stats_cache.mark_permanent(chosen_keyword)
 
     # Copy in case the list changes while we iterate
-    for keyword in context.user_data[TEMPORARY_KEYWORDS_KEY].copy():
-        if keyword != chosen_keyword:
-            try:
-                yourls.delete(keyword)
-            except Exception:  # pylint: disable=W0703
-                pass
+    keywords = [k for k in context.user_data[TEMPORARY_KEYWORDS_KEY].copy() if k != chosen_keyword]
+    for keyword in keywords:
+        # A sync may have picked up the temporary link in the meantime
+        stats_cache.remove(keyword)
+    cast(DeletionQueue, context.bot_data[DELETION_QUEUE_KEY]).put(keywords)
 
     context.user_data[TEMPORARY_KEYWORDS_KEY].clear()
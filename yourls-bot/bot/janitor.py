@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a job that cleans up data left behind by abandoned interactions."""
+import logging
+import time
+from typing import cast
+
+from telegram import Update
+from telegram.ext import CallbackContext, ConversationHandler, Dispatcher
+
+from bot.constants import (
+    LAST_ACTIVITY_KEY,
+    TEMPORARY_KEYWORDS_KEY,
+    PENDING_INLINE_KEY,
+    DELETE_KEYBOARD_KEY,
+    CHANGE_URL_KEY,
+    CHANGE_KEYWORD_KEY,
+    DELETION_QUEUE_KEY,
+)
+from bot.deletion_queue import DeletionQueue
+from bot.services import get_services
+
+logger = logging.getLogger(__name__)
+
+
+def record_activity(_: Update, context: CallbackContext) -> None:
+    """
+    Stores the time of the users latest update in ``context.user_data[LAST_ACTIVITY_KEY]``. Used
+    by :meth:`clean_up` to determine abandoned data.
+
+    Args:
+        _: The incoming Telegram update.
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+    """
+    if context.user_data is not None:
+        context.user_data[LAST_ACTIVITY_KEY] = time.time()
+
+
+def end_conversations(dispatcher: Dispatcher, user_id: int) -> int:
+    """
+    Ends all conversations of a user in the :class:`telegram.ext.ConversationHandler` s of the
+    dispatcher.
+
+    Args:
+        dispatcher: The dispatcher.
+        user_id: The ID of the user.
+
+    Returns:
+        The number of ended conversations.
+
+    """
+    ended = 0
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            if not isinstance(handler, ConversationHandler) or not handler.per_user:
+                continue
+            # The user ID is the last part of the key. Copy, as the dispatcher may add keys.
+            for key in [key for key in list(handler.conversations) if key[-1] == user_id]:
+                handler.update_state(ConversationHandler.END, key)
+                ended += 1
+    return ended
+
+
+def clean_up(context: CallbackContext) -> None:
+    """
+    Cleans up the ``user_data`` of all users that had no updates for
+    :attr:`bot.services.Services.janitor_max_age` seconds. More precisely,
+
+    * temporary keywords of the inline mode are scheduled for deletion via the
+      :class:`bot.deletion_queue.DeletionQueue`,
+    * queries of the deferred inline mode are dropped and
+    * abandoned conversations are ended by :meth:`end_conversations` and their data is dropped.
+
+    Users, for which no update was recorded yet, e.g. because they were stored before the janitor
+    was introduced, are considered active at the first run.
+
+    Meant to be used as repeating job.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.JobQueue`.
+
+    """
+    services = get_services(context)
+    max_age = services.janitor_max_age
+    deletion_queue = cast(DeletionQueue, context.bot_data[DELETION_QUEUE_KEY])
+    stats_cache = services.stats_cache
+    now = time.time()
+
+    users = keywords = entries = 0
+    # Copy, as the dispatcher may add users while we iterate
+    for user_id, user_data in list(context.dispatcher.user_data.items()):
+        if now - user_data.setdefault(LAST_ACTIVITY_KEY, now) < max_age:
+            continue
+
+        temporary_keywords = user_data.pop(TEMPORARY_KEYWORDS_KEY, [])
+        for keyword in temporary_keywords:
+            stats_cache.remove(keyword)
+        deletion_queue.put(temporary_keywords)
+
+        cleaned = len(temporary_keywords)
+        for key in (PENDING_INLINE_KEY, DELETE_KEYBOARD_KEY, CHANGE_URL_KEY, CHANGE_KEYWORD_KEY):
+            cleaned += user_data.pop(key, None) is not None
+        cleaned += end_conversations(context.dispatcher, user_id)
+
+        if cleaned:
+            users += 1
+            keywords += len(temporary_keywords)
+            entries += cleaned - len(temporary_keywords)
+
+    logger.info(
+        'Janitor cleaned up after %d users: Scheduled %d temporary keywords for deletion and '
+        'dropped %d stale entries and conversations.',
+        users,
+        keywords,
+        entries,
+    )
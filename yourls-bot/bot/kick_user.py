@@ -21,6 +21,8 @@ from telegram.ext import (
     ChosenInlineResultHandler,
 )
 
+from bot.profile_cache import refresh_profiles
+from bot.services import get_services
 from bot.utils import cancel_button, abort, delete_keyboard, cancel_keyboard
 from .constants import DELETE_KEYBOARD_KEY, USER_ROLE
 
@@ -28,11 +30,15 @@ GET_UID_STATE = 'get user id'
 KICK_USER_STATE = 'delete user'
 CANCEL_CALLBACK_DATA = 'cancel_user_exchange'
 CANCEL_KEYBOARD = cancel_keyboard(CANCEL_CALLBACK_DATA)
+PAGE_SIZE = 50
+""":obj:`int`: Number of users shown per page of inline results. This is the maximum allowed by
+Telegram."""
 
 
 def start(update: Update, context: CallbackContext) -> str:
     """
-    Initializes the conversation and asks for the user to kick.
+    Initializes the conversation and asks for the user to kick. Also refreshes the
+    :class:`bot.profile_cache.ProfileCache` in the background.
 
     Args:
         update: The incoming Telegram update.
@@ -50,12 +56,16 @@ def start(update: Update, context: CallbackContext) -> str:
         reply_markup=reply_markup,
     )
     context.user_data[DELETE_KEYBOARD_KEY] = message
+    context.job_queue.run_once(refresh_profiles, 0)
     return GET_UID_STATE
 
 
 def select_user(update: Update, context: CallbackContext) -> str:
     """
-    Shows the list of currently allowed users, excluding the admin.
+    Shows the list of currently allowed users, excluding the admin. Only users whose name or ID
+    contains the query text are shown, sorted by name and paginated via the queries offset.
+    Names are taken from the :class:`bot.profile_cache.ProfileCache`, users that are not cached
+    yet are shown by their ID.
 
     Args:
         update: The incoming Telegram update.
@@ -66,20 +76,27 @@ def select_user(update: Update, context: CallbackContext) -> str:
 
     """
     role = cast(Role, context.bot_data[BOT_DATA_KEY][USER_ROLE])
-    results = []
-    for user_id in role.chat_ids:
-        # For new we just don't worry about flood limits here ...
-        chat = context.bot.get_chat(user_id)
-        name = chat.first_name
-        if chat.last_name:
-            name = f'{name} {chat.last_name}'
-        if chat.username:
-            name = f'{name} (@{chat.username})'
-        article = InlineQueryResultArticle(user_id, name, InputTextMessageContent(name))
-
-        results.append(article)
-
-    update.inline_query.answer(results, auto_pagination=True, cache_time=0)
+    profile_cache = get_services(context).profile_cache
+    inline_query = update.inline_query
+    query = inline_query.query.strip().lower()
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+
+    users = sorted(
+        (
+            (name, user_id)
+            for user_id in role.chat_ids
+            for name in (profile_cache.get(user_id) or str(user_id),)
+            if query in name.lower() or query in str(user_id)
+        ),
+        key=lambda user: user[0].lower(),
+    )
+    results = [
+        InlineQueryResultArticle(user_id, name, InputTextMessageContent(name))
+        for name, user_id in users[offset:offset + PAGE_SIZE]
+    ]
+    next_offset = str(offset + PAGE_SIZE) if offset + PAGE_SIZE < len(users) else ''
+
+    inline_query.answer(results, next_offset=next_offset, cache_time=0)
     return KICK_USER_STATE
 
 
@@ -119,7 +136,11 @@ def build_kick_user_conversation_handler(admin_role: Role, bot_id: int) -> Conve
                 InlineQueryHandler(select_user),
                 CallbackQueryHandler(cancel_button, pattern=CANCEL_CALLBACK_DATA),
             ],
-            KICK_USER_STATE: [ChosenInlineResultHandler(kick_user)],
+            KICK_USER_STATE: [
+                ChosenInlineResultHandler(kick_user),
+                # For further pages and changes of the query
+                InlineQueryHandler(select_user),
+            ],
         },
         fallbacks=[MessageHandler(Filters.all & ~Filters.via_bot(bot_id), abort)],
         per_chat=False,
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a queue for outgoing messages that respects Telegrams flood limits."""
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from threading import Condition, Thread, local
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from bot.tracing import span
+
+logger = logging.getLogger(__name__)
+
+HIGH_PRIORITY = 0
+""":obj:`int`: Priority of interactive replies. Used by default."""
+LOW_PRIORITY = 1
+""":obj:`int`: Priority of messages that may wait, e.g. error reports. See :meth:`low_priority`."""
+GLOBAL_RATE = 30
+""":obj:`float`: Maximum number of messages per second in total."""
+CHAT_RATE = 1
+""":obj:`float`: Maximum number of messages per second to a private chat."""
+GROUP_RATE = 20 / 60
+""":obj:`float`: Maximum number of messages per second to a group or channel."""
+BURST = 3
+""":obj:`int`: Number of messages that may be sent to a chat at once before the rate applies."""
+MAX_RETRIES = 3
+""":obj:`int`: Number of times a message is sent again after Telegram answered with
+:class:`telegram.error.RetryAfter`."""
+
+ChatID = Union[int, str, None]
+
+_state = local()
+
+
+@contextmanager
+def low_priority() -> Iterator[None]:
+    """
+    Context manager that makes messages sent by the current thread within the context low
+    priority messages, i.e. they are only sent, when no high priority messages are waiting.
+
+    Example:
+        .. code:: python
+
+            with low_priority():
+                context.bot.send_message(admin, 'Something went wrong.')
+
+    """
+    previous = getattr(_state, 'priority', HIGH_PRIORITY)
+    _state.priority = LOW_PRIORITY
+    try:
+        yield
+    finally:
+        _state.priority = previous
+
+
+class TokenBucket:
+    """
+    Token bucket, i.e. allows for :attr:`capacity` events at once and :attr:`rate` events per
+    second on average.
+
+    Args:
+        rate: Number of tokens added per second.
+        capacity: Maximum number of tokens. The bucket starts full.
+
+    Attributes:
+        rate: Number of tokens added per second.
+        capacity: Maximum number of tokens.
+
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        Args:
+            now: The current value of :meth:`time.monotonic`.
+
+        Returns:
+            The number of seconds until a token is available. ``0``, if one is available now.
+
+        """
+        self._refill(now)
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def is_full(self, now: float) -> bool:
+        """
+        Args:
+            now: The current value of :meth:`time.monotonic`.
+
+        Returns:
+            Whether the bucket is full, i.e. whether it was not used recently.
+
+        """
+        self._refill(now)
+        return self._tokens >= self.capacity
+
+    def consume(self) -> None:
+        """Takes a token. Call :meth:`delay` before to make sure one is available."""
+        self._tokens -= 1
+
+
+class _Item:  # pylint: disable=R0903
+    __slots__ = ('chat_id', 'priority', 'callback', 'future', 'retries')
+
+    def __init__(self, chat_id: ChatID, priority: int, callback: Callable[[], Any]) -> None:
+        self.chat_id = chat_id
+        self.priority = priority
+        self.callback = callback
+        self.future: Future = Future()
+        self.retries = 0
+
+
+class MessageQueue:
+    """
+    Queue for outgoing messages. Messages are sent by :attr:`workers` threads such that
+
+    * at most :attr:`GLOBAL_RATE` messages per second are sent in total,
+    * at most :attr:`CHAT_RATE` (private chats) or :attr:`GROUP_RATE` (other chats) messages
+      per second are sent to one chat, allowing for bursts of :attr:`BURST` messages,
+    * messages to the same chat are sent one after another in the order they were queued,
+    * messages of :attr:`HIGH_PRIORITY` are sent before messages of :attr:`LOW_PRIORITY`.
+
+    If Telegram answers with :class:`telegram.error.RetryAfter`, the chat is paused for the
+    requested time and the message is sent again, at most :attr:`MAX_RETRIES` times.
+
+    Args:
+        workers: Optional. Number of threads sending messages. Defaults to ``4``.
+
+    Attributes:
+        workers: Number of threads sending messages.
+
+    """
+
+    def __init__(self, workers: int = 4) -> None:
+        self.workers = workers
+        self._lanes: List[Deque[_Item]] = [deque(), deque()]
+        self._global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._buckets: Dict[ChatID, TokenBucket] = {}
+        self._paused_until: Dict[ChatID, float] = {}
+        self._in_flight: Set[ChatID] = set()
+        self._condition = Condition()
+        self._running = True
+        self._threads = [
+            Thread(target=self._work, name=f'message_queue_{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return sum(len(lane) for lane in self._lanes)
+
+    def send(self, chat_id: ChatID, callback: Callable[[], Any]) -> Any:
+        """
+        Queues a message and waits until it was sent. The priority is :attr:`HIGH_PRIORITY`,
+        unless called within :meth:`low_priority`.
+
+        Args:
+            chat_id: The chat the message is sent to. Pass :obj:`None`, if the message is not
+                bound to a chat, e.g. when editing an inline message.
+            callback: Sends the message.
+
+        Returns:
+            The return value of ``callback``.
+
+        Raises:
+            Exception: Whatever ``callback`` raised.
+
+        """
+        item = _Item(chat_id, getattr(_state, 'priority', HIGH_PRIORITY), callback)
+        with self._condition:
+            if not self._running:
+                raise RuntimeError('The message queue is stopped.')
+            self._lanes[item.priority].append(item)
+            self._condition.notify()
+        return item.future.result()
+
+    def stop(self) -> None:
+        """Sends the queued messages and stops the worker threads."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _bucket(self, chat_id: ChatID) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            private = isinstance(chat_id, int) and chat_id > 0
+            bucket = TokenBucket(CHAT_RATE if private else GROUP_RATE, BURST)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _next(self, now: float) -> Tuple[Optional[_Item], Optional[float]]:
+        # Returns the next item that may be sent or else the time to wait for one
+        wait = max(self._global_bucket.delay(now), self._paused_until.get(None, 0) - now)
+        if wait > 0:
+            return None, wait
+
+        wait = float('inf')
+        seen: Set[ChatID] = set()
+        for lane in self._lanes:
+            for item in lane:
+                chat_id = item.chat_id
+                if chat_id is not None:
+                    # Only the oldest message of each chat is eligible to keep their order
+                    blocked = chat_id in seen or chat_id in self._in_flight
+                    seen.add(chat_id)
+                    if blocked:
+                        continue
+                    delay = max(
+                        self._bucket(chat_id).delay(now), self._paused_until.get(chat_id, 0) - now
+                    )
+                    if delay > 0:
+                        wait = min(wait, delay)
+                        continue
+                    self._bucket(chat_id).consume()
+                    self._in_flight.add(chat_id)
+                lane.remove(item)
+                self._global_bucket.consume()
+                return item, None
+
+        return None, None if wait == float('inf') else wait
+
+    def _prune(self, now: float) -> None:
+        for chat_id in [c for c, b in self._buckets.items() if b.is_full(now)]:
+            del self._buckets[chat_id]
+        for chat_id in [c for c, until in self._paused_until.items() if until <= now]:
+            del self._paused_until[chat_id]
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    item, wait = self._next(now)
+                    if item is not None:
+                        break
+                    if not self._running and not any(self._lanes):
+                        return
+                    self._condition.wait(wait)
+                if len(self._buckets) > 1000:
+                    self._prune(now)
+
+            try:
+                item.future.set_result(item.callback())
+            except RetryAfter as exc:
+                self._retry_later(item, exc)
+            except Exception as exc:  # pylint: disable=W0703
+                item.future.set_exception(exc)
+            finally:
+                with self._condition:
+                    self._in_flight.discard(item.chat_id)
+                    self._condition.notify_all()
+
+    def _retry_later(self, item: _Item, exc: RetryAfter) -> None:
+        item.retries += 1
+        if item.retries > MAX_RETRIES:
+            item.future.set_exception(exc)
+            return
+
+        logger.warning(
+            'Flood limit hit for chat %s, retrying in %s seconds.', item.chat_id, exc.retry_after
+        )
+        with self._condition:
+            self._paused_until[item.chat_id] = time.monotonic() + exc.retry_after
+            # In front, such that the order of the messages to the chat is kept
+            self._lanes[item.priority].appendleft(item)
+
+
+class QueuedBot(Bot):
+    """
+    :class:`telegram.Bot` that sends and edits all messages via a :class:`MessageQueue`. The
+    methods still block until the message was sent and return the result as usual. Requests are
+    recorded as spans by the :attr:`bot.tracing.tracer`.
+
+    Args:
+        *args: Passed to :class:`telegram.Bot`.
+        message_queue: Optional. The queue to use. By default, a new one is created.
+        **kwargs: Passed to :class:`telegram.Bot`.
+
+    Attributes:
+        message_queue: The queue the messages are sent with.
+
+    """
+
+    def __init__(self, *args: Any, message_queue: MessageQueue = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Not `or`, as an empty queue is falsy
+        self.message_queue = message_queue if message_queue is not None else MessageQueue()
+
+    def _message(self, endpoint: str, data: Dict[str, Any], *args: Any, **kwargs: Any) -> Any:
+        send = super()._message
+        with span(f'telegram.{endpoint}'):
+            return self.message_queue.send(
+                data.get('chat_id'), lambda: send(endpoint, data, *args, **kwargs)
+            )
+
+    def _post(self, endpoint: str, *args: Any, **kwargs: Any) -> Any:
+        # Messages are posted by the threads of the queue, which are not traced. Hence, this
+        # only records the requests that are made directly, e.g. answering inline queries.
+        with span(f'telegram.{endpoint}'):
+            return super()._post(endpoint, *args, **kwargs)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a handler that routes text messages to the shortening callbacks."""
+import re
+from typing import Any, Callable, Optional, cast
+
+from telegram import Message, MessageEntity, Update
+from telegram.ext import CallbackContext, Dispatcher, Handler
+
+KEYWORD_ROUTE = 'keyword'
+""":obj:`str`: Result of :meth:`MessageRouter.check_update` for messages consisting of a link and
+a keyword."""
+SHORTEN_ROUTE = 'shorten'
+""":obj:`str`: Result of :meth:`MessageRouter.check_update` for other text messages."""
+
+_TWO_WORDS = re.compile(r'^\s*\S+\s+\S+\s*$')
+_LINK_TYPES = frozenset({MessageEntity.URL, MessageEntity.TEXT_LINK})
+
+
+def is_link_with_keyword(message: Message) -> bool:
+    """
+    Checks whether a text message consists of exactly two words, where exactly one of them is a
+    text link or a URL. The entities are scanned once and the text is only matched, if the
+    entities qualify.
+
+    Args:
+        message: The message.
+
+    Returns:
+        The result.
+
+    """
+    links = 0
+    for entity in message.entities:
+        if entity.type in _LINK_TYPES:
+            links += 1
+            if links > 1:
+                return False
+    return links == 1 and bool(message.text) and bool(_TWO_WORDS.search(message.text))
+
+
+class MessageRouter(Handler):
+    """
+    Handler for text messages, which decides in a single pass over the message, which callback
+    handles it:
+
+    * Messages that satisfy :meth:`is_link_with_keyword` are handled by
+      :attr:`keyword_callback`.
+    * Other text messages, that aren't commands, are handled by :attr:`callback`.
+
+    Messages, channel posts and their edits are handled, unless they were sent via the bot
+    itself. This behaves just like a :class:`telegram.ext.MessageHandler` with
+    :class:`bot.utils.TwoWordFilter` followed by one with
+    ``Filters.text & ~Filters.command``, but evaluates the message only once.
+
+    Args:
+        keyword_callback: The callback for messages consisting of a link and a keyword.
+        callback: The callback for other text messages.
+        bot_id: The ID of the bot.
+
+    Attributes:
+        keyword_callback: The callback for messages consisting of a link and a keyword.
+        callback: The callback for other text messages.
+        bot_id: The ID of the bot.
+
+    """
+
+    def __init__(
+        self,
+        keyword_callback: Callable[[Update, CallbackContext], Any],
+        callback: Callable[[Update, CallbackContext], Any],
+        bot_id: int,
+    ) -> None:
+        super().__init__(callback)
+        self.keyword_callback = keyword_callback
+        self.bot_id = bot_id
+
+    def check_update(self, update: object) -> Optional[str]:
+        """
+        Determines whether and how an update should be handled.
+
+        Args:
+            update: The incoming update.
+
+        Returns:
+            :attr:`KEYWORD_ROUTE`, :attr:`SHORTEN_ROUTE` or :obj:`None`, if the update should not
+            be handled.
+
+        """
+        if not isinstance(update, Update):
+            return None
+        message = (
+            update.message
+            or update.edited_message
+            or update.channel_post
+            or update.edited_channel_post
+        )
+        if message is None or not message.text:
+            return None
+        if message.via_bot and message.via_bot.id == self.bot_id:
+            return None
+
+        if is_link_with_keyword(message):
+            return KEYWORD_ROUTE
+        entities = message.entities
+        if entities and entities[0].type == MessageEntity.BOT_COMMAND and entities[0].offset == 0:
+            return None
+        return SHORTEN_ROUTE
+
+    def handle_update(
+        self,
+        update: object,
+        dispatcher: Dispatcher,
+        check_result: object,
+        context: CallbackContext = None,
+    ) -> Any:
+        """
+        Calls the callback chosen by :meth:`check_update`.
+
+        Args:
+            update: The incoming update.
+            dispatcher: The calling dispatcher.
+            check_result: The result of :meth:`check_update`.
+            context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+        """
+        callback = self.keyword_callback if check_result == KEYWORD_ROUTE else self.callback
+        return callback(cast(Update, update), cast(CallbackContext, context))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains the metrics of the bot, which can be scraped by Prometheus."""
+import functools
+import time
+from typing import Any, Callable, Iterable
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from telegram import Update
+from telegram.ext import CallbackContext, ConversationHandler, Dispatcher, Handler
+
+from bot.message_router import MessageRouter
+from bot.tracing import span
+
+HANDLER_DURATION = Histogram(
+    'yourls_bot_handler_duration_seconds',
+    'Time spent in the callbacks of the handlers.',
+    ['handler'],
+)
+""":class:`prometheus_client.Histogram`: Time spent in the callbacks of the handlers. See
+:meth:`instrument_handlers`."""
+HANDLER_ERRORS = Counter(
+    'yourls_bot_handler_errors_total',
+    'Exceptions raised by the callbacks of the handlers.',
+    ['handler'],
+)
+""":class:`prometheus_client.Counter`: Exceptions raised by the callbacks of the handlers."""
+YOURLS_REQUEST_DURATION = Histogram(
+    'yourls_bot_yourls_request_duration_seconds',
+    'Duration of the requests to the YOURLS API.',
+    ['action'],
+)
+""":class:`prometheus_client.Histogram`: Duration of the requests to the YOURLS API per action."""
+YOURLS_REQUEST_ERRORS = Counter(
+    'yourls_bot_yourls_request_errors_total', 'Failed requests to the YOURLS API.', ['action']
+)
+""":class:`prometheus_client.Counter`: Failed requests to the YOURLS API per action."""
+STATS_CACHE_LOOKUPS = Counter(
+    'yourls_bot_stats_cache_lookups_total',
+    'Accesses of the statistics cache. A miss means that the cache was refreshed, stale that a '
+    'stale snapshot was served.',
+    ['result'],
+)
+""":class:`prometheus_client.Counter`: Accesses of the :class:`bot.stats_cache.StatsCache` by
+result, i.e. ``hit``, ``miss`` or ``stale``."""
+STATS_CACHE_REFRESH_DURATION = Histogram(
+    'yourls_bot_stats_cache_refresh_duration_seconds',
+    'Duration of the refreshes of the statistics cache.',
+    ['sync'],
+)
+""":class:`prometheus_client.Histogram`: Duration of the refreshes of the
+:class:`bot.stats_cache.StatsCache` by kind of sync, i.e. ``full`` or ``delta``."""
+STATS_CACHE_SIZE = Gauge(
+    'yourls_bot_stats_cache_links', 'Number of links in the statistics cache.'
+)
+""":class:`prometheus_client.Gauge`: Number of links in the :class:`bot.stats_cache.StatsCache`."""
+UPDATE_QUEUE_SIZE = Gauge(
+    'yourls_bot_update_queue_size', 'Number of updates waiting for the dispatcher.'
+)
+""":class:`prometheus_client.Gauge`: Number of updates waiting in the update queue."""
+PENDING_UPDATES = Gauge(
+    'yourls_bot_pending_updates', 'Number of updates waiting for a worker of the dispatcher.'
+)
+""":class:`prometheus_client.Gauge`: Number of updates waiting in the lanes of the
+:class:`bot.dispatcher.OrderedDispatcher`."""
+MESSAGE_QUEUE_SIZE = Gauge(
+    'yourls_bot_message_queue_size', 'Number of outgoing messages waiting to be sent.'
+)
+""":class:`prometheus_client.Gauge`: Number of messages waiting in the
+:class:`bot.message_queue.MessageQueue`."""
+PERSISTENCE_FLUSH_DURATION = Histogram(
+    'yourls_bot_persistence_flush_duration_seconds',
+    'Duration of writing the pending changes to the database.',
+)
+""":class:`prometheus_client.Histogram`: Duration of the flushes of the
+:class:`bot.persistence.SQLitePersistence`."""
+
+
+def _handler_name(callback: Callable) -> str:
+    return f'{callback.__module__.rpartition(".")[2]}.{callback.__name__}'
+
+
+def _instrument_callback(callback: Callable) -> Callable:
+    handler = _handler_name(callback)
+    histogram = HANDLER_DURATION.labels(handler=handler)
+    errors = HANDLER_ERRORS.labels(handler=handler)
+    span_name = f'handler.{handler}'
+
+    @functools.wraps(callback)
+    def wrapper(update: Update, context: CallbackContext) -> Any:
+        start = time.perf_counter()
+        try:
+            with span(span_name):
+                return callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def _label(handler: Handler) -> str:
+    if isinstance(handler, MessageRouter):
+        return 'message_router'
+    if isinstance(handler, ConversationHandler):
+        return handler.name or f'conversation.{_label(handler.entry_points[0])}'
+    if isinstance(getattr(handler, 'handler', None), Handler):
+        return _label(handler.handler)  # type: ignore[attr-defined]
+    return _handler_name(handler.callback)
+
+
+def _trace_check_update(handler: Handler) -> None:
+    check_update = handler.check_update
+    span_name = f'match.{_label(handler)}'
+
+    def wrapper(update: object) -> Any:
+        with span(span_name):
+            return check_update(update)
+
+    handler.check_update = wrapper  # type: ignore[assignment]
+
+
+def _instrument(handlers: Iterable[Handler]) -> None:
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            _instrument(handler.entry_points)
+            for state_handlers in handler.states.values():
+                _instrument(state_handlers)
+            _instrument(handler.fallbacks)
+        elif isinstance(getattr(handler, 'handler', None), Handler):
+            # E.g. a RolesHandler, which hands the update to the wrapped handler
+            _instrument([handler.handler])  # type: ignore[attr-defined]
+        elif isinstance(handler, MessageRouter):
+            if not hasattr(handler.keyword_callback, '__wrapped__'):
+                handler.keyword_callback = _instrument_callback(handler.keyword_callback)
+            if not hasattr(handler.callback, '__wrapped__'):
+                handler.callback = _instrument_callback(handler.callback)
+        elif not hasattr(handler.callback, '__wrapped__'):
+            handler.callback = _instrument_callback(handler.callback)
+
+
+def instrument_handlers(dispatcher: Dispatcher) -> None:
+    """
+    Records the duration of the callbacks of all handlers registered at the dispatcher in
+    :attr:`HANDLER_DURATION`, including the steps of conversations. The handlers are labeled by
+    module and name of the callback, e.g. ``simple_commands.shorten`` or
+    ``kick_user.select_user``. Must be called after all handlers were registered.
+
+    Moreover, the callbacks and the checks whether a handler matches an update are recorded as
+    spans by the :attr:`bot.tracing.tracer`.
+
+    Args:
+        dispatcher: The dispatcher.
+
+    """
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            _trace_check_update(handler)
+        _instrument(handlers)
+
+
+def start_metrics_server(port: int, address: str = '127.0.0.1') -> None:
+    """
+    Serves the metrics for Prometheus at ``http://address:port/metrics`` in a background thread.
+
+    Args:
+        port: The port.
+        address: Optional. The address to listen on. Defaults to ``127.0.0.1``.
+
+    """
+    start_http_server(port, addr=address)
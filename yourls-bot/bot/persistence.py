@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a write-behind persistence backed by SQLite."""
+import json
+import logging
+import os
+import pickle
+import sqlite3
+from collections import defaultdict
+from threading import Event, Lock, Thread
+from typing import Any, DefaultDict, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+from telegram.ext import BasePersistence
+from telegram.utils.types import ConversationDict
+
+from bot.metrics import PERSISTENCE_FLUSH_DURATION
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS bot_data (key BLOB PRIMARY KEY, value BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+'''
+_MIGRATED = 'migrated_from'
+
+KT = TypeVar('KT', bound=Hashable)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Persistence that stores ``user_data``, ``chat_data`` and ``bot_data`` as well as the states of
+    conversations in an SQLite database. Other than :class:`telegram.ext.PicklePersistence`, this
+    never rewrites all of the data: User and chat data are stored one row per user/chat, bot data
+    one row per key and conversations one row per conversation. Only the rows of users and chats
+    whose data changed, the keys of ``bot_data`` whose values changed and the conversations
+    reported as updated are written.
+
+    Writes are deferred: Changes reported by the :class:`telegram.ext.Dispatcher` are collected
+    and written in a single transaction every :attr:`flush_interval` seconds by a background
+    thread. Pending changes are written by :meth:`flush`, which the :class:`telegram.ext.Updater`
+    calls on shutdown. Changes that could not be written, e.g. because pickling failed, stay
+    pending and are retried with the next write.
+
+    Args:
+        filename: Path of the database file.
+        store_user_data: Optional. Whether ``user_data`` should be saved. Defaults to
+            :obj:`True`.
+        store_chat_data: Optional. Whether ``chat_data`` should be saved. Defaults to
+            :obj:`True`.
+        store_bot_data: Optional. Whether ``bot_data`` should be saved. Defaults to
+            :obj:`True`.
+        flush_interval: Optional. Number of seconds between two writes. Defaults to ``5``.
+        migrate_from: Optional. The ``filename`` of a :class:`telegram.ext.PicklePersistence`
+            with ``single_file=False``. If the database doesn't contain migrated data yet and the
+            pickle files exist, their content is copied to the database on startup.
+
+    Attributes:
+        filename: Path of the database file.
+        flush_interval: Number of seconds between two writes.
+
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        flush_interval: float = 5,
+        migrate_from: str = None,
+    ) -> None:
+        super().__init__(
+            store_user_data=store_user_data,
+            store_chat_data=store_chat_data,
+            store_bot_data=store_bot_data,
+        )
+        self.filename = filename
+        self.flush_interval = flush_interval
+
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._db_lock = Lock()
+        with self._db_lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+        if migrate_from:
+            self._migrate(migrate_from)
+
+        # Pending changes, guarded by _pending_lock
+        self._pending_lock = Lock()
+        self._pending_user_data: Dict[int, Dict] = {}
+        self._pending_chat_data: Dict[int, Dict] = {}
+        self._pending_bot_data: Optional[Dict] = None
+        self._pending_conversations: Dict[Tuple[str, str], Optional[object]] = {}
+
+        # Pickled data as last written, used to skip unchanged rows and keys
+        self._user_data_rows: Dict[int, bytes] = {}
+        self._chat_data_rows: Dict[int, bytes] = {}
+        self._bot_data_rows: Dict[bytes, bytes] = {}
+
+        self._stop_event = Event()
+        self._thread = Thread(target=self._write_behind, name='sqlite_persistence', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _dumps(obj: object) -> bytes:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _conversation_key(key: Tuple[int, ...]) -> str:
+        return json.dumps(key)
+
+    def _migrate(self, filename: str) -> None:
+        with self._db_lock:
+            row = self._connection.execute(
+                'SELECT value FROM meta WHERE key = ?', (_MIGRATED,)
+            ).fetchone()
+        if row:
+            return
+
+        def load(suffix: str) -> Any:
+            path = f'{filename}_{suffix}'
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+
+        user_data = load('user_data') or {}
+        chat_data = load('chat_data') or {}
+        bot_data = load('bot_data') or {}
+        conversations = load('conversations') or {}
+
+        with self._db_lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO user_data VALUES (?, ?)',
+                ((uid, self._dumps(data)) for uid, data in user_data.items()),
+            )
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO chat_data VALUES (?, ?)',
+                ((cid, self._dumps(data)) for cid, data in chat_data.items()),
+            )
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO bot_data VALUES (?, ?)',
+                ((self._dumps(key), self._dumps(value)) for key, value in bot_data.items()),
+            )
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)',
+                (
+                    (name, self._conversation_key(key), self._dumps(state))
+                    for name, states in conversations.items()
+                    for key, state in states.items()
+                ),
+            )
+            self._connection.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)', (_MIGRATED, filename)
+            )
+        logger.info(
+            'Migrated %d users, %d chats and %d bot_data keys from %s.',
+            len(user_data),
+            len(chat_data),
+            len(bot_data),
+            filename,
+        )
+
+    def _load_rows(
+        self, table: str, written: Dict[int, bytes]
+    ) -> DefaultDict[int, Dict[Any, Any]]:
+        with self._db_lock:
+            rows = self._connection.execute(f'SELECT id, data FROM {table}').fetchall()
+        written.update(rows)
+        return defaultdict(dict, {row_id: pickle.loads(data) for row_id, data in rows})
+
+    def get_user_data(self) -> DefaultDict[int, Dict[Any, Any]]:
+        """
+        Loads the ``user_data`` from the database.
+
+        Returns:
+            The restored user data.
+
+        """
+        return self._load_rows('user_data', self._user_data_rows)
+
+    def get_chat_data(self) -> DefaultDict[int, Dict[Any, Any]]:
+        """
+        Loads the ``chat_data`` from the database.
+
+        Returns:
+            The restored chat data.
+
+        """
+        return self._load_rows('chat_data', self._chat_data_rows)
+
+    def get_bot_data(self) -> Dict[Any, Any]:
+        """
+        Loads the ``bot_data`` from the database.
+
+        Returns:
+            The restored bot data.
+
+        """
+        with self._db_lock:
+            rows = self._connection.execute('SELECT key, value FROM bot_data').fetchall()
+        self._bot_data_rows = dict(rows)
+        return {pickle.loads(key): pickle.loads(value) for key, value in rows}
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        """
+        Loads the conversations for the given handler from the database.
+
+        Args:
+            name: The handlers name.
+
+        Returns:
+            The restored conversations for the handler.
+
+        """
+        with self._db_lock:
+            rows = self._connection.execute(
+                'SELECT key, state FROM conversations WHERE name = ?', (name,)
+            ).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        """
+        Schedules the new state of the conversation to be written.
+
+        Args:
+            name: The handler's name.
+            key: The key the state is changed for.
+            new_state: The new state for the given key.
+
+        """
+        with self._pending_lock:
+            self._pending_conversations[(name, self._conversation_key(key))] = new_state
+
+    def update_user_data(self, user_id: int, data: Dict) -> None:
+        """
+        Schedules the ``user_data`` of the given user to be written.
+
+        Args:
+            user_id: The user the data might have been changed for.
+            data: The :attr:`telegram.ext.Dispatcher.user_data` ``[user_id]``.
+
+        """
+        with self._pending_lock:
+            self._pending_user_data[user_id] = data
+
+    def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        """
+        Schedules the ``chat_data`` of the given chat to be written.
+
+        Args:
+            chat_id: The chat the data might have been changed for.
+            data: The :attr:`telegram.ext.Dispatcher.chat_data` ``[chat_id]``.
+
+        """
+        with self._pending_lock:
+            self._pending_chat_data[chat_id] = data
+
+    def update_bot_data(self, data: Dict) -> None:
+        """
+        Schedules the ``bot_data`` to be written. Only keys whose values changed will be written.
+
+        Args:
+            data: The :attr:`telegram.ext.Dispatcher.bot_data`.
+
+        """
+        with self._pending_lock:
+            self._pending_bot_data = data
+
+    def _write_behind(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self._write_pending()
+            except Exception:  # pylint: disable=W0703
+                logger.exception('Writing to the persistence failed.')
+
+    def _dump_rows(
+        self, data: Dict[KT, object], written: Dict[KT, bytes], failed: Dict[KT, object]
+    ) -> List[Tuple[KT, bytes]]:
+        # Pickles the values of data, which differ from the written ones. Values that can't be
+        # pickled are moved to failed.
+        rows = []
+        for key, value in data.items():
+            try:
+                row = self._dumps(value)
+            except Exception:  # pylint: disable=W0703
+                logger.exception('Could not pickle the data for %r.', key)
+                failed[key] = value
+                continue
+            if written.get(key) != row:
+                rows.append((key, row))
+        return rows
+
+    def _requeue(
+        self,
+        user_data: Dict[int, Dict],
+        chat_data: Dict[int, Dict],
+        bot_data: Optional[Dict],
+        conversations: Dict[Tuple[str, str], Optional[object]],
+    ) -> None:
+        # Changes reported in the meantime are newer and take precedence
+        with self._pending_lock:
+            for user_id, data in user_data.items():
+                self._pending_user_data.setdefault(user_id, data)
+            for chat_id, data in chat_data.items():
+                self._pending_chat_data.setdefault(chat_id, data)
+            if self._pending_bot_data is None:
+                self._pending_bot_data = bot_data
+            for key, state in conversations.items():
+                self._pending_conversations.setdefault(key, state)
+
+    def _write_pending(self) -> None:
+        with self._pending_lock:
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            chat_data, self._pending_chat_data = self._pending_chat_data, {}
+            bot_data, self._pending_bot_data = self._pending_bot_data, None
+            conversations, self._pending_conversations = self._pending_conversations, {}
+
+        failed_user_data: Dict[int, Dict] = {}
+        failed_chat_data: Dict[int, Dict] = {}
+        failed_conversations: Dict[Tuple[str, str], Optional[object]] = {}
+        user_data_rows = self._dump_rows(user_data, self._user_data_rows, failed_user_data)
+        chat_data_rows = self._dump_rows(chat_data, self._chat_data_rows, failed_chat_data)
+        conversation_rows = self._dump_rows(
+            {key: state for key, state in conversations.items() if state is not None},
+            {},
+            failed_conversations,
+        )
+        deleted_conversations = [key for key, state in conversations.items() if state is None]
+
+        bot_data_rows: Dict[bytes, bytes] = {}
+        deleted_keys = []
+        changed_rows = []
+        bot_data_failed = False
+        if bot_data is not None:
+            for key, value in bot_data.items():
+                try:
+                    dumped_key = self._dumps(key)
+                except Exception:  # pylint: disable=W0703
+                    logger.exception('Could not pickle the bot_data key %r.', key)
+                    bot_data_failed = True
+                    continue
+                try:
+                    bot_data_rows[dumped_key] = self._dumps(value)
+                except Exception:  # pylint: disable=W0703
+                    logger.exception('Could not pickle the bot_data for %r.', key)
+                    bot_data_failed = True
+                    # Keep the value as last written instead of deleting it
+                    if dumped_key in self._bot_data_rows:
+                        bot_data_rows[dumped_key] = self._bot_data_rows[dumped_key]
+            deleted_keys = [(k,) for k in self._bot_data_rows if k not in bot_data_rows]
+            changed_rows = [
+                (k, v) for k, v in bot_data_rows.items() if self._bot_data_rows.get(k) != v
+            ]
+
+        if failed_user_data or failed_chat_data or failed_conversations or bot_data_failed:
+            self._requeue(
+                failed_user_data,
+                failed_chat_data,
+                bot_data if bot_data_failed else None,
+                failed_conversations,
+            )
+
+        if not (
+            user_data_rows
+            or chat_data_rows
+            or changed_rows
+            or deleted_keys
+            or conversation_rows
+            or deleted_conversations
+        ):
+            return
+
+        try:
+            with PERSISTENCE_FLUSH_DURATION.time(), self._db_lock, self._connection:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO user_data VALUES (?, ?)', user_data_rows
+                )
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO chat_data VALUES (?, ?)', chat_data_rows
+                )
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO bot_data VALUES (?, ?)', changed_rows
+                )
+                self._connection.executemany('DELETE FROM bot_data WHERE key = ?', deleted_keys)
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)',
+                    ((name, key, state) for (name, key), state in conversation_rows),
+                )
+                self._connection.executemany(
+                    'DELETE FROM conversations WHERE name = ? AND key = ?', deleted_conversations
+                )
+        except Exception:
+            unwritten_conversations = {key: conversations[key] for key, _ in conversation_rows}
+            unwritten_conversations.update((key, None) for key in deleted_conversations)
+            self._requeue(
+                {user_id: user_data[user_id] for user_id, _ in user_data_rows},
+                {chat_id: chat_data[chat_id] for chat_id, _ in chat_data_rows},
+                bot_data,
+                unwritten_conversations,
+            )
+            raise
+
+        self._user_data_rows.update(user_data_rows)
+        self._chat_data_rows.update(chat_data_rows)
+        if bot_data is not None:
+            self._bot_data_rows = bot_data_rows
+
+    def flush(self) -> None:
+        """Writes all pending changes, stops the background thread and closes the database."""
+        self._stop_event.set()
+        self._thread.join()
+        self._write_pending()
+        with self._db_lock:
+            self._connection.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a cache for the display names of the bots users."""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple, cast
+
+from ptbcontrib.roles import BOT_DATA_KEY, Role
+from telegram import Bot, Chat
+from telegram.ext import CallbackContext
+
+from bot.constants import USER_ROLE
+from bot.services import get_services
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_REQUESTS = 4
+""":obj:`int`: Maximum number of concurrent calls of :meth:`telegram.Bot.get_chat`. Keeps the
+refresh well below Telegrams flood limits."""
+
+
+def display_name(chat: Chat) -> str:
+    """
+    Builds the display name of a user from their private chat.
+
+    Args:
+        chat: The private chat with the user.
+
+    Returns:
+        The full name followed by the username, if present.
+
+    """
+    name = chat.first_name
+    if chat.last_name:
+        name = f'{name} {chat.last_name}'
+    if chat.username:
+        name = f'{name} (@{chat.username})'
+    return name
+
+
+class ProfileCache:
+    """
+    Cache for the display names of users as built by :meth:`display_name`. Names older than
+    :attr:`ttl` seconds are fetched again by :meth:`refresh`.
+
+    Args:
+        ttl: Number of seconds after which a name is fetched again.
+
+    Attributes:
+        ttl: Number of seconds after which a name is fetched again.
+
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._names: Dict[int, Tuple[str, float]] = {}
+        self._lock = Lock()
+
+    def get(self, user_id: int) -> Optional[str]:
+        """
+        Gives the cached name of a user, even if it's outdated.
+
+        Args:
+            user_id: The users ID.
+
+        Returns:
+            The name, if cached. :obj:`None` otherwise.
+
+        """
+        entry = self._names.get(user_id)
+        return entry[0] if entry else None
+
+    def refresh(self, bot: Bot, user_ids: Iterable[int], now: float = None) -> None:
+        """
+        Fetches the names of the given users that are not cached or outdated. The requests are
+        made concurrently by at most :attr:`MAX_CONCURRENT_REQUESTS` threads. Names of users that
+        are not in ``user_ids`` are dropped.
+
+        Args:
+            bot: The bot to fetch the names with.
+            user_ids: The users IDs.
+            now: Optional. The current timestamp. Defaults to :meth:`time.time`.
+
+        """
+        now = time.time() if now is None else now
+        user_ids = set(user_ids)
+        with self._lock:
+            self._names = {uid: e for uid, e in self._names.items() if uid in user_ids}
+            stale = [uid for uid in user_ids if now - self._names.get(uid, ('', 0))[1] > self.ttl]
+        if not stale:
+            return
+
+        def fetch(user_id: int) -> None:
+            try:
+                name = display_name(bot.get_chat(user_id))
+            except Exception:  # pylint: disable=W0703
+                logger.warning('Could not fetch the name of user %d.', user_id, exc_info=True)
+                return
+            with self._lock:
+                self._names[user_id] = (name, now)
+
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(stale))) as pool:
+            pool.map(fetch, stale)
+
+
+def refresh_profiles(context: CallbackContext) -> None:
+    """
+    Refreshes the :attr:`bot.services.Services.profile_cache` for the members of the
+    :attr:`bot.constants.USER_ROLE` role. Meant to be used as job.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.JobQueue`.
+
+    """
+    role = cast(Role, context.bot_data[BOT_DATA_KEY][USER_ROLE])
+    get_services(context).profile_cache.refresh(context.bot, role.chat_ids)
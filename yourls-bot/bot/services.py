@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains the runtime services of the bot."""
+from dataclasses import dataclass
+from typing import Any, TYPE_CHECKING, cast
+
+from telegram.ext import CallbackContext
+
+if TYPE_CHECKING:
+    from bot.async_yourls import AsyncYOURLSClient
+    from bot.circuit_breaker import CircuitBreaker
+    from bot.message_queue import TokenBucket
+    from bot.profile_cache import ProfileCache
+    from bot.stats_cache import StatsCache
+    from bot.utils import YOURLSClient
+
+_SERVICES_ATTRIBUTE = 'yourls_services'
+
+
+@dataclass
+class Services:  # pylint: disable=R0902
+    """
+    The runtime services of the bot. They hold sessions, locks and threads, so they are attached
+    to the dispatcher by :meth:`set_services` instead of being stored in ``bot_data``, which the
+    persistence copies for every update. Use :meth:`get_services` to access them.
+
+    Attributes:
+        yourls: The client for the YOURLS instance.
+        async_yourls: The asynchronous client for the YOURLS instance.
+        circuit_breaker: The circuit breaker guarding both clients.
+        stats_cache: The statistics cache.
+        bulk_import_bucket: Rate limit for the short URLs created by bulk imports.
+        profile_cache: The cache for the display names of the users.
+        shorten_concurrency: Maximum number of links of one message that are shortened
+            concurrently.
+        deferred_inline: Whether the inline mode creates short URLs only for chosen results.
+        janitor_max_age: Number of seconds of inactivity after which data left behind by a user
+            is cleaned up.
+
+    """
+
+    yourls: 'YOURLSClient'
+    async_yourls: 'AsyncYOURLSClient'
+    circuit_breaker: 'CircuitBreaker'
+    stats_cache: 'StatsCache'
+    bulk_import_bucket: 'TokenBucket'
+    profile_cache: 'ProfileCache'
+    shorten_concurrency: int
+    deferred_inline: bool
+    janitor_max_age: int
+
+
+def set_services(dispatcher: Any, services: Services) -> None:
+    """
+    Attaches the services to the dispatcher.
+
+    Args:
+        dispatcher: The dispatcher.
+        services: The services.
+
+    """
+    setattr(dispatcher, _SERVICES_ATTRIBUTE, services)
+
+
+def get_services(context: CallbackContext) -> Services:
+    """
+    Gives the services attached to the dispatcher by :meth:`set_services`.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+    Returns:
+        The services.
+
+    """
+    return cast(Services, getattr(context.dispatcher, _SERVICES_ATTRIBUTE))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains the settings of the bot."""
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class Settings:  # pylint: disable=R0902
+    """
+    The settings of the bot as read from ``bot.ini`` by ``main.py``. See the readme for details
+    on the single settings. The secrets are left out of the representation, such that they don't
+    end up in logs.
+
+    Attributes:
+        token: The token of the bot.
+        client: The URL of the YOURLS instance.
+        signature: The signature to access the YOURLS API.
+        cache_timeout: Timeout for YOURLS statistics cache.
+        admin: The admins Telegram chat ID.
+        full_sync_interval: Interval for full reconciliations of the statistics cache. Defaults
+            to one hour.
+        background_refresh: Whether to refresh the statistics cache in a repeating job instead
+            of while handling updates. Defaults to :obj:`False`.
+        stats_store_path: Path of the database file to store the snapshot of the statistics
+            cache in. If :obj:`None`, the snapshot is kept in memory only. Defaults to
+            :obj:`None`.
+        flush_interval: Interval in seconds in which the persistence writes changes. Defaults to
+            ``5``.
+        connect_timeout: Timeout in seconds for connecting to the YOURLS instance. Defaults to
+            ``5``.
+        read_timeout: Timeout in seconds for responses of the YOURLS instance. Defaults to
+            ``30``.
+        shorten_concurrency: Maximum number of links of one message that are shortened
+            concurrently. Defaults to ``4``.
+        deferred_inline: Whether the inline mode should create short URLs only for chosen
+            results. Defaults to :obj:`False`.
+        janitor_max_age: Number of seconds of inactivity after which data left behind by a user
+            is cleaned up. Defaults to one day.
+        workers: Number of threads processing updates. Defaults to ``4``.
+        profile_cache_ttl: Number of seconds after which the cached names of the users are
+            fetched again. Defaults to one hour.
+        update_queue_size: Maximum number of incoming updates waiting to be processed. Defaults
+            to ``0``, i.e. unlimited.
+        mode: Either ``'polling'`` or ``'webhook'``. Defaults to ``'polling'``.
+        webhook_listen: Address the webhook server listens on. Defaults to ``'127.0.0.1'``.
+        webhook_port: Port the webhook server listens on. Defaults to ``8443``.
+        webhook_secret: Path at which the webhook server accepts updates. Required in webhook
+            mode.
+        webhook_url: Public URL of the webhook server. If empty, the webhook is not registered
+            with Telegram. Defaults to ``''``.
+        webhook_max_connections: Maximum number of connections Telegram opens to the webhook
+            server. Defaults to ``40``.
+        circuit_failure_rate: Fraction of failed requests to the YOURLS instance at which the
+            :class:`bot.circuit_breaker.CircuitBreaker` opens. Defaults to ``0.5``.
+        circuit_slow_call: Duration in seconds from which on requests to the YOURLS instance
+            count as failed. Defaults to ``10``.
+        circuit_open_duration: Number of seconds requests fail right away once the circuit
+            opened. Defaults to ``30``.
+        metrics_port: Port of the Prometheus metrics server. Defaults to ``0``, i.e. disabled.
+        metrics_listen: Address the metrics server listens on. Defaults to ``'127.0.0.1'``.
+        trace_sample_rate: Fraction of the updates traced by the :attr:`bot.tracing.tracer`.
+            Defaults to ``0``, i.e. tracing is disabled.
+        trace_buffer_size: Number of traces to keep. Defaults to ``100``.
+        record_updates: Path of the file to record the incoming updates in. If empty, updates
+            are not recorded. Defaults to ``''``.
+        bulk_import_rate: Maximum number of short URLs created per second by all running bulk
+            imports together. May be below ``1``. Defaults to ``5``.
+
+    """
+
+    token: str = field(repr=False)
+    client: str
+    signature: str = field(repr=False)
+    cache_timeout: int
+    admin: int
+    full_sync_interval: int = 3600
+    background_refresh: bool = False
+    stats_store_path: Optional[str] = None
+    flush_interval: float = 5
+    connect_timeout: float = 5
+    read_timeout: float = 30
+    shorten_concurrency: int = 4
+    deferred_inline: bool = False
+    janitor_max_age: int = 86400
+    workers: int = 4
+    profile_cache_ttl: int = 3600
+    update_queue_size: int = 0
+    mode: str = 'polling'
+    webhook_listen: str = '127.0.0.1'
+    webhook_port: int = 8443
+    webhook_secret: Optional[str] = field(default=None, repr=False)
+    webhook_url: str = ''
+    webhook_max_connections: int = 40
+    circuit_failure_rate: float = 0.5
+    circuit_slow_call: float = 10
+    circuit_open_duration: float = 30
+    metrics_port: int = 0
+    metrics_listen: str = '127.0.0.1'
+    trace_sample_rate: float = 0
+    trace_buffer_size: int = 100
+    record_updates: str = ''
+    bulk_import_rate: float = 5
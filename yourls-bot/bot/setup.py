@@ -4,6 +4,7 @@
 import warnings
 from typing import cast
 
+from telegram import Update
 from telegram.ext import (
     Dispatcher,
     MessageHandler,
@@ -11,6 +12,7 @@ from telegram.ext import (
     InlineQueryHandler,
     ChosenInlineResultHandler,
     CommandHandler,
+    TypeHandler,
 )
 
 from ptbcontrib.roles import setup_roles, RolesHandler, Roles
@@ -20,11 +22,30 @@ from .change_keyword import build_change_keyword_conversation_handler
 from .change_url import build_change_url_conversation_handler
 from .delete_shorturl import build_delete_conversation_handler
 from .kick_user import build_kick_user_conversation_handler
+from .async_yourls import AsyncYOURLSClient
+from .bulk_import import bulk_import
+from .circuit_breaker import CircuitBreaker, report_state, backend_status
+from .deletion_queue import DeletionQueue, process_deletion_queue
 from .error_handler import error_handler
-from .inline import inline_redirect_info, inline_shorten, delete_temp_links
+from .janitor import record_activity, clean_up
+from .message_queue import TokenBucket
+from .message_router import MessageRouter
+from .inline import inline_redirect_info, inline_shorten, delete_temp_links, create_deferred_link
+from .metrics import (
+    instrument_handlers,
+    STATS_CACHE_SIZE,
+    UPDATE_QUEUE_SIZE,
+    PENDING_UPDATES,
+    MESSAGE_QUEUE_SIZE,
+)
+from .profile_cache import ProfileCache, refresh_profiles
+from .tracing import tracer, traces_command
 from .simple_commands import shorten, shorten_with_keyword, info
-from .utils import YOURLSClient, TwoWordFilter
-from .constants import USER_ROLE, YOURLS_KEY, CACHE_TIMEOUT_KEY
+from .utils import YOURLSClient
+from .stats_cache import StatsCache, refresh_stats_cache
+from .services import Services, set_services
+from .settings import Settings
+from .constants import USER_ROLE, DELETION_QUEUE_KEY, TEMPORARY_KEYWORDS_KEY
 
 # B/C we know what we're doing
 warnings.filterwarnings('ignore', message="If 'per_", module='telegram.ext.conversationhandler')
@@ -39,29 +60,110 @@ warnings.filterwarnings(
     module='telegram.ext.basepersistence',
 )
 
+DELETION_INTERVAL = 5
+""":obj:`int`: Interval in seconds in which :meth:`bot.deletion_queue.process_deletion_queue`
+runs."""
+JANITOR_INTERVAL = 3600
+""":obj:`int`: Maximum interval in seconds in which :meth:`bot.janitor.clean_up` runs."""
+LEGACY_SERVICE_KEYS = (
+    'yourls_key',
+    'async_yourls_key',
+    'circuit_breaker_key',
+    'stats_key',
+    'bulk_import_bucket_key',
+    'profile_cache_key',
+    'shorten_concurrency_key',
+    'deferred_inline_key',
+    'janitor_max_age_key',
+    'cache_timeout_key',
+)
+"""Tuple[:obj:`str`]: Keys under which earlier versions stored the services in ``bot_data``.
+They are removed on start up, such that the persistence doesn't keep them."""
+
 
-def setup_dispatcher(
-    dispatcher: Dispatcher, client: str, signature: str, cache_timeout: int, admin: int
-) -> None:
+def setup_dispatcher(dispatcher: Dispatcher, settings: Settings) -> Services:
     """
     Registers the different handlers, prepares ``chat/user/bot_data`` etc.
 
     Args:
         dispatcher: The dispatcher.
-        client: The URL of the YOURLS instance.
-        signature: The signature to access the YOURLS API
-        cache_timeout: Timeout for YOURLS statistics cache.
-        admin: The admins Telegram chat ID.
+        settings: The settings of the bot.
+
+    Returns:
+        The services attached to the dispatcher.
 
     """
-    yourls = YOURLSClient(client, signature=signature, nonce_life=True)
-    dispatcher.bot_data[YOURLS_KEY] = yourls
-    dispatcher.bot_data[CACHE_TIMEOUT_KEY] = cache_timeout
+    tracer.configure(settings.trace_sample_rate, settings.trace_buffer_size)
+    circuit_breaker = CircuitBreaker(
+        failure_rate=settings.circuit_failure_rate,
+        slow_call_duration=settings.circuit_slow_call,
+        open_duration=settings.circuit_open_duration,
+        listener=lambda state: dispatcher.job_queue.run_once(report_state, 0, context=state),
+    )
+    # One connection per worker thread plus one for the dispatcher and one for the job queue
+    yourls = YOURLSClient(
+        settings.client,
+        signature=settings.signature,
+        nonce_life=True,
+        pool_size=dispatcher.workers + 2,
+        connect_timeout=settings.connect_timeout,
+        read_timeout=settings.read_timeout,
+        circuit_breaker=circuit_breaker,
+    )
+    stats_cache = StatsCache(
+        settings.cache_timeout,
+        settings.full_sync_interval,
+        background_refresh=settings.background_refresh,
+        store_path=settings.stats_store_path,
+    )
+    # The marks are not persisted, but the temporary keywords of the inline mode are
+    for user_data in dispatcher.user_data.values():
+        for keyword in user_data.get(TEMPORARY_KEYWORDS_KEY, []):
+            stats_cache.mark_temporary(keyword)
+    services = Services(
+        yourls=yourls,
+        async_yourls=AsyncYOURLSClient(
+            yourls.apiurl,
+            signature=settings.signature,
+            nonce_life=True,
+            connect_timeout=settings.connect_timeout,
+            read_timeout=settings.read_timeout,
+            circuit_breaker=circuit_breaker,
+        ),
+        circuit_breaker=circuit_breaker,
+        stats_cache=stats_cache,
+        # With a capacity below one token, the bucket would never allow a request
+        bulk_import_bucket=TokenBucket(
+            settings.bulk_import_rate, max(1, settings.bulk_import_rate)
+        ),
+        profile_cache=ProfileCache(settings.profile_cache_ttl),
+        shorten_concurrency=settings.shorten_concurrency,
+        deferred_inline=settings.deferred_inline,
+        janitor_max_age=settings.janitor_max_age,
+    )
+    set_services(dispatcher, services)
+    for key in LEGACY_SERVICE_KEYS:
+        dispatcher.bot_data.pop(key, None)
+    dispatcher.bot_data.setdefault(DELETION_QUEUE_KEY, DeletionQueue())
+    dispatcher.job_queue.run_repeating(process_deletion_queue, interval=DELETION_INTERVAL)
+    dispatcher.job_queue.run_repeating(
+        clean_up, interval=min(settings.janitor_max_age, JANITOR_INTERVAL), first=JANITOR_INTERVAL
+    )
+    dispatcher.job_queue.run_repeating(
+        refresh_profiles, interval=settings.profile_cache_ttl, first=0
+    )
+    if settings.background_refresh:
+        dispatcher.job_queue.run_repeating(
+            refresh_stats_cache, interval=settings.cache_timeout, first=0
+        )
     bot_id = dispatcher.bot.id
 
+    # Own group, so that no other handler can prevent this from running
+    dispatcher.add_handler(TypeHandler(Update, record_activity), group=-10)
+
     roles = cast(Roles, setup_roles(dispatcher))
 
-    roles.add_admin(admin)
+    roles.add_admin(settings.admin)
     if USER_ROLE not in roles:
         roles.add_role(name=USER_ROLE)
     user_role = roles[USER_ROLE]
@@ -72,16 +174,25 @@ def setup_dispatcher(
     dispatcher.add_handler(build_add_user_conversation_handler(roles.admins))
     dispatcher.add_handler(build_kick_user_conversation_handler(roles.admins, bot_id))
 
-    dispatcher.add_handler(ChosenInlineResultHandler(delete_temp_links))
     dispatcher.add_handler(
-        RolesHandler(
-            MessageHandler(TwoWordFilter() & ~Filters.via_bot(bot_id), shorten_with_keyword),
-            roles=user_role,
+        ChosenInlineResultHandler(
+            create_deferred_link if settings.deferred_inline else delete_temp_links
         )
     )
+    dispatcher.add_handler(
+        RolesHandler(MessageRouter(shorten_with_keyword, shorten, bot_id), roles=user_role)
+    )
+    # Imports take long, so they don't block a worker of the OrderedDispatcher
     dispatcher.add_handler(
         RolesHandler(
-            MessageHandler(Filters.text & ~Filters.command & ~Filters.via_bot(bot_id), shorten),
+            MessageHandler(
+                Filters.document.file_extension('csv')
+                | Filters.document.file_extension('txt')
+                | Filters.document.mime_type('text/csv')
+                | Filters.document.mime_type('text/plain'),
+                bulk_import,
+                run_async=True,
+            ),
             roles=user_role,
         )
     )
@@ -93,6 +204,20 @@ def setup_dispatcher(
         )
     )
     dispatcher.add_handler(CommandHandler(['start', 'help', 'info'], info))
+    dispatcher.add_handler(
+        RolesHandler(CommandHandler('backend_status', backend_status), roles=roles.admins)
+    )
+    dispatcher.add_handler(
+        RolesHandler(CommandHandler('traces', traces_command), roles=roles.admins)
+    )
+
+    instrument_handlers(dispatcher)
+    STATS_CACHE_SIZE.set_function(lambda: len(stats_cache))
+    UPDATE_QUEUE_SIZE.set_function(dispatcher.update_queue.qsize)
+    PENDING_UPDATES.set_function(lambda: getattr(dispatcher, 'pending_updates', 0))
+    message_queue = getattr(dispatcher.bot, 'message_queue', None)
+    if message_queue is not None:
+        MESSAGE_QUEUE_SIZE.set_function(lambda: len(message_queue))
 
     dispatcher.bot.set_my_commands(
         [
@@ -101,8 +226,11 @@ def setup_dispatcher(
             ('delete_url', 'Delete existing keyword'),
             ('add_user', 'Authorize a user to use this bot'),
             ('kick_user', 'Disallow a user from using this bot'),
+            ('backend_status', 'Show the state of the YOURLS instance'),
+            ('traces', 'Show the slowest recently traced updates'),
             ('help', 'Display general information'),
         ]
     )
 
     dispatcher.add_error_handler(error_handler)
+    return services
@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """The module contains some basic functionality."""
+import html
+import logging
+from typing import Union, Dict
+
 from ptbcontrib.extract_urls import extract_urls
 from telegram import MessageEntity, Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import CallbackContext
-from yourls import YOURLSKeywordExistsError
+from yourls import (
+    YOURLSKeywordExistsError,
+    ShortenedURL,
+    YOURLSNoURLError,
+    YOURLSNoLoopError,
+    YOURLSURLExistsError,
+)
+
+from bot.constants import USER_GUIDE
+from bot.services import get_services
+from bot.utils import sanitize_protocol, get_stats_cache
 
-from bot.constants import USER_GUIDE, YOURLS_KEY
-from bot.utils import sanitize_protocol
+logger = logging.getLogger(__name__)
 
 
 def info(update: Update, context: CallbackContext) -> None:
@@ -18,7 +31,7 @@ def info(update: Update, context: CallbackContext) -> None:
         update: The Telegram update.
         context: The callback context as provided by the dispatcher.
     """
-    yourls = context.bot_data[YOURLS_KEY]
+    yourls = get_services(context).yourls
     text = (
         f'Hi! I am <b>{context.bot.bot.full_name}</b> and here to create and manage short URLs '
         f'with the YOURLS instance hosted at {yourls.url}. Please note that I will only respond '
@@ -37,10 +50,28 @@ def info(update: Update, context: CallbackContext) -> None:
     update.effective_message.reply_text(text, reply_markup=keyboard)
 
 
+def _result_or_error(
+    url: str, result: Union[ShortenedURL, BaseException]
+) -> Union[ShortenedURL, str]:
+    if isinstance(result, ShortenedURL):
+        return result
+    if isinstance(result, YOURLSURLExistsError):
+        return result.url
+    if isinstance(result, (YOURLSNoURLError, YOURLSNoLoopError)):
+        return f'❌ <code>{html.escape(url)}</code> can not be shortened.'
+    logger.error('Shortening %s failed.', url, exc_info=result)
+    return f'❌ Shortening <code>{html.escape(url)}</code> failed.'
+
+
 def shorten(update: Update, context: CallbackContext) -> None:
     """
     Shortens all (unique) links contained in a message and sends the short links as reply in the
-    order of appearance.
+    order of appearance. The links are shortened concurrently by the
+    :class:`bot.async_yourls.AsyncYOURLSClient`, at most
+    :attr:`bot.services.Services.shorten_concurrency` at a time. Links that can't be shortened are
+    reported in place of their short link. For links that are already known to the
+    :class:`bot.stats_cache.StatsCache`, the existing short link is reused. The cache is not
+    refreshed for that, i.e. only links known to the current snapshot are reused.
 
     Args:
         update: The incoming update containing links to shorten.
@@ -53,12 +84,31 @@ def shorten(update: Update, context: CallbackContext) -> None:
         if link not in unique_links:
             unique_links[link] = link
 
-    yourls = context.bot_data[YOURLS_KEY]
+    services = get_services(context)
+    async_yourls = services.async_yourls
     message_list = ['The following short links were created:\n']
 
-    for url in unique_links:
-        short_url_instance = yourls.shorten(url)
-        message_list.append(short_url_instance.shorturl)
+    # Plain shortening must not wait for a sync, so the current snapshot is used as is
+    stats_cache = services.stats_cache
+    results: Dict[str, Union[ShortenedURL, str, None]] = {
+        url: stats_cache.find_url(url) for url in unique_links
+    }
+    missing = [url for url, result in results.items() if result is None]
+
+    created = async_yourls.run(
+        async_yourls.gather(
+            *(async_yourls.shorten(url) for url in missing),
+            limit=services.shorten_concurrency,
+        )
+    )
+
+    for url, raw_result in zip(missing, created):
+        result = results[url] = _result_or_error(url, raw_result)
+        if isinstance(result, ShortenedURL):
+            stats_cache.add(result)
+
+    for result in results.values():
+        message_list.append(result.shorturl if isinstance(result, ShortenedURL) else str(result))
 
     message = '\n'.join(message_list)
     update.effective_message.reply_text(message, disable_web_page_preview=True)
@@ -88,9 +138,11 @@ def shorten_with_keyword(update: Update, context: CallbackContext) -> None:
     words.remove(word)
     keyword = words[0]
 
-    yourls = context.bot_data[YOURLS_KEY]
+    yourls = get_services(context).yourls
     try:
-        update.effective_message.reply_text(yourls.shorten(url, keyword=keyword).shorturl)
+        short_url = yourls.shorten(url, keyword=keyword)
+        get_stats_cache(context).add(short_url)
+        update.effective_message.reply_text(short_url.shorturl)
     except YOURLSKeywordExistsError:
         update.effective_message.reply_text(
             f'The keyword <code>{keyword}</code> is already in use. Please choose another.'
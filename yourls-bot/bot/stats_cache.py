@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains the cache for the statistics of the YOURLS instance."""
+import logging
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Set, Tuple, cast
+
+from telegram.ext import CallbackContext
+from yourls import ShortenedURL
+
+from bot.metrics import STATS_CACHE_REFRESH_DURATION
+from bot.services import get_services
+from bot.tracing import span
+from bot.stats_store import StatsStore
+from bot.utils import YOURLSClient, extract_keyword, normalize_url
+
+logger = logging.getLogger(__name__)
+
+DELTA_PAGE_SIZE = 100
+""":obj:`int`: Number of links requested per call to :meth:`yourls.core.stats` during a delta
+sync."""
+MAX_DELTA_PAGES = 50
+""":obj:`int`: If a delta sync needs more pages than this, a full sync is done instead."""
+
+Change = Tuple[str, Optional[ShortenedURL]]
+"""A keyword and the short URL it was set to or :obj:`None`, if it was removed."""
+
+
+def short_url_keyword(short_url: ShortenedURL) -> str:
+    """
+    Gives the keyword of a short URL. Falls back to :meth:`bot.utils.extract_keyword`, if the
+    YOURLS instance didn't include the keyword in the response.
+
+    Args:
+        short_url: The short URL.
+
+    Returns:
+        The keyword.
+
+    """
+    return short_url.keyword or extract_keyword(short_url.shorturl)
+
+
+class StatsCache:
+    """
+    Cache for the short URLs stored on the YOURLS instance. Instead of downloading all links on
+    every refresh, only links newer than the newest known link are fetched and merged into the
+    cache (delta sync). Because this misses links that were deleted or edited outside of the bot,
+    a full reconciliation is done every :attr:`full_sync_interval` seconds.
+
+    If :attr:`background_refresh` is :obj:`True`, the cache is never refreshed while handling an
+    update. Instead, :meth:`refresh_stats_cache` is expected to run as repeating job and the last
+    snapshot is served in the meantime.
+
+    Refreshes are single-flight: While one thread refreshes the cache, other threads calling
+    :meth:`refresh_if_stale` are served the current snapshot instead of starting another download.
+    The timestamps are only updated once a sync succeeded. Changes made by the bot via
+    :meth:`add`, :meth:`remove`, :meth:`update_url` and :meth:`rename` while a sync is running are
+    recorded and applied to the new snapshot before it replaces the current one, such that they
+    are not lost.
+
+    Besides the index by keyword, the cache keeps a reverse index by the long URL as normalized by
+    :meth:`bot.utils.normalize_url`, which allows to reuse existing short URLs. Keywords marked
+    as temporary by :meth:`mark_temporary` are never offered for reuse, as they will be deleted.
+
+    If :attr:`store_path` is given, the snapshot is kept in a :class:`bot.stats_store.StatsStore`
+    as well. It is loaded lazily on first use, so that the cache is warm after a restart, and
+    every sync or change is written through row by row.
+
+    Args:
+        cache_timeout: Number of seconds after which the cache is considered stale.
+        full_sync_interval: Number of seconds between two full reconciliations.
+        background_refresh: Optional. Whether the cache is refreshed in the background. Defaults
+            to :obj:`False`.
+        store_path: Optional. Path of the database file to store the snapshot in. If not passed,
+            the snapshot is kept in memory only.
+
+    Attributes:
+        cache_timeout: Number of seconds after which the cache is considered stale.
+        full_sync_interval: Number of seconds between two full reconciliations.
+        background_refresh: Whether the cache is refreshed in the background.
+        store_path: Path of the database file to store the snapshot in.
+        last_sync: Timestamp of the last successful sync.
+        last_full_sync: Timestamp of the last successful full sync.
+
+    """
+
+    def __init__(
+        self,
+        cache_timeout: float,
+        full_sync_interval: float,
+        background_refresh: bool = False,
+        store_path: str = None,
+    ) -> None:
+        self.cache_timeout = cache_timeout
+        self.full_sync_interval = full_sync_interval
+        self.background_refresh = background_refresh
+        self.store_path = store_path
+        self._temporary_keywords: Set[str] = set()
+        self.last_sync = 0.0
+        self.last_full_sync = 0.0
+        self._links: Dict[str, ShortenedURL] = {}
+        self._urls: Dict[str, str] = {}
+        self._newest: Optional[ShortenedURL] = None
+        self._changes: Optional[List[Change]] = None
+        self._refresh_lock = Lock()
+        self._snapshot_lock = Lock()
+        self._load_lock = Lock()
+        self._store: Optional[StatsStore] = None
+        self._loaded = self.store_path is None
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self._store = StatsStore(cast(str, self.store_path))
+            links, meta = self._store.load()
+            self._links = links
+            self._urls = self._build_url_index(links)
+            self._newest = links.get(meta.get('newest', ''))
+            self.last_sync = float(meta.get('last_sync', 0))
+            self.last_full_sync = float(meta.get('last_full_sync', 0))
+            self._loaded = True
+            logger.info('Loaded %d links from the stats store.', len(links))
+
+    @staticmethod
+    def _build_url_index(links: Dict[str, ShortenedURL]) -> Dict[str, str]:
+        return {normalize_url(su.url): keyword for keyword, su in links.items()}
+
+    @staticmethod
+    def _apply_change(
+        links: Dict[str, ShortenedURL],
+        urls: Dict[str, str],
+        keyword: str,
+        short_url: Optional[ShortenedURL],
+    ) -> None:
+        old_short_url = links.pop(keyword, None)
+        if old_short_url:
+            normalized_url = normalize_url(old_short_url.url)
+            if urls.get(normalized_url) == keyword:
+                del urls[normalized_url]
+        if short_url:
+            links[keyword] = short_url
+            urls.setdefault(normalize_url(short_url.url), keyword)
+
+    def _change(self, keyword: str, short_url: Optional[ShortenedURL]) -> None:
+        self._ensure_loaded()
+        with self._snapshot_lock:
+            self._apply_change(self._links, self._urls, keyword, short_url)
+            if self._changes is not None:
+                self._changes.append((keyword, short_url))
+            if self._store:
+                if short_url:
+                    self._store.upsert([(keyword, short_url)])
+                else:
+                    self._store.delete(keyword)
+
+    @contextmanager
+    def _recording_changes(self) -> Iterator[None]:
+        # Records the changes made while a sync downloads links, such that they can be applied
+        # to the new snapshot
+        with self._snapshot_lock:
+            self._changes = []
+        try:
+            yield
+        finally:
+            with self._snapshot_lock:
+                self._changes = None
+
+    def _replay_changes(self, links: Dict[str, ShortenedURL], urls: Dict[str, str]) -> None:
+        # Must be called while holding the snapshot lock
+        for keyword, short_url in self._changes or ():
+            self._apply_change(links, urls, keyword, short_url)
+
+    @property
+    def short_urls(self) -> List[ShortenedURL]:
+        """List of all cached short URLs."""
+        self._ensure_loaded()
+        return list(self._links.values())
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._links)
+
+    @property
+    def age(self) -> float:
+        """Number of seconds since the last successful sync."""
+        self._ensure_loaded()
+        return time.time() - self.last_sync
+
+    def get(self, keyword: str) -> Optional[ShortenedURL]:
+        """
+        Looks up a keyword in the cache.
+
+        Args:
+            keyword: The keyword.
+
+        Returns:
+            The cached short URL for the keyword, if present. :obj:`None` otherwise.
+
+        """
+        self._ensure_loaded()
+        return self._links.get(keyword)
+
+    def find_url(self, url: str) -> Optional[ShortenedURL]:
+        """
+        Looks up a long URL in the cache.
+
+        Args:
+            url: The long URL. Will be normalized by :meth:`bot.utils.normalize_url`.
+
+        Returns:
+            A cached short URL for the long URL, if present and not temporary. :obj:`None`
+            otherwise.
+
+        """
+        self._ensure_loaded()
+        keyword = self._urls.get(normalize_url(url))
+        if not keyword or keyword in self._temporary_keywords:
+            return None
+        return self._links.get(keyword)
+
+    def mark_temporary(self, keyword: str) -> None:
+        """
+        Marks a keyword as temporary, e.g. because it was created by the inline mode and will be
+        deleted, if the user doesn't choose it. :meth:`find_url` won't return it, until it's
+        marked as permanent by :meth:`mark_permanent`. The mark is dropped by :meth:`remove`.
+
+        Args:
+            keyword: The keyword.
+
+        """
+        with self._snapshot_lock:
+            self._temporary_keywords.add(keyword)
+
+    def mark_permanent(self, keyword: str) -> None:
+        """
+        Drops the mark set by :meth:`mark_temporary`.
+
+        Args:
+            keyword: The keyword.
+
+        """
+        with self._snapshot_lock:
+            self._temporary_keywords.discard(keyword)
+
+    def add(self, short_url: ShortenedURL) -> None:
+        """
+        Adds a short URL that was created by the bot to the cache, so that it's known before the
+        next sync.
+
+        Args:
+            short_url: The short URL.
+
+        """
+        self._change(short_url_keyword(short_url), short_url)
+
+    def remove(self, keyword: str) -> None:
+        """
+        Removes a short URL that was deleted by the bot from the cache. Also drops the mark set by
+        :meth:`mark_temporary`.
+
+        Args:
+            keyword: The keyword of the short URL.
+
+        """
+        self._change(keyword, None)
+        self.mark_permanent(keyword)
+
+    def update_url(self, keyword: str, url: str) -> None:
+        """
+        Updates the long URL of a cached short URL after it was changed by the bot.
+
+        Args:
+            keyword: The keyword of the short URL.
+            url: The new long URL.
+
+        """
+        self._ensure_loaded()
+        short_url = self._links.get(keyword)
+        if short_url:
+            self._change(keyword, None)
+            self.add(
+                ShortenedURL(
+                    shorturl=short_url.shorturl,
+                    url=url,
+                    title=short_url.title,
+                    date=short_url.date,
+                    ip=short_url.ip,
+                    clicks=short_url.clicks,
+                    keyword=keyword,
+                )
+            )
+
+    def rename(self, keyword: str, new_keyword: str, new_short_url: str) -> None:
+        """
+        Updates the keyword of a cached short URL after it was changed by the bot.
+
+        Args:
+            keyword: The old keyword of the short URL.
+            new_keyword: The new keyword.
+            new_short_url: The new short URL.
+
+        """
+        self._ensure_loaded()
+        short_url = self._links.get(keyword)
+        if short_url:
+            self._change(keyword, None)
+            self.add(
+                ShortenedURL(
+                    shorturl=new_short_url,
+                    url=short_url.url,
+                    title=short_url.title,
+                    date=short_url.date,
+                    ip=short_url.ip,
+                    clicks=short_url.clicks,
+                    keyword=new_keyword,
+                )
+            )
+
+    def is_stale(self, now: float = None) -> bool:
+        """
+        Checks whether the cache needs a refresh.
+
+        Args:
+            now: Optional. The current timestamp. Defaults to :meth:`time.time`.
+
+        """
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        return now - self.last_sync > self.cache_timeout
+
+    def refresh_if_stale(self, yourls: YOURLSClient) -> bool:
+        """
+        Refreshes the cache, if it's stale and no other thread is already refreshing it. If
+        another thread is refreshing it, returns right away - unless the cache has never been
+        filled, in which case this waits for the running refresh to finish.
+
+        Args:
+            yourls: The client to fetch the statistics with.
+
+        Returns:
+            Whether this call refreshed the cache.
+
+        """
+        if not self.is_stale():
+            return False
+
+        # pylint: disable=R1732
+        if self._refresh_lock.acquire(blocking=self._newest is None):
+            try:
+                # Another thread may have finished a refresh while we waited for the lock
+                if self.is_stale():
+                    self._refresh(yourls)
+                    return True
+            finally:
+                self._refresh_lock.release()
+        return False
+
+    def refresh(self, yourls: YOURLSClient, now: float = None) -> None:
+        """
+        Updates the cache. Does a full sync, if the cache is empty or the last full sync is older
+        than :attr:`full_sync_interval`. Otherwise does a delta sync. Waits for a refresh that's
+        already running in another thread to finish first.
+
+        Args:
+            yourls: The client to fetch the statistics with.
+            now: Optional. The current timestamp. Defaults to :meth:`time.time`.
+
+        """
+        with self._refresh_lock:
+            self._refresh(yourls, now)
+
+    def _refresh(self, yourls: YOURLSClient, now: float = None) -> None:
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        if self._newest is None or now - self.last_full_sync > self.full_sync_interval:
+            self._timed_full_sync(yourls, now)
+            return
+
+        with span('stats_cache.delta_sync'), STATS_CACHE_REFRESH_DURATION.labels('delta').time():
+            complete = self.delta_sync(yourls, now)
+        if not complete:
+            self._timed_full_sync(yourls, now)
+
+    def _timed_full_sync(self, yourls: YOURLSClient, now: float) -> None:
+        with span('stats_cache.full_sync'), STATS_CACHE_REFRESH_DURATION.labels('full').time():
+            self.full_sync(yourls, now)
+
+    def full_sync(self, yourls: YOURLSClient, now: float = None) -> None:
+        """
+        Replaces the cache by all links currently stored on the YOURLS instance.
+
+        Args:
+            yourls: The client to fetch the statistics with.
+            now: Optional. The current timestamp. Defaults to :meth:`time.time`.
+
+        """
+        now = time.time() if now is None else now
+        with self._recording_changes():
+            short_urls = yourls.stats('last', int(10e42))[0]
+            links = {short_url_keyword(su): su for su in short_urls}
+            newest = short_urls[0] if short_urls else None
+            with self._snapshot_lock:
+                urls = self._build_url_index(links)
+                self._replay_changes(links, urls)
+                if self._store:
+                    self._store.replace(
+                        links,
+                        newest=short_url_keyword(newest) if newest else None,
+                        last_sync=str(now),
+                        last_full_sync=str(now),
+                    )
+                self._links = links
+                self._urls = urls
+                self._newest = newest
+                self.last_sync = self.last_full_sync = now
+        logger.debug('Full sync of the stats cache fetched %d links.', len(links))
+
+    def _fetch_delta(self, yourls: YOURLSClient) -> Optional[List[ShortenedURL]]:
+        newest_date = cast(ShortenedURL, self._newest).date
+        new_links: List[ShortenedURL] = []
+        for page in range(MAX_DELTA_PAGES):
+            short_urls = yourls.stats('last', DELTA_PAGE_SIZE, start=page * DELTA_PAGE_SIZE)[0]
+            for short_url in short_urls:
+                # Dates have a resolution of seconds, so links with the same date as the newest
+                # known link may or may not be known already
+                if short_url.date < newest_date:
+                    break
+                if short_url.date == newest_date and short_url_keyword(short_url) in self._links:
+                    continue
+                new_links.append(short_url)
+            else:
+                if len(short_urls) == DELTA_PAGE_SIZE:
+                    continue
+            break
+        else:
+            return None
+        return new_links
+
+    def delta_sync(self, yourls: YOURLSClient, now: float = None) -> bool:
+        """
+        Fetches the links that are newer than the newest cached link and merges them into the
+        cache. Relies on the ``last`` filter of :meth:`yourls.core.stats` returning the links
+        ordered by their creation date, newest first.
+
+        Args:
+            yourls: The client to fetch the statistics with.
+            now: Optional. The current timestamp. Defaults to :meth:`time.time`.
+
+        Returns:
+            :obj:`True`, if the delta could be merged. :obj:`False`, if the delta was too large
+            and a full sync should be done instead.
+
+        """
+        now = time.time() if now is None else now
+        if self._newest is None:
+            return False
+
+        with self._recording_changes():
+            new_links = self._fetch_delta(yourls)
+            if new_links is None:
+                return False
+
+            with self._snapshot_lock:
+                merged: List[Tuple[str, ShortenedURL]] = []
+                if new_links:
+                    # Merge into a copy so that concurrent readers never see a dict changing in
+                    # size
+                    links = self._links.copy()
+                    urls = self._urls.copy()
+                    for short_url in reversed(new_links):
+                        keyword = short_url_keyword(short_url)
+                        links[keyword] = short_url
+                        urls.setdefault(normalize_url(short_url.url), keyword)
+                    self._replay_changes(links, urls)
+                    # Links the bot removed in the meantime must not be written to the store
+                    merged = [
+                        (short_url_keyword(su), su)
+                        for su in new_links
+                        if links.get(short_url_keyword(su)) is su
+                    ]
+                    self._links = links
+                    self._urls = urls
+                    self._newest = new_links[0]
+                if self._store:
+                    self._store.upsert(
+                        merged, newest=short_url_keyword(self._newest), last_sync=str(now)
+                    )
+                self.last_sync = now
+        logger.debug('Delta sync of the stats cache fetched %d new links.', len(new_links))
+        return True
+
+
+def refresh_stats_cache(context: CallbackContext) -> None:
+    """
+    Refreshes the :attr:`bot.services.Services.stats_cache`. Meant to be used as repeating job,
+    if :attr:`StatsCache.background_refresh` is :obj:`True`. Errors are only logged, such that
+    the last snapshot is served until the next run succeeds.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.JobQueue`.
+
+    """
+    services = get_services(context)
+    stats_cache = services.stats_cache
+    age = stats_cache.age
+    try:
+        stats_cache.refresh(services.yourls)
+        logger.debug('Refreshed stats cache. The previous snapshot was %.1f seconds old.', age)
+    except Exception:  # pylint: disable=W0703
+        logger.warning(
+            'Refreshing the stats cache failed. Serving snapshot that is %.1f seconds old.',
+            age,
+            exc_info=True,
+        )
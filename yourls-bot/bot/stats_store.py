@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains the on-disk store for the snapshot of the statistics cache."""
+import sqlite3
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+from yourls import ShortenedURL
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS links (
+    keyword TEXT PRIMARY KEY,
+    shorturl TEXT NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT,
+    date TEXT NOT NULL,
+    ip TEXT,
+    clicks INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+_UPSERT = 'INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+
+def _to_row(keyword: str, short_url: ShortenedURL) -> Tuple:
+    return (
+        keyword,
+        short_url.shorturl,
+        short_url.url,
+        short_url.title,
+        short_url.date.isoformat(),
+        short_url.ip,
+        short_url.clicks,
+    )
+
+
+def _from_row(row: Tuple) -> ShortenedURL:
+    keyword, shorturl, url, title, date, ip, clicks = row
+    return ShortenedURL(
+        shorturl=shorturl,
+        url=url,
+        title=title,
+        date=datetime.fromisoformat(date),
+        ip=ip,
+        clicks=clicks,
+        keyword=keyword,
+    )
+
+
+class StatsStore:
+    """
+    Stores the snapshot of a :class:`bot.stats_cache.StatsCache` in an SQLite database, one row
+    per short URL. This way, the snapshot survives restarts and can be updated row by row instead
+    of being rewritten as a whole.
+
+    Args:
+        path: Path of the database file.
+
+    Attributes:
+        path: Path of the database file.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def load(self) -> Tuple[Dict[str, ShortenedURL], Dict[str, str]]:
+        """
+        Loads the snapshot.
+
+        Returns:
+            A dictionary mapping the keywords to the short URLs and a dictionary holding the
+            metadata as set by :meth:`set_meta`.
+
+        """
+        with self._lock:
+            links = {
+                row[0]: _from_row(row) for row in self._connection.execute('SELECT * FROM links')
+            }
+            meta = dict(self._connection.execute('SELECT key, value FROM meta'))
+        return links, meta
+
+    def replace(self, links: Dict[str, ShortenedURL], **meta: Optional[str]) -> None:
+        """
+        Replaces the stored snapshot as a whole.
+
+        Args:
+            links: Dictionary mapping the keywords to the short URLs.
+            **meta: Metadata to store along with the snapshot.
+
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM links')
+            self._connection.executemany(_UPSERT, (_to_row(k, su) for k, su in links.items()))
+            self._set_meta(meta)
+
+    def upsert(self, links: Iterable[Tuple[str, ShortenedURL]], **meta: Optional[str]) -> None:
+        """
+        Inserts or updates the given short URLs.
+
+        Args:
+            links: Pairs of keyword and short URL.
+            **meta: Metadata to store along with the short URLs.
+
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(_UPSERT, (_to_row(k, su) for k, su in links))
+            self._set_meta(meta)
+
+    def delete(self, keyword: str) -> None:
+        """
+        Deletes the short URL with the given keyword.
+
+        Args:
+            keyword: The keyword.
+
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM links WHERE keyword = ?', (keyword,))
+
+    def set_meta(self, **meta: Optional[str]) -> None:
+        """
+        Stores metadata.
+
+        Args:
+            **meta: The metadata.
+
+        """
+        with self._lock, self._connection:
+            self._set_meta(meta)
+
+    def _set_meta(self, meta: Dict[str, Optional[str]]) -> None:
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO meta VALUES (?, ?)', list(meta.items())
+        )
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
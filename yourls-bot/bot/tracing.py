@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a lightweight tracer that records where the time of an update goes."""
+import html
+import random
+import time
+from collections import deque
+from threading import Lock, local
+from types import TracebackType
+from typing import Any, Deque, List, Optional, Type
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+_local = local()
+
+MAX_MESSAGE_LENGTH = 4000
+""":obj:`int`: Maximum length of the message sent by :meth:`traces_command`. Telegram allows for
+4096 characters."""
+
+
+class Span:  # pylint: disable=R0903
+    """
+    A timed section of the processing of an update.
+
+    Args:
+        name: Name of the section, e.g. ``yourls.shorturl``.
+
+    Attributes:
+        name: Name of the section.
+        start: Value of :meth:`time.perf_counter` when the span started.
+        duration: Duration in seconds. ``0`` while the span is running.
+        error: Name of the exception that ended the span, if any.
+        children: The spans started within this span.
+
+    """
+
+    __slots__ = ('name', 'start', 'duration', 'error', 'children')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self.children: List[Span] = []
+
+    def render(self, depth: int = 0) -> List[str]:
+        """
+        Args:
+            depth: Optional. Indentation level of this span.
+
+        Returns:
+            One line per span of the tree below and including this span.
+
+        """
+        error = f' ❌ {self.error}' if self.error else ''
+        lines = [f'{"  " * depth}{self.name} {self.duration * 1000:.1f} ms{error}']
+        for child in self.children:
+            lines.extend(child.render(depth + 1))
+        return lines
+
+
+class _NoopContext:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *args: Any) -> None:
+        return None
+
+
+_NOOP = _NoopContext()
+
+
+class _SpanContext:
+    # Single use, created right before entering, so the span starts in __init__
+    __slots__ = ('_span', '_stack')
+
+    def __init__(self, name: str, stack: List[Span]) -> None:
+        self._span = Span(name)
+        self._stack = stack
+
+    def __enter__(self) -> Span:
+        self._stack[-1].children.append(self._span)
+        self._stack.append(self._span)
+        return self._span
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._span.duration = time.perf_counter() - self._span.start
+        if exc_type is not None:
+            self._span.error = exc_type.__name__
+        self._stack.pop()
+
+
+class _TraceContext(_SpanContext):
+    __slots__ = ('_tracer',)
+
+    def __init__(self, name: str, owner: 'Tracer') -> None:
+        super().__init__(name, [])
+        self._tracer = owner
+
+    def __enter__(self) -> Span:
+        self._stack.append(self._span)
+        _local.stack = self._stack
+        return self._span
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        super().__exit__(exc_type, exc_value, traceback)
+        _local.stack = None
+        self._tracer.add(self._span)
+
+
+def span(name: str) -> Any:
+    """
+    Context manager that records a :class:`Span` as part of the trace of the current thread. If
+    the current thread is not tracing, this does nothing.
+
+    Example:
+        .. code:: python
+
+            with span('yourls.shorturl'):
+                ...
+
+    Args:
+        name: Name of the span.
+
+    """
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        return _NOOP
+    return _SpanContext(name, stack)
+
+
+class Tracer:
+    """
+    Samples traces and keeps the latest ones in a ring buffer.
+
+    Args:
+        sample_rate: Optional. Fraction of the updates to trace. Defaults to ``0``, i.e. tracing
+            is disabled.
+        capacity: Optional. Number of traces to keep. Defaults to ``100``.
+
+    Attributes:
+        sample_rate: Fraction of the updates to trace.
+
+    """
+
+    def __init__(self, sample_rate: float = 0, capacity: int = 100) -> None:
+        self.sample_rate = sample_rate
+        self._traces: Deque[Span] = deque(maxlen=capacity)
+        self._lock = Lock()
+
+    def configure(self, sample_rate: float, capacity: int) -> None:
+        """
+        Changes the settings. Recorded traces are kept, as far as they fit.
+
+        Args:
+            sample_rate: Fraction of the updates to trace.
+            capacity: Number of traces to keep.
+
+        """
+        with self._lock:
+            self.sample_rate = sample_rate
+            self._traces = deque(self._traces, maxlen=capacity)
+
+    def trace(self, name: str) -> Any:
+        """
+        Context manager that traces the current thread with the probability :attr:`sample_rate`.
+        Spans started by the current thread within the context via :meth:`span` are recorded as
+        children of the root span. Does nothing if the trace is not sampled or the thread is
+        already tracing.
+
+        Args:
+            name: Name of the root span.
+
+        """
+        if not self.sample_rate or getattr(_local, 'stack', None):
+            return _NOOP
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return _NOOP
+        return _TraceContext(name, self)
+
+    def add(self, root: Span) -> None:
+        """
+        Stores a finished trace.
+
+        Args:
+            root: The root span of the trace.
+
+        """
+        with self._lock:
+            self._traces.append(root)
+
+    def slowest(self, count: int) -> List[Span]:
+        """
+        Args:
+            count: The number of traces.
+
+        Returns:
+            The root spans of the ``count`` slowest stored traces, slowest first.
+
+        """
+        with self._lock:
+            traces = list(self._traces)
+        return sorted(traces, key=lambda root: root.duration, reverse=True)[:count]
+
+
+tracer = Tracer()
+""":class:`Tracer`: The tracer used by the bot. Configured by
+:meth:`bot.setup.setup_dispatcher`."""
+
+
+def describe_update(update: Update) -> str:
+    """
+    Args:
+        update: The update.
+
+    Returns:
+        The kind of the update and its ID, e.g. ``inline_query 1234``.
+
+    """
+    for kind in (
+        'message',
+        'edited_message',
+        'inline_query',
+        'chosen_inline_result',
+        'callback_query',
+    ):
+        if getattr(update, kind) is not None:
+            return f'{kind} {update.update_id}'
+    return f'update {update.update_id}'
+
+
+def traces_command(update: Update, context: CallbackContext) -> None:
+    """
+    Shows the slowest recorded traces. The number of traces can be passed as argument and
+    defaults to 3.
+
+    Args:
+        update: The incoming Telegram update containing a message.
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+    """
+    count = int(context.args[0]) if context.args and context.args[0].isdigit() else 3
+    traces = tracer.slowest(count)
+    if not traces:
+        text = (
+            'No traces were recorded yet.'
+            if tracer.sample_rate
+            else 'Tracing is disabled. Set <code>trace_sample_rate</code> to enable it.'
+        )
+        update.effective_message.reply_text(text)
+        return
+
+    parts: List[str] = []
+    budget = MAX_MESSAGE_LENGTH
+    for root in traces:
+        lines = root.render()
+        part = f'<pre>{html.escape(chr(10).join(lines))}</pre>'
+        # Drop the deepest details of a trace that doesn't fit on its own
+        while len(part) > budget and len(lines) > 1 and not parts:
+            lines.pop()
+            part = f'<pre>{html.escape(chr(10).join(lines))}\n…</pre>'
+        if len(part) > budget:
+            break
+        parts.append(part)
+        budget -= len(part) + 2
+    update.effective_message.reply_text('\n\n'.join(parts))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This module contains a recorder that logs the incoming updates for replaying them later."""
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from queue import Full, Queue
+from threading import Thread
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from telegram import Update
+
+from bot.constants import (
+    DONT_DELETE_CIR,
+    EMPTY_SWITCH_PM_PARAMETER,
+    UNAVAILABLE_SWITCH_PM_PARAMETER,
+)
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 10000
+""":obj:`int`: Maximum number of updates waiting to be written. Further updates are dropped."""
+KEPT_WORDS = frozenset(
+    {
+        'http',
+        'https',
+        'www',
+        DONT_DELETE_CIR,
+        EMPTY_SWITCH_PM_PARAMETER,
+        UNAVAILABLE_SWITCH_PM_PARAMETER,
+    }
+)
+""":obj:`frozenset`: Words that are not anonymized, such that links stay links and parameters set
+by the bot itself still work."""
+
+_WORD = re.compile(r'\w+')
+_COMMAND = re.compile(r'^/\w+(?:@\w+)?')
+_TEXT_KEYS = frozenset(
+    {
+        'text',
+        'caption',
+        'query',
+        'url',
+        'result_id',
+        'inline_message_id',
+        'first_name',
+        'last_name',
+        'username',
+        'title',
+        'description',
+        'file_name',
+        'phone_number',
+        'vcard',
+        'address',
+    }
+)
+_ID_KEYS = frozenset({'user_id', 'chat_id', 'migrate_to_chat_id', 'migrate_from_chat_id'})
+_PERSON_KEYS = frozenset(
+    {
+        'from',
+        'chat',
+        'user',
+        'sender_chat',
+        'forward_from',
+        'forward_from_chat',
+        'new_chat_members',
+        'left_chat_member',
+    }
+)
+
+
+class Anonymizer:
+    """
+    Replaces the personal data in updates by pseudonyms. IDs of users and chats are replaced by
+    other IDs and each word of texts and names by another word of the same length, which
+    consists of the same kind of characters. As the pseudonyms are derived from a random key,
+    they can't be traced back, but the same ID or word is always replaced by the same pseudonym.
+    Hence, conversations, repeated links and keywords stay intact. Commands, the scheme of links
+    and the IDs of bots are kept. Texts keep their length in UTF-16 code units, such that the
+    offsets of the entities stay valid.
+
+    Args:
+        key: Optional. The key the pseudonyms are derived from. Defaults to a random key.
+
+    """
+
+    def __init__(self, key: bytes = None) -> None:
+        self._key = key or os.urandom(32)
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self._key, value.encode('utf-8'), hashlib.sha256).digest()
+
+    def chat_id(self, chat_id: int) -> int:
+        """
+        Args:
+            chat_id: ID of a user or a chat.
+
+        Returns:
+            The pseudonym. The private chat with a user gets the same pseudonym as the user.
+
+        """
+        digest = self._digest(str(abs(chat_id)))
+        pseudonym = int.from_bytes(digest[:8], 'big') % (2 ** 31 - 1) + 1
+        return pseudonym if chat_id > 0 else -pseudonym
+
+    def word(self, word: str) -> str:
+        """
+        Args:
+            word: A word, i.e. a sequence of letters, digits and underscores.
+
+        Returns:
+            The pseudonym. Digits are replaced by digits, uppercase letters by uppercase letters
+            and other characters by lowercase letters. Underscores and :attr:`KEPT_WORDS` are
+            kept.
+
+        """
+        if word.lower() in KEPT_WORDS:
+            return word
+
+        digest = b''
+        while len(digest) < 2 * len(word):
+            digest += self._digest(f'{word}#{len(digest)}')
+        characters = []
+        for char, byte in zip(word, digest):
+            if char == '_':
+                characters.append(char)
+            elif ord(char) > 0xFFFF:
+                # Takes two UTF-16 code units
+                characters.append(chr(ord('a') + byte % 26) * 2)
+            elif char.isdigit():
+                characters.append(chr(ord('0') + byte % 10))
+            elif char.isupper():
+                characters.append(chr(ord('A') + byte % 26))
+            else:
+                characters.append(chr(ord('a') + byte % 26))
+        return ''.join(characters)
+
+    def text(self, text: str) -> str:
+        """
+        Args:
+            text: A text.
+
+        Returns:
+            The text with each word replaced by its pseudonym. A leading command is kept.
+
+        """
+        command = _COMMAND.match(text)
+        prefix = command.group() if command else ''
+        return prefix + _WORD.sub(lambda match: self.word(match.group()), text[len(prefix):])
+
+    def anonymize(self, data: Any, key: str = '') -> Any:
+        """
+        Args:
+            data: An update as returned by :meth:`telegram.Update.to_dict` or a part of it.
+            key: Optional. The key ``data`` is stored under in its parent.
+
+        Returns:
+            A copy of ``data`` with the personal data replaced by pseudonyms.
+
+        """
+        if isinstance(data, dict):
+            result = {child: self.anonymize(value, child) for child, value in data.items()}
+            if key in _PERSON_KEYS and isinstance(data.get('id'), int) and not data.get('is_bot'):
+                result['id'] = self.chat_id(data['id'])
+            return result
+        if isinstance(data, list):
+            return [self.anonymize(item, key) for item in data]
+        if isinstance(data, str) and key in _TEXT_KEYS:
+            return self.text(data)
+        if isinstance(data, int) and not isinstance(data, bool) and key in _ID_KEYS:
+            return self.chat_id(data)
+        return data
+
+
+class UpdateRecorder:
+    """
+    Appends incoming updates to a gzip compressed log with one JSON object per line. Each object
+    holds the time the update arrived as ``time`` and the update anonymized by an
+    :class:`Anonymizer` as ``update``. Converting and writing the updates happens in a
+    background thread, such that recording doesn't delay the processing of updates. If the
+    background thread falls behind by more than :attr:`QUEUE_SIZE` updates, further updates are
+    dropped.
+
+    The log can be read by :meth:`read_log`. It stays readable while the bot is running, as the
+    file is flushed whenever all waiting updates are written.
+
+    Args:
+        path: Path of the log. If it exists, the updates are appended.
+
+    Attributes:
+        path: Path of the log.
+        dropped: Number of updates that were dropped.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.dropped = 0
+        self._anonymizer = Anonymizer()
+        self._queue: 'Queue[Optional[Tuple[float, Update]]]' = Queue(maxsize=QUEUE_SIZE)
+        self._thread = Thread(target=self._write, name='update_recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, update: Update) -> None:
+        """
+        Schedules an update for being written to the log. Should be called only by the
+        dispatcher thread.
+
+        Args:
+            update: The update.
+
+        """
+        try:
+            self._queue.put_nowait((time.time(), update))
+        except Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(
+                    'The update recorder fell behind. %d updates dropped.', self.dropped
+                )
+
+    def close(self) -> None:
+        """Writes the waiting updates and closes the log."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write(self) -> None:
+        with gzip.open(self.path, 'at', encoding='utf-8') as file:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                timestamp, update = item
+                try:
+                    data = self._anonymizer.anonymize(update.to_dict())
+                    file.write(
+                        json.dumps({'time': timestamp, 'update': data}, ensure_ascii=False) + '\n'
+                    )
+                except Exception:  # pylint: disable=W0703
+                    logger.exception('Could not record update %d.', update.update_id)
+                if self._queue.empty():
+                    file.flush()
+
+
+def read_log(path: str) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """
+    Reads a log written by :class:`UpdateRecorder`. A log that is still being written can be read
+    as well. A truncated last line is skipped.
+
+    Args:
+        path: Path of the log.
+
+    Yields:
+        The time the update arrived and the update as JSON serializable dictionary.
+
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        try:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return
+                yield record['time'], record['update']
+        except EOFError:
+            return
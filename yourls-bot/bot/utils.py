@@ -2,26 +2,64 @@
 # -*- coding: utf-8 -*-
 """The module contains utility functionality used by the bot."""
 
-import time
+import hashlib
 import re
-from typing import List, Optional
-
-from telegram import MessageEntity, InlineKeyboardButton, Update, InlineKeyboardMarkup
-from telegram.ext import Filters, ConversationHandler, UpdateFilter, CallbackContext
+import time
+from contextlib import nullcontext
+from threading import Lock
+from typing import Any, ContextManager, Dict, List, Optional, TYPE_CHECKING
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from telegram import InlineKeyboardButton, Update, InlineKeyboardMarkup
+from telegram.ext import ConversationHandler, UpdateFilter, CallbackContext
 from yourls import YOURLSClientBase, YOURLSAPIMixin, ShortenedURL
+from yourls.data import _validate_yourls_response
+from yourls.exceptions import YOURLSAPIError
 from yourls.extensions import YOURLSDeleteMixin, YOURLSEditUrlMixin
 
-from bot.constants import YOURLS_KEY, CACHE_TIMEOUT_KEY, STATS_KEY, DELETE_KEYBOARD_KEY
+from bot.constants import DELETE_KEYBOARD_KEY
+from bot.message_router import is_link_with_keyword
+from bot.services import get_services
+from bot.tracing import span
+from bot.metrics import STATS_CACHE_LOOKUPS, YOURLS_REQUEST_DURATION, YOURLS_REQUEST_ERRORS
 
-TIME_STAMP = '42'
+if TYPE_CHECKING:
+    from bot.circuit_breaker import CircuitBreaker
+    from bot.stats_cache import StatsCache
 
 
-def get_cached_stats(context: CallbackContext) -> List[ShortenedURL]:
+def get_stats_cache(context: CallbackContext) -> 'StatsCache':
+    """
+    Gives the :attr:`bot.services.Services.stats_cache` after refreshing it, if it's stale. If the
+    cache is refreshed in the background or another thread is already refreshing it, the current
+    snapshot is returned right away. The lookup is counted in
+    :attr:`bot.metrics.STATS_CACHE_LOOKUPS` as ``miss`` only if the cache was refreshed and as
+    ``stale``, if a stale snapshot was returned.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+
+    Returns:
+        The statistics cache.
+
     """
-    Calls :meth:`yourls.core.stats` in a cached manner and saves the list of short URLS to
-    ``context.bot_data[STATS_KEY]``.
+    services = get_services(context)
+    stats_cache = services.stats_cache
+    if not stats_cache.is_stale():
+        result = 'hit'
+    elif not stats_cache.background_refresh and stats_cache.refresh_if_stale(services.yourls):
+        result = 'miss'
+    else:
+        result = 'stale'
+    STATS_CACHE_LOOKUPS.labels(result=result).inc()
+    return stats_cache
 
-    .. seealso:: :attr:`bot.constants.CACHE_TIMEOUT_KEY` and :attr:`bot.constants.STATS_KEY`
+
+def get_cached_stats(context: CallbackContext) -> List[ShortenedURL]:
+    """
+    Calls :meth:`yourls.core.stats` in a cached manner. See :meth:`get_stats_cache`.
 
     Args:
         context: The context as provided by the :class:`telegram.ext.Dispatcher`.
@@ -29,15 +67,7 @@ def get_cached_stats(context: CallbackContext) -> List[ShortenedURL]:
     Returns: The list of short URLS, either from memory or fetched from the YOURLS instance.
 
     """
-    cache_timeout = context.bot_data[CACHE_TIMEOUT_KEY]
-    now = time.time()
-    time_stamp = context.bot_data.get(TIME_STAMP, now - cache_timeout - 1)
-    if now - time_stamp > cache_timeout:
-        context.bot_data[TIME_STAMP] = now
-        yourls = context.bot_data[YOURLS_KEY]
-        shortened_urls_list = yourls.stats('last', int(10e42))[0]
-        context.bot_data[STATS_KEY] = shortened_urls_list
-    return context.bot_data[STATS_KEY]
+    return get_stats_cache(context).short_urls
 
 
 def check_keyword_existence(context: CallbackContext, keyword: str) -> Optional[ShortenedURL]:
@@ -45,7 +75,8 @@ def check_keyword_existence(context: CallbackContext, keyword: str) -> Optional[
     Checks if a given keyword already exists in the YOURLS instance.
 
     Note:
-        The result is based on :meth:`get_cached_stats`.
+        The result is based on :meth:`get_stats_cache`. Because the cache is indexed by keyword,
+        this is a constant time lookup.
 
     Args:
         context: The context as provided by the :class:`telegram.ext.Dispatcher`.
@@ -56,8 +87,31 @@ def check_keyword_existence(context: CallbackContext, keyword: str) -> Optional[
         instance if the keyword exists, :obj:`None` otherwise.
 
     """
-    short_urls = get_cached_stats(context)
-    return next((su for su in short_urls if su.keyword == keyword), None)
+    return get_stats_cache(context).get(keyword)
+
+
+def keyword_exists(context: CallbackContext, keyword: str) -> bool:
+    """
+    Checks if a given keyword exists in the YOURLS instance. Other than
+    :meth:`check_keyword_existence`, this asks the YOURLS instance, if the keyword is not in the
+    cache, so keywords that were created since the last refresh of the cache are found as well.
+
+    Args:
+        context: The context as provided by the :class:`telegram.ext.Dispatcher`.
+        keyword: The keyword to check.
+
+    Returns:
+        Whether the keyword exists.
+
+    """
+    if check_keyword_existence(context, keyword):
+        return True
+
+    try:
+        get_services(context).yourls.expand(keyword)
+        return True
+    except YOURLSAPIError:
+        return False
 
 
 def extract_keyword(short_url: str) -> str:
@@ -148,6 +202,32 @@ def sanitize_protocol(url: str) -> str:
     return f'http://{url}'
 
 
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL for comparing long URLs. More precisely, the protocol prefix is sanitized via
+    :meth:`sanitize_protocol`, the scheme and host are lowercased and the trailing slash of an
+    empty path is removed.
+
+    Examples:
+        .. code:: python
+
+            assert normalize_url('Example.COM/') == 'http://example.com'
+            assert normalize_url('https://example.com/Foo/') == 'https://example.com/Foo/'
+
+    Args:
+        url: The URL to normalize.
+
+    Returns:
+        The normalized URL.
+
+    """
+    parts = urlsplit(sanitize_protocol(url.strip()))
+    path = '' if parts.path == '/' else parts.path
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, parts.query, parts.fragment)
+    )
+
+
 def cancel_keyboard(callback_data: str) -> InlineKeyboardMarkup:
     """
     Creates a new :class:`telegram.ext.InlineKeyboardMarkup` with a single button with the text
@@ -165,13 +245,187 @@ def cancel_keyboard(callback_data: str) -> InlineKeyboardMarkup:
     )
 
 
+def build_params(
+    params: Dict[str, Any], signature: Optional[str], nonce_life: Optional[bool]
+) -> Dict[str, Any]:
+    """
+    Adds the output format and the signature to the parameters of a request to the YOURLS API.
+
+    Args:
+        params: The parameters of the request.
+        signature: The signature for the YOURLS API.
+        nonce_life: Whether to use a time limited signature.
+
+    Returns:
+        A new dictionary with the completed parameters.
+
+    """
+    params = dict(params, format='json')
+    if signature and nonce_life:
+        # Time limited signature, see https://yourls.org/#API
+        timestamp = str(int(time.time()))
+        params['timestamp'] = timestamp
+        params['signature'] = hashlib.md5(f'{timestamp}{signature}'.encode()).hexdigest()
+    elif signature:
+        params['signature'] = signature
+    return params
+
+
+class LatencyMixin:
+    """
+    Mixin for clients that record the time each request takes per API action and guard their
+    requests by an optional :class:`bot.circuit_breaker.CircuitBreaker`. Subclasses must set
+    ``_latency_lock`` to a :class:`threading.Lock` and ``_latencies`` to an empty dictionary.
+
+    Attributes:
+        circuit_breaker: Optional. The circuit breaker guarding the requests.
+
+    """
+
+    _latency_lock: Lock
+    _latencies: Dict[str, 'EndpointLatency']
+    circuit_breaker: Optional['CircuitBreaker'] = None
+
+    def _guard(self) -> ContextManager[None]:
+        if self.circuit_breaker is None:
+            return nullcontext()
+        return self.circuit_breaker.guard()
+
+    def _record_latency(self, action: str, duration: float, failed: bool) -> None:
+        YOURLS_REQUEST_DURATION.labels(action=action).observe(duration)
+        if failed:
+            YOURLS_REQUEST_ERRORS.labels(action=action).inc()
+        with self._latency_lock:
+            latency = self._latencies.setdefault(action, EndpointLatency())
+            latency.record(duration, failed)
+
+    def latencies(self) -> Dict[str, 'EndpointLatency']:
+        """
+        Gives the latencies recorded so far.
+
+        Returns:
+            A copy of the recorded latencies per API action, e.g. ``'shorturl'`` or ``'stats'``.
+
+        """
+        with self._latency_lock:
+            return {
+                action: EndpointLatency(**vars(latency))
+                for action, latency in self._latencies.items()
+            }
+
+
 class YOURLSClient(  # pylint: disable=R0903
+    LatencyMixin,
     YOURLSClientBase,
     YOURLSAPIMixin,
     YOURLSDeleteMixin,
     YOURLSEditUrlMixin,
 ):
-    """YOURLS client with API delete & edit support."""
+    """
+    YOURLS client with API delete & edit support. All requests share one pooled keep-alive
+    session and the time each request takes is recorded per API action.
+
+    Args:
+        *args: Passed to :class:`yourls.core.YOURLSClientBase`.
+        pool_size: Optional. Maximum number of connections kept alive. Should be at least the
+            number of threads making requests concurrently. Defaults to ``4``.
+        connect_timeout: Optional. Timeout in seconds for establishing a connection. Defaults to
+            ``5``.
+        read_timeout: Optional. Timeout in seconds for receiving a response. Defaults to ``30``.
+        circuit_breaker: Optional. Circuit breaker guarding the requests.
+        **kwargs: Passed to :class:`yourls.core.YOURLSClientBase`.
+
+    Attributes:
+        session: The session used for all requests.
+        timeout: Tuple of connect and read timeout.
+
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        pool_size: int = 4,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        circuit_breaker: 'CircuitBreaker' = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self._signature = kwargs.get('signature')
+        self._nonce_life = kwargs.get('nonce_life')
+        self.timeout = (connect_timeout, read_timeout)
+        self._pool_size = pool_size
+        self.circuit_breaker = circuit_breaker
+        self.session = self._create_session()
+        self._latency_lock = Lock()
+        self._latencies: Dict[str, EndpointLatency] = {}
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _api_request(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        params = build_params(params, self._signature, self._nonce_life)
+        action = params.get('action', 'unknown')
+        with span(f'yourls.{action}'), self._guard():
+            start = time.perf_counter()
+            failed = True
+            try:
+                response = self.session.get(self.apiurl, params=params, timeout=self.timeout)
+                json_data = _validate_yourls_response(response, params)
+                failed = False
+                return json_data
+            finally:
+                self._record_latency(action, time.perf_counter() - start, failed)
+
+
+class EndpointLatency:
+    """
+    Latency accounting for one action of the YOURLS API.
+
+    Args:
+        count: Optional. Number of requests. Defaults to ``0``.
+        errors: Optional. Number of failed requests. Defaults to ``0``.
+        total: Optional. Total time spent on the requests in seconds. Defaults to ``0``.
+        maximum: Optional. Duration of the slowest request in seconds. Defaults to ``0``.
+
+    Attributes:
+        count: Number of requests.
+        errors: Number of failed requests.
+        total: Total time spent on the requests in seconds.
+        maximum: Duration of the slowest request in seconds.
+
+    """
+
+    def __init__(
+        self, count: int = 0, errors: int = 0, total: float = 0, maximum: float = 0
+    ) -> None:
+        self.count = count
+        self.errors = errors
+        self.total = total
+        self.maximum = maximum
+
+    @property
+    def mean(self) -> float:
+        """Mean duration of the requests in seconds."""
+        return self.total / self.count if self.count else 0
+
+    def record(self, duration: float, failed: bool) -> None:
+        """
+        Records a request.
+
+        Args:
+            duration: Duration of the request in seconds.
+            failed: Whether the request failed.
+
+        """
+        self.count += 1
+        self.errors += failed
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
 
 
 class TwoWordFilter(UpdateFilter):  # pylint: disable=R0903
@@ -191,26 +445,4 @@ class TwoWordFilter(UpdateFilter):  # pylint: disable=R0903
             The result.
 
         """
-        if not Filters.regex(r'^\s*\S+\s+\S+\s*$')(update):
-            return False
-        if Filters.entity(MessageEntity.URL)(update) & ~Filters.entity(MessageEntity.TEXT_LINK)(
-            update
-        ):
-            return (
-                len([e for e in update.effective_message.entities if e.type == MessageEntity.URL])
-                == 1
-            )
-        if ~Filters.entity(MessageEntity.URL)(update) & Filters.entity(MessageEntity.TEXT_LINK)(
-            update
-        ):
-            return (
-                len(
-                    [
-                        e
-                        for e in update.effective_message.entities
-                        if e.type == MessageEntity.TEXT_LINK
-                    ]
-                )
-                == 1
-            )
-        return False
+        return is_link_with_keyword(update.effective_message)
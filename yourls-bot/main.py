@@ -3,10 +3,19 @@
 """The script that runs the bot."""
 import logging
 from configparser import ConfigParser
+from queue import Queue
+
 from telegram import ParseMode
-from telegram.ext import Updater, Defaults, PicklePersistence
+from telegram.ext import Updater, Defaults, JobQueue
+from telegram.utils.request import Request
 
+from bot.dispatcher import OrderedDispatcher
+from bot.message_queue import QueuedBot, MessageQueue
+from bot.metrics import start_metrics_server
+from bot.persistence import SQLitePersistence
+from bot.settings import Settings
 from bot.setup import setup_dispatcher
+from bot.update_recorder import UpdateRecorder
 
 # Enable logging
 logging.basicConfig(
@@ -18,30 +27,142 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def read_settings(config: ConfigParser) -> Settings:
+    """
+    Reads the settings from the ``yourls-bot`` section of ``bot.ini``.
+
+    Args:
+        config: The configuration read from ``bot.ini``.
+
+    Returns:
+        The settings.
+
+    """
+    section = config['yourls-bot']
+    return Settings(
+        token=section['token'],
+        client=section['client'],
+        signature=section['signature'],
+        cache_timeout=int(section['cache_timeout']),
+        admin=int(section['admins_chat_id']),
+        full_sync_interval=section.getint('full_sync_interval', fallback=3600),
+        background_refresh=section.getboolean('background_refresh', fallback=False),
+        stats_store_path=section.get('stats_store', fallback='yourls_stats.sqlite'),
+        flush_interval=section.getfloat('persistence_flush_interval', fallback=5),
+        connect_timeout=section.getfloat('connect_timeout', fallback=5),
+        read_timeout=section.getfloat('read_timeout', fallback=30),
+        shorten_concurrency=section.getint('shorten_concurrency', fallback=4),
+        deferred_inline=section.get('inline_mode', fallback='eager') == 'deferred',
+        janitor_max_age=section.getint('janitor_max_age', fallback=86400),
+        workers=section.getint('workers', fallback=4),
+        profile_cache_ttl=section.getint('profile_cache_ttl', fallback=3600),
+        update_queue_size=section.getint('update_queue_size', fallback=0),
+        mode=section.get('mode', fallback='polling'),
+        webhook_listen=section.get('webhook_listen', fallback='127.0.0.1'),
+        webhook_port=section.getint('webhook_port', fallback=8443),
+        webhook_secret=section.get('webhook_secret'),
+        webhook_url=section.get('webhook_url', fallback=''),
+        webhook_max_connections=section.getint('webhook_max_connections', fallback=40),
+        circuit_failure_rate=section.getfloat('circuit_failure_rate', fallback=0.5),
+        circuit_slow_call=section.getfloat('circuit_slow_call', fallback=10),
+        circuit_open_duration=section.getfloat('circuit_open_duration', fallback=30),
+        metrics_port=section.getint('metrics_port', fallback=0),
+        metrics_listen=section.get('metrics_listen', fallback='127.0.0.1'),
+        trace_sample_rate=section.getfloat('trace_sample_rate', fallback=0),
+        trace_buffer_size=section.getint('trace_buffer_size', fallback=100),
+        record_updates=section.get('record_updates', fallback=''),
+        bulk_import_rate=section.getfloat('bulk_import_rate', fallback=5),
+    )
+
+
 def main() -> None:
     """Start the bot."""
     # Read configuration values from bot.ini
     config = ConfigParser()
     config.read('bot.ini')
-    token = config['yourls-bot']['token']
-    signature = config['yourls-bot']['signature']
-    client = config['yourls-bot']['client']
-    cache_timeout = int(config['yourls-bot']['cache_timeout'])
-    admin = int(config['yourls-bot']['admins_chat_id'])
+    settings = read_settings(config)
 
     # Create the Updater and pass it your bot's token.
     defaults = Defaults(
         parse_mode=ParseMode.HTML, disable_notification=True, disable_web_page_preview=True
     )
-    persistence = PicklePersistence(filename='yourls_db', single_file=False)
-    updater = Updater(token, defaults=defaults, persistence=persistence)
+    # Messages are sent by the threads of the message queue. Other requests are made by the
+    # workers of the OrderedDispatcher and the ones for run_async, plus the dispatcher, the
+    # updater, the job queue and the main thread.
+    message_queue = MessageQueue()
+    bot = QueuedBot(
+        settings.token,
+        defaults=defaults,
+        request=Request(con_pool_size=message_queue.workers + 2 * settings.workers + 4),
+        message_queue=message_queue,
+    )
+    # Data stored by earlier versions in pickle files is migrated on first start
+    persistence = SQLitePersistence(
+        'yourls_db.sqlite', flush_interval=settings.flush_interval, migrate_from='yourls_db'
+    )
+    job_queue = JobQueue()
+    update_recorder = UpdateRecorder(settings.record_updates) if settings.record_updates else None
+    dispatcher = OrderedDispatcher(
+        bot,
+        Queue(maxsize=settings.update_queue_size),
+        workers=settings.workers,
+        job_queue=job_queue,
+        persistence=persistence,
+        update_recorder=update_recorder,
+        max_pending_updates=settings.update_queue_size,
+    )
+    job_queue.set_dispatcher(dispatcher)
+    updater = Updater(dispatcher=dispatcher, workers=None)
 
     # Register handlers
-    setup_dispatcher(updater.dispatcher, client, signature, cache_timeout, admin)
+    services = setup_dispatcher(updater.dispatcher, settings)
+
+    if settings.metrics_port:
+        start_metrics_server(settings.metrics_port, settings.metrics_listen)
 
     # Start the Bot
-    updater.start_polling()
+    if settings.mode == 'webhook':
+        start_webhook(updater, settings)
+    else:
+        updater.start_polling()
     updater.idle()
+    message_queue.stop()
+    services.async_yourls.close()
+    if update_recorder:
+        update_recorder.close()
+
+
+def start_webhook(updater: Updater, settings: Settings) -> None:
+    """
+    Starts the webhook server. SSL is expected to be terminated by a reverse proxy, which
+    forwards the requests to ``webhook_listen:webhook_port``. The secret is used as URL path,
+    such that only Telegram (and whoever knows the secret) can post updates. If
+    ``webhook_url`` is set, the webhook is registered with Telegram as ``webhook_url/secret``.
+    Otherwise, the webhook is not touched, which allows for posting updates to the server
+    manually for local testing.
+
+    Args:
+        updater: The updater.
+        settings: The settings read from ``bot.ini``.
+
+    Raises:
+        ValueError: If ``webhook_secret`` is not set.
+
+    """
+    secret = settings.webhook_secret
+    if not secret:
+        raise ValueError('webhook_secret must be set in webhook mode.')
+
+    updater.start_webhook(
+        listen=settings.webhook_listen, port=settings.webhook_port, url_path=secret
+    )
+    if settings.webhook_url:
+        updater.bot.set_webhook(
+            url=f'{settings.webhook_url.rstrip("/")}/{secret}',
+            max_connections=settings.webhook_max_connections,
+        )
+        logger.info('Webhook set to %s.', settings.webhook_url)
+    logger.info('Listening for updates on %s:%d.', settings.webhook_listen, settings.webhook_port)
 
 
 if __name__ == '__main__':